@@ -6,13 +6,13 @@ import typer
 import pymupdf
 from rich import print
 from pathlib import Path
-from ..core.ingest import ingest_pdf_bytes, ingest_pdf_bytes_layout
-from ..core.retrieve import retrieve
-from ..core.store import paths, read_spans_jsonl
+from ..core.ingest import drain_ingest, iter_ingest
+from ..core.retrieve import locate_text, retrieve
+from ..core.store import paths, read_spans_jsonl, store_pdf_file
 from ..core.vectorize import vectorize_spans, retrieve_semantic, retrieve_hybrid
 from ..core.agent import run_agent
 from ..core.llm import AnthropicModel, OpenAIModel, OpenRouterModel, StreamEvent
-from ..core.tools import ToolRegistry, make_rag_retrieve_tool, make_web_search_tool, make_read_page_tool
+from ..core.tools import ToolRegistry, cache_policy, make_rag_retrieve_tool, make_web_search_tool, make_read_page_tool
 from ..core.prompts import SYSTEM_PROMPT
 from ..settings import (
     LLM_PROVIDER, LLM_MODEL, LLM_API_KEY, TAVILY_API_KEY,
@@ -43,22 +43,142 @@ def ingest(
     extract_words: bool = typer.Option(True, "--extract-words/--no-extract-words", help="Extract word-level bboxes (layout only)"),
     write_images: bool = typer.Option(True, "--write-images/--no-write-images", help="Materialize images (layout only)"),
     dpi: int = typer.Option(200, "--dpi", help="Image DPI (layout only)"),
+    workers: int = typer.Option(None, "--workers", "-w", help="Page extraction processes (1 = serial, 0 = one per CPU)"),
+    parent: str = typer.Option(None, "--parent", help="doc_id of a previous version whose unchanged pages are reused"),
 ):
     # Enable info logging so layout engine counts are visible
     logging.basicConfig(level=logging.INFO, format="%(message)s")
-    if engine == Engine.layout:
-        meta = ingest_pdf_bytes_layout(
-            pdf.read_bytes(),
-            extract_words=extract_words,
-            write_images=write_images,
-            dpi=dpi,
-            source_filename=pdf.name,
-        )
-    else:
-        meta = ingest_pdf_bytes(pdf.read_bytes(), source_filename=pdf.name)
+    meta = drain_ingest(iter_ingest(
+        store_pdf_file(pdf),
+        engine=engine.value,
+        extract_words=extract_words,
+        write_images=write_images,
+        dpi=dpi,
+        source_filename=pdf.name,
+        workers=workers,
+        parent=parent,
+        defer_enrichment=False,  # a background job would die with the command
+    ))
+    print(meta)
+
+
+@app.command()
+def upgrade(
+    doc_id: str,
+    extract_words: bool = typer.Option(True, "--extract-words/--no-extract-words", help="Extract word-level bboxes"),
+    write_images: bool = typer.Option(True, "--write-images/--no-write-images", help="Materialize images"),
+    dpi: int = typer.Option(200, "--dpi", help="Image DPI"),
+    workers: int = typer.Option(None, "--workers", "-w", help="Page extraction processes (1 = serial, 0 = one per CPU)"),
+):
+    """Re-ingest a blocks-tier document with the layout engine and swap the result in."""
+    from ..core.tiered import upgrade_to_layout
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    meta = upgrade_to_layout(doc_id, extract_words=extract_words, write_images=write_images, dpi=dpi, workers=workers)
+    print(meta)
+
+
+@app.command()
+def enrich(
+    doc_id: str,
+    workers: int = typer.Option(None, "--workers", "-w", help="Enrichment processes (1 = serial, 0 = one per CPU)"),
+):
+    """Run (or resume) enrichment of a document ingested with deferred enrichment."""
+    from ..core.deferred import enrich_document
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    meta = enrich_document(doc_id, workers=workers)
     print(meta)
 
 
+@app.command("ingest-dir")
+def ingest_dir_cmd(
+    directory: Path,
+    engine: Engine = typer.Option(Engine.layout, "--engine", help="Ingestion engine"),
+    workers: int = typer.Option(0, "--workers", "-w", help="Documents ingested in parallel (0 = one per CPU)"),
+    vectorize: bool = typer.Option(False, "--vectorize/--no-vectorize", help="Also embed each document"),
+    recursive: bool = typer.Option(True, "--recursive/--no-recursive", help="Include subdirectories"),
+    extract_words: bool = typer.Option(True, "--extract-words/--no-extract-words", help="Extract word-level bboxes (layout only)"),
+    write_images: bool = typer.Option(True, "--write-images/--no-write-images", help="Materialize images (layout only)"),
+    manifest: Path = typer.Option(None, "--manifest", help="Resume manifest (default: DATA_DIR/ingest_manifest.jsonl)"),
+):
+    """Ingest every PDF in a directory, resuming from the manifest of earlier runs."""
+    from ..core.bulk import ingest_dir
+
+    def on_result(rec: dict) -> None:
+        name = Path(rec["path"]).name
+        if rec["status"] == "error":
+            print(f"[red]✗[/red] {name}: {rec['error']}")
+        elif rec["status"] == "skipped":
+            print(f"[dim]- {name} (already ingested)[/dim]")
+        else:
+            print(f"[green]✓[/green] {name}: {rec['n_pages']} pages, {rec['n_spans']} spans in {rec['seconds']:.1f}s")
+
+    summary = ingest_dir(
+        directory,
+        engine=engine.value,
+        workers=workers,
+        vectorize=vectorize,
+        extract_words=extract_words,
+        write_images=write_images,
+        recursive=recursive,
+        manifest=manifest,
+        on_result=on_result,
+    )
+    print(
+        f"\n[bold]{summary['n_ok']} ingested, {summary['n_skipped']} already present, "
+        f"{summary['n_resumed']} resumed from manifest, {summary['n_failed']} failed[/bold]"
+    )
+    print(f"{summary['n_pages']} pages in {summary['seconds']:.1f}s ({summary['pages_per_sec']:.2f} pages/sec)")
+    for failure in summary["failures"]:
+        print(f"[red]  {failure['path']}: {failure['error']}[/red]")
+    if summary["n_failed"]:
+        raise typer.Exit(code=1)
+
+
+@app.command("ingest-stats")
+def ingest_stats(
+    engine: Engine = typer.Option(None, "--engine", help="Only documents ingested with this engine"),
+    as_json: bool = typer.Option(False, "--json", help="Print the aggregate as JSON"),
+):
+    """Per-stage ingestion time and memory, summed over the library."""
+    import orjson
+    from rich.table import Table
+    from ..core.timing import aggregate_timings
+    from ..settings import DATA_DIR
+
+    engine_names = {Engine.blocks: "pymupdf", Engine.layout: "pymupdf4llm"}
+    metas = (orjson.loads(f.read_bytes()) for f in sorted(DATA_DIR.glob("*.doc.json")))
+    if engine is not None:
+        metas = (m for m in metas if m.get("ingest", {}).get("engine") == engine_names[engine])
+    stats = aggregate_timings(metas)
+    if as_json:
+        print(json.dumps(stats, indent=2))
+        return
+    if not stats["n_docs"]:
+        print("[dim]No documents with recorded timings (re-ingest to record them).[/dim]")
+        return
+
+    table = Table(title=f"Ingestion stages — {stats['n_docs']} documents, {stats['n_pages']} pages")
+    table.add_column("stage", style="bold")
+    table.add_column("docs", justify="right")
+    table.add_column("wall s", justify="right")
+    table.add_column("cpu s", justify="right")
+    table.add_column("ms/page", justify="right")
+    table.add_column("share", justify="right")
+    table.add_column("max RSS growth MB", justify="right")
+    stages = sorted(stats["stages"].items(), key=lambda kv: (kv[0] == "total", -kv[1]["wall_s"]))
+    for name, st in stages:
+        table.add_row(
+            name,
+            str(st["docs"]),
+            f"{st['wall_s']:.2f}",
+            f"{st['cpu_s']:.2f}",
+            f"{st['ms_per_page']:.1f}",
+            f"{100 * st['share']:.1f}%",
+            f"{st['max_rss_peak_kb'] / 1024:.1f}",
+        )
+    print(table)
+
+
 @app.command("ls")
 def list_docs(
     full: bool = typer.Option(False, "--full", "-f", help="Show full doc_id hash"),
@@ -138,6 +258,20 @@ def retrieve_evidence(doc_id: str, page: int, text: str):
     print([e.__dict__ for e in ev])
 
 
+@app.command()
+def locate(
+    doc_id: str,
+    text: str,
+    top_k: int = typer.Option(None, "--top-k", "-k", help="Max results"),
+):
+    """Find where a passage occurs in the document, without a page number."""
+    kwargs = {}
+    if top_k is not None:
+        kwargs["top_k"] = top_k
+    ev = locate_text(doc_id=doc_id, text=text, **kwargs)
+    print([e.__dict__ for e in ev])
+
+
 @app.command()
 def debug_page(
         doc_id: str,
@@ -268,8 +402,9 @@ def retrieve_semantic_cmd(
     query: str,
     page: int = typer.Option(None, "--page", "-p", help="Filter to specific page"),
     top_k: int = typer.Option(None, "--top-k", "-k", help="Max results"),
+    neighbors: int = typer.Option(0, "--neighbors", "-n", help="Reading-order neighbors to include around each hit"),
 ):
-    kwargs = {}
+    kwargs = {"neighbor_window": neighbors}
     if page is not None:
         kwargs["page"] = page
     if top_k is not None:
@@ -283,8 +418,9 @@ def retrieve_hybrid_cmd(
     query: str,
     page: int = typer.Option(None, "--page", "-p", help="Filter to specific page"),
     top_k: int = typer.Option(None, "--top-k", "-k", help="Max results"),
+    neighbors: int = typer.Option(0, "--neighbors", "-n", help="Reading-order neighbors to include around each hit"),
 ):
-    kwargs = {}
+    kwargs = {"neighbor_window": neighbors}
     if page is not None:
         kwargs["page"] = page
     if top_k is not None:
@@ -360,10 +496,10 @@ def chat(
     # Build tools
     registry = ToolRegistry()
     rag_def, rag_fn = make_rag_retrieve_tool(doc_id)
-    registry.register(rag_def.name, rag_def.description, rag_def.parameters, rag_fn)
+    registry.register(rag_def.name, rag_def.description, rag_def.parameters, rag_fn, cache_policy(rag_def.name, doc_id))
 
     rp_def, rp_fn = make_read_page_tool(doc_id)
-    registry.register(rp_def.name, rp_def.description, rp_def.parameters, rp_fn)
+    registry.register(rp_def.name, rp_def.description, rp_def.parameters, rp_fn, cache_policy(rp_def.name, doc_id))
 
     tavily_key = TAVILY_API_KEY or os.getenv("TAVILY_API_KEY", "")
     if tavily_key:
@@ -382,6 +518,9 @@ def chat(
             console.print(" [dim]done[/dim]")
             if verbose and event.tool_call:
                 console.print(f"    [dim cyan]args: {json.dumps(event.tool_call.arguments)}[/dim cyan]")
+        elif event.kind == "agent_done" and verbose and event.stats and event.stats.get("tool_cache"):
+            counts = ", ".join(f"{name} {c['hits']} hit/{c['misses']} miss" for name, c in event.stats["tool_cache"].items())
+            console.print(f"\n[dim cyan]  tool cache: {counts}[/dim cyan]", end="")
 
     # Debug callback for tool results
     def on_tool_result(tool_name: str, arguments: dict, result_str: str) -> None:
@@ -3,21 +3,19 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-import queue
-import threading
-from collections.abc import Iterable
+from collections.abc import AsyncIterable, Iterable
 from enum import Enum
 from typing import List, Optional
 
 import orjson
 import uvicorn
-from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi import Depends, FastAPI, File, HTTPException, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, Response
-from fastapi.sse import EventSourceResponse, ServerSentEvent
+from fastapi.sse import EventSourceResponse, ServerSentEvent, format_sse_event
 from pydantic import BaseModel
 
-from ..core.agent import run_agent
+from ..core.agent import arun_agent
 from ..core.generated_types import (
     BboxSelection as BBoxSelection,
     ChatRequest,
@@ -25,12 +23,14 @@ from ..core.generated_types import (
     IngestResponse,
     VectorizeResponse,
 )
-from ..core.ingest import ingest_pdf_bytes, ingest_pdf_bytes_layout
+from ..core.ingest import drain_ingest, iter_ingest
 from ..core.llm import AnthropicModel, OpenAIModel, OpenRouterModel, StreamEvent
 from ..core.prompts import SYSTEM_PROMPT, format_query_with_selections
-from ..core.retrieve import resolve_selections, retrieve
-from ..core.store import paths, conv_path, read_conversations, create_conversation, update_conversation, delete_conversation, read_messages, append_message
-from ..core.tools import ToolRegistry, make_rag_retrieve_tool, make_read_page_tool, make_web_search_tool
+from ..core.retrieve import hit_test, locate_text, region_query, resolve_selections, retrieve, retrieve_many
+from ..core.deferred import wait_for_enrichment
+from ..core.tiered import iter_ingest_tiered, wait_for_upgrade
+from ..core.store import paths, store_pdf, conv_path, read_conversations, create_conversation, update_conversation, delete_conversation, read_messages, append_message
+from ..core.tools import ToolRegistry, cache_policy, make_rag_retrieve_tool, make_read_page_tool, make_web_search_tool
 from ..core.vectorize import retrieve_semantic, vectorize_spans
 from .. import settings as _settings
 
@@ -56,12 +56,29 @@ class Engine(str, Enum):
     layout = "layout"
 
 
+class HitLevel(str, Enum):
+    span = "span"
+    word = "word"
+
+
 class RetrieveRequest(BaseModel):
     doc_id: str
-    page: int
+    page: Optional[int] = None
     selected_text: str
 
 
+class RetrieveBatchRequest(BaseModel):
+    doc_id: str
+    page: Optional[int] = None
+    selected_texts: List[str]
+
+
+class LocateRequest(BaseModel):
+    doc_id: str
+    text: str
+    top_k: Optional[int] = None
+
+
 class VectorizeRequest(BaseModel):
     doc_id: str
 
@@ -71,6 +88,7 @@ class SemanticRetrieveRequest(BaseModel):
     query: str
     page: Optional[int] = None
     top_k: Optional[int] = None
+    neighbor_window: Optional[int] = None
 
 class ConversationUpdateRequest(BaseModel):
     title: Optional[str] = None
@@ -114,7 +132,7 @@ def _stream_event_to_sse(event: StreamEvent) -> ServerSentEvent | None:
     elif event.kind == "title_update":
         return ServerSentEvent(data={"conv_id": event.tool_call_id, "title": event.text}, event="title_update")
     elif event.kind == "agent_done":
-        return ServerSentEvent(data={}, event="agent_done")
+        return ServerSentEvent(data=event.stats or {}, event="agent_done")
     return None
 
 
@@ -131,6 +149,17 @@ def update_settings_endpoint(req: SettingsUpdate) -> dict:
     return {"ok": True}
 
 
+def _ingest_sse(events: Iterable[dict]) -> Iterable[bytes]:
+    """Encode ingest progress events as SSE: `page` per page, then `done` with the metadata."""
+    try:
+        for ev in events:
+            name = ev["event"]
+            data = ev["meta"] if name == "done" else {k: v for k, v in ev.items() if k != "event"}
+            yield format_sse_event(data_str=orjson.dumps(data).decode(), event=name)
+    except Exception as exc:
+        yield format_sse_event(data_str=json.dumps({"message": str(exc)}), event="error")
+
+
 @app.post("/ingest", response_model=IngestResponse)
 async def ingest_endpoint(
     file: UploadFile = File(...),
@@ -138,21 +167,40 @@ async def ingest_endpoint(
     extract_words: bool = Query(True),
     write_images: bool = Query(True),
     dpi: int = Query(200),
+    workers: Optional[int] = Query(None),
+    stream: bool = Query(False),
+    parent: Optional[str] = Query(None),
+    tiered: bool = Query(False),
+    defer_enrichment: Optional[bool] = Query(None),
 ):
-    pdf_bytes = await file.read()
-    source_filename = file.filename or None
-    if engine == Engine.layout:
-        meta = await asyncio.to_thread(
-            ingest_pdf_bytes_layout,
-            pdf_bytes,
+    # UploadFile spools large bodies to disk; copy it into the store in chunks
+    doc_id = await asyncio.to_thread(store_pdf, file.file)
+    if tiered:
+        # blocks spans now; the layout upgrade is announced on /documents/{doc_id}/events
+        events = iter_ingest_tiered(
+            doc_id,
             extract_words=extract_words,
             write_images=write_images,
             dpi=dpi,
-            source_filename=source_filename,
+            source_filename=file.filename or None,
+            workers=workers,
         )
     else:
-        meta = await asyncio.to_thread(ingest_pdf_bytes, pdf_bytes, source_filename=source_filename)
-    return meta
+        events = iter_ingest(
+            doc_id,
+            engine=engine.value,
+            extract_words=extract_words,
+            write_images=write_images,
+            dpi=dpi,
+            source_filename=file.filename or None,
+            workers=workers,
+            parent=parent,
+            defer_enrichment=defer_enrichment,
+        )
+    if stream:
+        # sync iterator: Starlette drives it from a worker thread
+        return EventSourceResponse(_ingest_sse(events))
+    return await asyncio.to_thread(drain_ingest, events)
 
 
 @app.post("/retrieve", response_model=List[EvidenceItem])
@@ -164,6 +212,27 @@ def retrieve_endpoint(req: RetrieveRequest):
     return [e.__dict__ for e in evidence]
 
 
+@app.post("/retrieve-batch", response_model=List[List[EvidenceItem]])
+def retrieve_batch_endpoint(req: RetrieveBatchRequest):
+    p = paths(req.doc_id)
+    if not p["spans"].exists():
+        raise HTTPException(status_code=404, detail=f"Document not found: {req.doc_id}")
+    batches = retrieve_many(doc_id=req.doc_id, page=req.page, selected_texts=req.selected_texts)
+    return [[e.__dict__ for e in evidence] for evidence in batches]
+
+
+@app.post("/locate", response_model=List[EvidenceItem])
+def locate_endpoint(req: LocateRequest):
+    p = paths(req.doc_id)
+    if not p["spans"].exists():
+        raise HTTPException(status_code=404, detail=f"Document not found: {req.doc_id}")
+    kwargs = {}
+    if req.top_k is not None:
+        kwargs["top_k"] = req.top_k
+    evidence = locate_text(doc_id=req.doc_id, text=req.text, **kwargs)
+    return [e.__dict__ for e in evidence]
+
+
 @app.post("/vectorize", response_model=VectorizeResponse)
 def vectorize_endpoint(req: VectorizeRequest):
     p = paths(req.doc_id)
@@ -180,6 +249,8 @@ def retrieve_semantic_endpoint(req: SemanticRetrieveRequest):
         kwargs["page"] = req.page
     if req.top_k is not None:
         kwargs["top_k"] = req.top_k
+    if req.neighbor_window is not None:
+        kwargs["neighbor_window"] = req.neighbor_window
     try:
         evidence = retrieve_semantic(doc_id=req.doc_id, query=req.query, **kwargs)
     except FileNotFoundError:
@@ -201,6 +272,45 @@ def get_document(doc_id: str):
     return orjson.loads(p["doc"].read_bytes())
 
 
+# how often /documents/{doc_id}/events checks on a running background job
+_JOB_POLL_S = 0.5
+
+
+def _require_doc(doc_id: str) -> None:
+    # a dependency, so a missing document is a 404 before the stream starts
+    if not paths(doc_id)["doc"].exists():
+        raise HTTPException(status_code=404, detail=f"Document not found: {doc_id}")
+
+
+async def _job_finished(wait, doc_id: str, key: str) -> dict:
+    """Poll `wait` (wait_for_upgrade / wait_for_enrichment) without a timeout
+    until doc.json's `key` job is no longer pending or running."""
+    while True:
+        meta = await asyncio.to_thread(wait, doc_id, 0)
+        if (meta.get(key) or {}).get("status") not in ("pending", "running"):
+            return meta
+        await asyncio.sleep(_JOB_POLL_S)
+
+
+@app.get("/documents/{doc_id}/events", response_class=EventSourceResponse, dependencies=[Depends(_require_doc)])
+async def document_events(doc_id: str) -> AsyncIterable[ServerSentEvent]:
+    """Send a `tier` event when the document's background upgrade finishes, then an
+    `enrichment` event when its deferred enrichment finishes (each at once if none is running).
+
+    The jobs are polled rather than waited on, so an open stream holds no thread.
+    """
+    meta = await _job_finished(wait_for_upgrade, doc_id, "upgrade")
+    yield ServerSentEvent(
+        data={"doc_id": doc_id, "tier": meta.get("tier"), "upgrade": meta.get("upgrade"), "n_spans": meta.get("n_spans")},
+        event="tier",
+    )
+    meta = await _job_finished(wait_for_enrichment, doc_id, "enrichment")
+    yield ServerSentEvent(
+        data={"doc_id": doc_id, "enrichment": meta.get("enrichment"), "n_spans": meta.get("n_spans")},
+        event="enrichment",
+    )
+
+
 @app.get("/documents/{doc_id}/pdf")
 async def get_document_pdf(doc_id: str):
     p = paths(doc_id)
@@ -209,6 +319,28 @@ async def get_document_pdf(doc_id: str):
     return FileResponse(p["pdf"], media_type="application/pdf")
 
 
+@app.get("/documents/{doc_id}/hit-test")
+def hit_test_endpoint(
+    doc_id: str,
+    page: int = Query(...),
+    x: float = Query(...),
+    y: float = Query(...),
+    level: HitLevel = Query(HitLevel.span),
+):
+    p = paths(doc_id)
+    if not p["spans"].exists():
+        raise HTTPException(status_code=404, detail=f"Document not found: {doc_id}")
+    return hit_test(doc_id, page, x, y, level=level.value)
+
+
+@app.post("/documents/{doc_id}/region")
+def region_endpoint(doc_id: str, sel: BBoxSelection, level: HitLevel = Query(HitLevel.span)):
+    p = paths(doc_id)
+    if not p["spans"].exists():
+        raise HTTPException(status_code=404, detail=f"Document not found: {doc_id}")
+    return region_query(doc_id, sel.page, tuple(sel.bbox_norm), level=level.value)
+
+
 @app.get("/documents/{doc_id}/conversations")
 def list_conversations(doc_id: str):
     p = paths(doc_id)
@@ -252,8 +384,8 @@ def delete_conversation_endpoint(doc_id: str, conv_id: str):
     return Response(status_code=204)
 
 
-@app.post("/chat", response_class=EventSourceResponse)
-def chat_endpoint(req: ChatRequest) -> Iterable[ServerSentEvent]:
+def _prepare_chat(req: ChatRequest) -> tuple[AnthropicModel | OpenAIModel, ToolRegistry, str]:
+    """Validate a chat request; returns its model, tools and selection-enriched query."""
     # Validate document exists
     p = paths(req.doc_id)
     if not p["spans"].exists():
@@ -293,11 +425,11 @@ def chat_endpoint(req: ChatRequest) -> Iterable[ServerSentEvent]:
     # Build tools
     registry = ToolRegistry()
     rag_def, rag_fn = make_rag_retrieve_tool(req.doc_id)
-    registry.register(rag_def.name, rag_def.description, rag_def.parameters, rag_fn)
+    registry.register(rag_def.name, rag_def.description, rag_def.parameters, rag_fn, cache_policy(rag_def.name, req.doc_id))
 
     if p["page_md"].exists():
         rp_def, rp_fn = make_read_page_tool(req.doc_id)
-        registry.register(rp_def.name, rp_def.description, rp_def.parameters, rp_fn)
+        registry.register(rp_def.name, rp_def.description, rp_def.parameters, rp_fn, cache_policy(rp_def.name, req.doc_id))
 
     tavily_key = _settings.TAVILY_API_KEY
     if tavily_key:
@@ -311,48 +443,35 @@ def chat_endpoint(req: ChatRequest) -> Iterable[ServerSentEvent]:
         resolved = resolve_selections(req.doc_id, sel_dicts)
         enriched_query = format_query_with_selections(req.message, resolved)
 
-    # Queue-bridged SSE generator: run_agent uses a callback, not a generator,
-    # so we bridge it via a queue consumed by a sync generator (Starlette runs
-    # sync generators in a threadpool automatically).
-    q: queue.Queue[StreamEvent | Exception | None] = queue.Queue()
-
-    def on_stream(event: StreamEvent) -> None:
-        q.put(event)
-
-    def agent_thread() -> None:
-        try:
-            run_agent(
-                model=llm,
-                doc_id=req.doc_id,
-                user_query=enriched_query,
-                tools=registry,
-                system_prompt=SYSTEM_PROMPT,
-                conv_id=req.conv_id,
-                max_iterations=_settings.AGENT_MAX_ITER,
-                on_stream=on_stream,
-            )
-        except Exception as exc:
-            q.put(exc)
-        finally:
-            q.put(None)  # sentinel
-
-    def sse_generator() -> Iterable[ServerSentEvent]:
-        thread = threading.Thread(target=agent_thread, daemon=True)
-        thread.start()
-        while True:
-            item = q.get()
-            if item is None:
-                break
-            if isinstance(item, Exception):
-                yield ServerSentEvent(
-                    data={"message": str(item)}, event="error"
-                )
-                break
-            sse = _stream_event_to_sse(item)
+    return llm, registry, enriched_query
+
+
+async def _chat_setup(req: ChatRequest) -> tuple[AnthropicModel | OpenAIModel, ToolRegistry, str]:
+    # a dependency, so a bad request fails before the stream starts; the file
+    # reads (spans, page markdown, selections) stay off the event loop
+    return await asyncio.to_thread(_prepare_chat, req)
+
+
+@app.post("/chat", response_class=EventSourceResponse)
+async def chat_endpoint(req: ChatRequest, setup: tuple = Depends(_chat_setup)) -> AsyncIterable[ServerSentEvent]:
+    # The agent streams straight from the async model client, so an open chat
+    # holds no thread; only tool calls run on the tool pool.
+    llm, registry, enriched_query = setup
+    try:
+        async for event in arun_agent(
+            model=llm,
+            doc_id=req.doc_id,
+            user_query=enriched_query,
+            tools=registry,
+            system_prompt=SYSTEM_PROMPT,
+            conv_id=req.conv_id,
+            max_iterations=_settings.AGENT_MAX_ITER,
+        ):
+            sse = _stream_event_to_sse(event)
             if sse is not None:
                 yield sse
-
-    return sse_generator()  # type: ignore[return-value]
+    except Exception as exc:
+        yield ServerSentEvent(data={"message": str(exc)}, event="error")
 
 
 # ---------------------------------------------------------------------------
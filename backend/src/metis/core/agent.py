@@ -1,15 +1,115 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from typing import Callable
+from typing import AsyncIterator, Callable, Iterator
 
-from .schema import Message, ToolResult
-from .llm import ChatModel, StreamEvent
+from .schema import Message, ToolCall, ToolResult
+from .llm import AsyncChatModel, ChatModel, StreamEvent
 from .tools import ToolRegistry
-from ..settings import CITATION_MIN_SCORE
+from ..settings import AGENT_TOOL_WORKERS, CITATION_MIN_SCORE
 from .store import read_messages, append_message, update_conversation
 
+_tool_pool: ThreadPoolExecutor | None = None
+_tool_pool_lock = threading.Lock()
+
+
+def _get_tool_pool() -> ThreadPoolExecutor:
+    """Process-wide pool for tool calls, shared by all running agents."""
+    global _tool_pool
+    with _tool_pool_lock:
+        if _tool_pool is None:
+            _tool_pool = ThreadPoolExecutor(max_workers=max(1, AGENT_TOOL_WORKERS), thread_name_prefix="metis-tool")
+        return _tool_pool
+
+
+def _call_tools(tools: ToolRegistry, tool_calls: list[ToolCall]) -> Iterator[tuple[int, str]]:
+    """Run an iteration's tool calls concurrently; yields (index, result) as each finishes."""
+    if len(tool_calls) == 1:
+        tc = tool_calls[0]
+        yield 0, tools.call(tc.name, tc.arguments)
+        return
+    pool = _get_tool_pool()
+    futures = {pool.submit(tools.call, tc.name, tc.arguments): j for j, tc in enumerate(tool_calls)}
+    for fut in as_completed(futures):
+        yield futures[fut], fut.result()
+
+
+async def _acall_tools(tools: ToolRegistry, tool_calls: list[ToolCall]) -> AsyncIterator[tuple[int, str]]:
+    """_call_tools for the async agent; the event loop never runs a tool itself.
+
+    A single call runs on asyncio's default executor, like the agent's file
+    I/O, so it does not queue behind other agents' calls in the tool pool.
+    """
+    if len(tool_calls) == 1:
+        tc = tool_calls[0]
+        yield 0, await asyncio.to_thread(tools.call, tc.name, tc.arguments)
+        return
+    loop = asyncio.get_running_loop()
+    pool = _get_tool_pool()
+
+    async def call(j: int, tc: ToolCall) -> tuple[int, str]:
+        return j, await loop.run_in_executor(pool, tools.call, tc.name, tc.arguments)
+
+    for fut in asyncio.as_completed([call(j, tc) for j, tc in enumerate(tool_calls)]):
+        yield await fut
+
+
+def _agent_done(tools: ToolRegistry, cache0: dict) -> StreamEvent:
+    """The final event, with the turn's tool cache hits/misses."""
+    return StreamEvent(kind="agent_done", stats={"tool_cache": tools.cache_counts(since=cache0)})
+
+
+def _load_history(doc_id: str, conv_id: str | None, user_query: str) -> list[Message]:
+    """Conversation history from disk; persists the new user message."""
+    history_messages: list[Message] = []
+    if conv_id:
+        for m in read_messages(doc_id, conv_id):
+            history_messages.append(Message(role=m["role"], content=m["content"]))
+        # Persist user message
+        now = datetime.now(timezone.utc).isoformat()
+        append_message(doc_id, conv_id, {"role": "user", "content": user_query, "timestamp": now})
+    return history_messages
+
+
+def _persist_answer(doc_id: str, conv_id: str, content: str, evidence: list[dict]) -> None:
+    """Persist an assistant message with its evidence."""
+    msg = {
+        "role": "assistant",
+        "content": content,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    if evidence:
+        msg["evidence"] = evidence
+    append_message(doc_id, conv_id, msg)
+
+
+def _citation_event(
+    tc: ToolCall, result_str: str, seen_span_ids: set[str], accumulated_evidence: list[dict],
+) -> StreamEvent | None:
+    """citation_data for a rag_retrieve result's spans not cited before in this turn."""
+    if tc.name != "rag_retrieve":
+        return None
+    try:
+        items = json.loads(result_str)
+        if not isinstance(items, list):
+            return None
+        filtered = [
+            item for item in items
+            if item.get("score", 0.0) >= CITATION_MIN_SCORE
+            and item.get("span_id") not in seen_span_ids
+        ]
+    except (json.JSONDecodeError, TypeError):
+        return None
+    seen_span_ids.update(item["span_id"] for item in filtered if "span_id" in item)
+    if not filtered:
+        return None
+    accumulated_evidence.extend(filtered)
+    return StreamEvent(kind="citation_data", evidence=filtered, tool_call_id=tc.id, tool_name=tc.name)
+
 
 def run_agent(
     model: ChatModel,
@@ -22,20 +122,12 @@ def run_agent(
     on_stream: Callable[[StreamEvent], None] | None = None,
     on_tool_result: Callable[[str, dict, str], None] | None = None,
 ) -> Message:
-    now = datetime.now(timezone.utc).isoformat()
-
-    # Load conversation history from disk
-    history_messages: list[Message] = []
-    if conv_id:
-        for m in read_messages(doc_id, conv_id):
-            history_messages.append(Message(role=m["role"], content=m["content"]))
-        # Persist user message
-        append_message(doc_id, conv_id, {"role": "user", "content": user_query, "timestamp": now})
-
+    history_messages = _load_history(doc_id, conv_id, user_query)
     messages: list[Message] = history_messages + [Message(role="user", content=user_query)]
     is_first_exchange = len(history_messages) == 0
     seen_span_ids: set[str] = set()
     accumulated_evidence: list[dict] = []
+    cache0 = tools.cache_counts()
 
     for _ in range(max_iterations):
         final_message: Message | None = None
@@ -53,69 +145,131 @@ def run_agent(
 
         # If no tool calls, we have our final answer
         if not final_message.tool_calls:
-            # Persist assistant message with evidence
             if conv_id and final_message.content:
-                msg = {
-                    "role": "assistant",
-                    "content": final_message.content,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                }
-                if accumulated_evidence:
-                    msg["evidence"] = accumulated_evidence
-                append_message(doc_id, conv_id, msg)
+                _persist_answer(doc_id, conv_id, final_message.content, accumulated_evidence)
 
             # Generate title for first exchange
             if conv_id and is_first_exchange and final_message.content:
                 _generate_title(model, doc_id, conv_id, user_query, final_message.content, on_stream)
 
             if on_stream is not None:
-                on_stream(StreamEvent(kind="agent_done"))
+                on_stream(_agent_done(tools, cache0))
             return final_message
 
-        # Execute tool calls and append results
-        tool_results = []
-        for tc in final_message.tool_calls:
-            result_str = tools.call(tc.name, tc.arguments)
+        # Execute tool calls concurrently; results are appended in call order
+        tool_calls = final_message.tool_calls
+        results: list[str] = [""] * len(tool_calls)
+        for j, result_str in _call_tools(tools, tool_calls):
+            tc = tool_calls[j]
+            results[j] = result_str
             if on_tool_result is not None:
                 on_tool_result(tc.name, tc.arguments, result_str)
             # Emit citation_data for rag_retrieve results
-            if tc.name == "rag_retrieve" and on_stream is not None:
-                try:
-                    items = json.loads(result_str)
-                    if isinstance(items, list):
-                        filtered = [
-                            item for item in items
-                            if item.get("score", 0.0) >= CITATION_MIN_SCORE
-                            and item.get("span_id") not in seen_span_ids
-                        ]
-                        seen_span_ids.update(item["span_id"] for item in filtered if "span_id" in item)
-                        if filtered:
-                            accumulated_evidence.extend(filtered)
-                            on_stream(StreamEvent(kind="citation_data", evidence=filtered, tool_call_id=tc.id, tool_name=tc.name))
-                except (json.JSONDecodeError, TypeError):
-                    pass
-            tool_results.append(ToolResult(tool_call_id=tc.id, content=result_str))
+            citation = _citation_event(tc, result_str, seen_span_ids, accumulated_evidence)
+            if citation is not None and on_stream is not None:
+                on_stream(citation)
 
+        tool_results = [ToolResult(tool_call_id=tc.id, content=r) for tc, r in zip(tool_calls, results)]
         messages.append(Message(role="tool", tool_results=tool_results))
 
     # Max iterations reached
     if conv_id and final_message and final_message.content:
-        msg = {
-            "role": "assistant",
-            "content": final_message.content,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-        }
-        if accumulated_evidence:
-            msg["evidence"] = accumulated_evidence
-        append_message(doc_id, conv_id, msg)
+        _persist_answer(doc_id, conv_id, final_message.content, accumulated_evidence)
         if is_first_exchange:
             _generate_title(model, doc_id, conv_id, user_query, final_message.content, on_stream)
 
     if on_stream is not None:
-        on_stream(StreamEvent(kind="agent_done"))
+        on_stream(_agent_done(tools, cache0))
     return final_message or Message(role="assistant", content="I was unable to complete the request within the iteration limit.")
 
 
+async def arun_agent(
+    model: AsyncChatModel,
+    doc_id: str,
+    user_query: str,
+    tools: ToolRegistry,
+    system_prompt: str,
+    conv_id: str | None = None,
+    max_iterations: int = 10,
+    on_tool_result: Callable[[str, dict, str], None] | None = None,
+) -> AsyncIterator[StreamEvent]:
+    """Async run_agent: yields the events run_agent passes to `on_stream`.
+
+    Model turns stream from `model.astream`, and tool calls and conversation
+    file I/O are awaited on threads, so a running agent holds no thread of
+    its own and never blocks the event loop. The answer is the last
+    "message_done" event's message; "agent_done" comes last.
+    """
+    history_messages = await asyncio.to_thread(_load_history, doc_id, conv_id, user_query)
+    messages: list[Message] = history_messages + [Message(role="user", content=user_query)]
+    is_first_exchange = len(history_messages) == 0
+    seen_span_ids: set[str] = set()
+    accumulated_evidence: list[dict] = []
+    cache0 = tools.cache_counts()
+
+    for _ in range(max_iterations):
+        final_message: Message | None = None
+
+        async for event in model.astream(messages, tools.tool_defs(), system_prompt):
+            yield event
+            if event.kind == "message_done":
+                final_message = event.message
+
+        if final_message is None:
+            break
+
+        messages.append(final_message)
+
+        if not final_message.tool_calls:
+            if conv_id and final_message.content:
+                await asyncio.to_thread(_persist_answer, doc_id, conv_id, final_message.content, accumulated_evidence)
+                if is_first_exchange:
+                    async for event in _agenerate_title(model, doc_id, conv_id, user_query, final_message.content):
+                        yield event
+            yield _agent_done(tools, cache0)
+            return
+
+        tool_calls = final_message.tool_calls
+        results: list[str] = [""] * len(tool_calls)
+        async for j, result_str in _acall_tools(tools, tool_calls):
+            tc = tool_calls[j]
+            results[j] = result_str
+            if on_tool_result is not None:
+                on_tool_result(tc.name, tc.arguments, result_str)
+            citation = _citation_event(tc, result_str, seen_span_ids, accumulated_evidence)
+            if citation is not None:
+                yield citation
+
+        tool_results = [ToolResult(tool_call_id=tc.id, content=r) for tc, r in zip(tool_calls, results)]
+        messages.append(Message(role="tool", tool_results=tool_results))
+
+    # Max iterations reached
+    if conv_id and final_message and final_message.content:
+        await asyncio.to_thread(_persist_answer, doc_id, conv_id, final_message.content, accumulated_evidence)
+        if is_first_exchange:
+            async for event in _agenerate_title(model, doc_id, conv_id, user_query, final_message.content):
+                yield event
+    yield _agent_done(tools, cache0)
+
+_TITLE_SYSTEM = "Generate a short title (3-8 words) for this conversation about a research paper. Return only the title, no quotes or punctuation."
+
+
+def _title_messages(user_query: str, assistant_text: str) -> list[Message]:
+    return [
+        Message(role="user", content=user_query),
+        Message(role="assistant", content=assistant_text[:500]),
+        Message(role="user", content="Generate a short title for the conversation above."),
+    ]
+
+
+def _save_title(doc_id: str, conv_id: str, title_text: str) -> StreamEvent | None:
+    title_text = title_text.strip().strip('"').strip("'")
+    if not title_text:
+        return None
+    update_conversation(doc_id, conv_id, title=title_text)
+    return StreamEvent(kind="title_update", text=title_text, tool_call_id=conv_id)
+
+
 def _generate_title(
     model: ChatModel,
     doc_id: str,
@@ -126,21 +280,33 @@ def _generate_title(
 ) -> None:
     """Generate a conversation title from the first exchange. Non-blocking — failure is silently ignored."""
     try:
-        title_system = "Generate a short title (3-8 words) for this conversation about a research paper. Return only the title, no quotes or punctuation."
-        title_messages = [
-            Message(role="user", content=user_query),
-            Message(role="assistant", content=assistant_text[:500]),
-            Message(role="user", content="Generate a short title for the conversation above."),
-        ]
         title_text = ""
-        for event in model.stream(title_messages, [], title_system):
+        for event in model.stream(_title_messages(user_query, assistant_text), [], _TITLE_SYSTEM):
             if event.kind == "text_delta" and event.text:
                 title_text += event.text
 
-        title_text = title_text.strip().strip('"').strip("'")
-        if title_text:
-            update_conversation(doc_id, conv_id, title=title_text)
-            if on_stream is not None:
-                on_stream(StreamEvent(kind="title_update", text=title_text, tool_call_id=conv_id))
+        event = _save_title(doc_id, conv_id, title_text)
+        if event is not None and on_stream is not None:
+            on_stream(event)
     except Exception:
         pass  # Title generation failure is not critical
+
+
+async def _agenerate_title(
+    model: AsyncChatModel,
+    doc_id: str,
+    conv_id: str,
+    user_query: str,
+    assistant_text: str,
+) -> AsyncIterator[StreamEvent]:
+    """_generate_title on the async model; yields the title_update event, if any."""
+    try:
+        title_text = ""
+        async for event in model.astream(_title_messages(user_query, assistant_text), [], _TITLE_SYSTEM):
+            if event.kind == "text_delta" and event.text:
+                title_text += event.text
+        event = await asyncio.to_thread(_save_title, doc_id, conv_id, title_text)
+    except Exception:
+        return  # Title generation failure is not critical
+    if event is not None:
+        yield event
@@ -0,0 +1,214 @@
+"""Bulk ingestion of a directory of PDFs.
+
+Documents are ingested in a process pool (one document per task, so each
+worker keeps its imports and embedding model warm across documents). Every
+finished document is appended to a JSONL manifest keyed by file path, size
+and mtime, so an interrupted run resumes where it stopped; documents whose
+doc_id is already fully ingested are skipped as well. Files with the same
+content share a doc_id: each worker hashes its own file and takes the
+document's ingest claim (store.ingest_claim), so a copy waits for the first
+file and is then skipped, and every file is read by one worker only.
+"""
+from __future__ import annotations
+import logging
+import time
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List
+
+import orjson
+
+from .ingest import drain_ingest, iter_ingest
+from .pool import process_pool, resolve_workers
+from .store import doc_id_from_file, ingest_claim, ingest_complete, paths, store_pdf_file
+from ..settings import DATA_DIR, EMBED_MODEL
+
+log = logging.getLogger(__name__)
+
+
+def default_manifest_path() -> Path:
+    return DATA_DIR / "ingest_manifest.jsonl"
+
+
+def find_pdfs(directory: Path, recursive: bool = True) -> List[Path]:
+    pattern = "**/*" if recursive else "*"
+    return sorted(f for f in directory.glob(pattern) if f.is_file() and f.suffix.lower() == ".pdf")
+
+
+def _file_key(path: Path) -> tuple:
+    st = path.stat()
+    return (str(path.resolve()), st.st_size, st.st_mtime_ns)
+
+
+def read_manifest(path: Path) -> Dict[tuple, dict]:
+    """Completed manifest records by (path, size, mtime_ns); later records win."""
+    done: Dict[tuple, dict] = {}
+    if not path.exists():
+        return done
+    for line in path.read_bytes().splitlines():
+        try:
+            rec = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue  # torn last line from an interrupted run
+        key = (rec["path"], rec["size"], rec["mtime_ns"])
+        if rec["status"] in ("ok", "skipped"):
+            done[key] = rec
+        else:
+            done.pop(key, None)
+    return done
+
+
+def _is_ingested(doc_id: str) -> bool:
+    return paths(doc_id)["spans"].exists() and ingest_complete(doc_id)
+
+
+def _init_worker(vectorize: bool) -> None:
+    if vectorize:
+        from .vectorize import _load_model
+        _load_model(EMBED_MODEL)
+
+
+def ingest_one(path: str, engine: str, vectorize: bool, extract_words: bool, write_images: bool) -> dict:
+    """Ingest (and optionally vectorize) one PDF; never raises, failures are returned."""
+    pdf = Path(path)
+    size, mtime_ns = _file_key(pdf)[1:]
+    rec = {"path": path, "size": size, "mtime_ns": mtime_ns}
+    t0 = time.perf_counter()
+    try:
+        doc_id = doc_id_from_file(pdf)
+        rec["doc_id"] = doc_id
+        # a copy of the same content in another worker waits here, then is skipped
+        with ingest_claim(doc_id) as waited:
+            rec["waited"] = waited
+            if _is_ingested(doc_id):
+                meta = orjson.loads(paths(doc_id)["doc"].read_bytes())
+                rec["status"] = "skipped"
+                rec["n_pages"] = 0  # no pages processed in this run
+            else:
+                meta = drain_ingest(iter_ingest(
+                    store_pdf_file(pdf),
+                    engine=engine,
+                    extract_words=extract_words,
+                    write_images=write_images,
+                    source_filename=pdf.name,
+                    workers=1,
+                    defer_enrichment=False,  # a background job would die with the pool worker
+                ))
+                rec["status"] = "ok"
+                rec["n_pages"] = meta["n_pages"]
+            rec["n_spans"] = meta["n_spans"]
+            if vectorize and not paths(doc_id)["embeddings"].exists():
+                from .vectorize import vectorize_spans
+                vectorize_spans(doc_id)
+            rec["vectorized"] = paths(doc_id)["embeddings"].exists()
+    except Exception as exc:
+        log.exception("ingest failed: %s", path)
+        rec["status"] = "error"
+        rec["error"] = f"{type(exc).__name__}: {exc}"
+    rec["seconds"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+
+def ingest_dir(
+    directory: Path,
+    *,
+    engine: str = "layout",
+    workers: int = 0,
+    vectorize: bool = False,
+    extract_words: bool = True,
+    write_images: bool = True,
+    recursive: bool = True,
+    manifest: Path | None = None,
+    on_result: Callable[[dict], None] | None = None,
+) -> dict:
+    """Ingest every PDF under `directory`; returns a run summary.
+
+    `workers` is the number of documents processed at once (0 = one per CPU,
+    1 = in this process). Each document is ingested serially inside its
+    worker. Results are appended to `manifest` (default
+    DATA_DIR/ingest_manifest.jsonl) as they finish.
+    """
+    manifest = manifest or default_manifest_path()
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    done = read_manifest(manifest)
+
+    pdfs = find_pdfs(directory, recursive)
+    todo = [str(f.resolve()) for f in pdfs if _file_key(f) not in done]
+    workers = resolve_workers(workers)
+
+    summary = {
+        "n_files": len(pdfs),
+        "n_resumed": len(pdfs) - len(todo),
+        "n_ok": 0,
+        "n_skipped": 0,
+        "n_failed": 0,
+        "n_pages": 0,
+        "failures": [],
+    }
+    t0 = time.perf_counter()
+    with manifest.open("ab") as mf:
+        for rec in _run(todo, engine, vectorize, extract_words, write_images, workers):
+            mf.write(orjson.dumps(rec) + b"\n")
+            mf.flush()
+            if rec["status"] == "error":
+                summary["n_failed"] += 1
+                summary["failures"].append({"path": rec["path"], "error": rec["error"]})
+            else:
+                summary["n_ok" if rec["status"] == "ok" else "n_skipped"] += 1
+                summary["n_pages"] += rec["n_pages"]
+            if on_result is not None:
+                on_result(rec)
+    elapsed = time.perf_counter() - t0
+    summary["seconds"] = round(elapsed, 3)
+    summary["pages_per_sec"] = round(summary["n_pages"] / elapsed, 2) if elapsed > 0 else 0.0
+    return summary
+
+
+def _failed(path: str, error: str) -> dict:
+    size, mtime_ns = _file_key(Path(path))[1:]
+    return {"path": path, "size": size, "mtime_ns": mtime_ns, "status": "error", "error": error, "seconds": 0.0}
+
+
+def _run(todo: List[str], engine: str, vectorize: bool, extract_words: bool, write_images: bool, workers: int) -> Iterable[dict]:
+    """ingest_one over `todo`; a copy skipped for a file ingested earlier in the run
+    gets `duplicate_of`.
+
+    A copy that waited for the ingest claim can finish just before the file
+    that held it, so its record is held back until that file's record.
+    """
+    firsts: Dict[str, str] = {}
+    held: Dict[str, List[dict]] = {}
+    for rec in _run_files(todo, engine, vectorize, extract_words, write_images, workers):
+        doc_id = rec.get("doc_id")
+        if rec.pop("waited", False) and rec["status"] == "skipped" and doc_id not in firsts:
+            held.setdefault(doc_id, []).append(rec)
+            continue
+        if rec["status"] == "ok":
+            firsts.setdefault(doc_id, rec["path"])
+        elif rec["status"] == "skipped" and doc_id in firsts:
+            rec["duplicate_of"] = firsts[doc_id]
+        yield rec
+        for dup in held.pop(doc_id, []) if doc_id in firsts else []:
+            dup["duplicate_of"] = firsts[doc_id]
+            yield dup
+    for recs in held.values():  # ingested by another process
+        yield from recs
+
+
+def _run_files(todo: List[str], engine: str, vectorize: bool, extract_words: bool, write_images: bool, workers: int) -> Iterable[dict]:
+    args = (engine, vectorize, extract_words, write_images)
+    if workers <= 1 or len(todo) <= 1:
+        _init_worker(vectorize and bool(todo))
+        for path in todo:
+            yield ingest_one(path, *args)
+        return
+    with process_pool(min(workers, len(todo)), initializer=_init_worker, initargs=(vectorize,)) as pool:
+        futures = {pool.submit(ingest_one, path, *args): path for path in todo}
+        for fut in as_completed(futures):
+            try:
+                rec = fut.result()
+            except BrokenProcessPool as exc:
+                # a worker died (e.g. killed for memory); the documents still in the pool fail with it
+                rec = _failed(futures[fut], f"{type(exc).__name__}: {exc}")
+            yield rec
@@ -0,0 +1,130 @@
+"""Deferred enrichment: readable spans now, formula/table recognition in the background.
+
+With deferred enrichment the layout engine writes its spans un-enriched, so
+the document can be read and chatted with as soon as extraction is done,
+and `start_enrichment` runs `enrich_visual_spans` on a background thread.
+The job rewrites spans.jsonl (atomically) with the enriched spans and
+refreshes what depends on span text: the n-gram index is rebuilt, and if
+the document was vectorized, only the changed spans are re-embedded and
+re-tokenized for BM25 (vectorize.reembed_spans). The spans are written
+under the document's doc_lock and only if spans.jsonl is still the version
+that was enriched; if a re-ingest or tier upgrade replaced it meanwhile,
+the new spans are enriched instead. Progress is recorded in doc.json under
+`enrichment` (`pending`, `running`, `done` or `failed`);
+`wait_for_enrichment` blocks until a running job finishes.
+
+The job thread is a daemon and dies with the process, so one-shot callers
+(the CLI, bulk workers) ingest with `defer_enrichment=False`.
+"""
+from __future__ import annotations
+import logging
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict
+
+import orjson
+
+from .enrich import EnrichBudget, EnrichExecutor, shared_executor
+from .ngram import NgramIndex, write_ngram_index
+from .store import doc_lock, paths, read_spans_jsonl, write_json, write_spans_jsonl
+
+log = logging.getLogger(__name__)
+
+_jobs: Dict[str, threading.Event] = {}
+_jobs_lock = threading.Lock()
+
+
+def _read_meta(doc_id: str) -> dict:
+    return orjson.loads(paths(doc_id)["doc"].read_bytes())
+
+
+def _version(path: Path) -> tuple:
+    st = path.stat()
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _set_status(doc_id: str, **status) -> dict:
+    meta = _read_meta(doc_id)
+    meta["enrichment"] = {**meta.get("enrichment", {}), **status}
+    write_json(paths(doc_id)["doc"], meta)
+    return meta
+
+
+def start_enrichment(doc_id: str, **kwargs) -> bool:
+    """Run `enrich_document` on a background thread; False if one is already running."""
+    with _jobs_lock:
+        if doc_id in _jobs:
+            return False
+        _jobs[doc_id] = threading.Event()
+
+    def run() -> None:
+        try:
+            enrich_document(doc_id, **kwargs)
+        except Exception:
+            log.exception("deferred enrichment failed: %s", doc_id)
+        finally:
+            with _jobs_lock:
+                _jobs.pop(doc_id).set()
+
+    threading.Thread(target=run, name=f"enrich-{doc_id[:19]}", daemon=True).start()
+    return True
+
+
+def enrich_document(doc_id: str, *, workers: int | None = None) -> dict:
+    """Enrich a stored document's spans in place; returns the updated metadata.
+
+    Spans that are already enriched are skipped, so running it again is cheap.
+    """
+    from .vectorize import reembed_spans
+
+    p = paths(doc_id)
+    _set_status(doc_id, status="running")
+    try:
+        budget = EnrichBudget()
+        with EnrichExecutor(workers) if workers is not None else nullcontext(shared_executor()) as enricher:
+            while True:
+                version = _version(p["spans"])
+                spans = read_spans_jsonl(p["spans"])
+                stats: dict = {}
+                enriched = enricher.enrich(spans, p["pdf"], stats=stats, budget=budget)
+                changed = [new.span_id for old, new in zip(spans, enriched) if new.text != old.text]
+                with doc_lock(doc_id):
+                    if _version(p["spans"]) != version:
+                        log.info("spans of %s were replaced during enrichment, enriching the new ones", doc_id)
+                        continue
+                    if enriched != spans:
+                        write_spans_jsonl(p["spans"], enriched)
+                    if changed:
+                        write_ngram_index(p["ngrams"], NgramIndex.build(enriched))
+                break
+        reembedded = reembed_spans(doc_id, changed)["n_reembedded"] if changed else 0
+    except Exception as exc:
+        _set_status(doc_id, status="failed", error=f"{type(exc).__name__}: {exc}")
+        raise
+
+    meta = _read_meta(doc_id)
+    meta["ingest"]["enrichment"] = stats
+    meta["enrichment"] = {"status": "done", "changed": len(changed), "reembedded": reembedded}
+    write_json(p["doc"], meta)
+    log.info("enriched %s in the background: %d spans changed, %d re-embedded", doc_id, len(changed), reembedded)
+    return meta
+
+
+def wait_for_enrichment(doc_id: str, timeout: float | None = None) -> dict:
+    """Block until the document's running enrichment job (if any) finishes; returns its doc.json.
+
+    A job left "pending" or "running" by a restarted server is reported as
+    "interrupted" (`metis enrich <doc_id>` resumes it).
+    """
+    with _jobs_lock:
+        job = _jobs.get(doc_id)
+    if job is not None:
+        job.wait(timeout)
+    meta = _read_meta(doc_id)
+    status = meta.get("enrichment")
+    with _jobs_lock:
+        running = doc_id in _jobs
+    if status and status.get("status") in ("pending", "running") and not running:
+        meta["enrichment"] = {**status, "status": "interrupted"}
+    return meta
@@ -1,13 +1,40 @@
 """Multimodal span enrichment — render visual regions and extract structured content."""
 from __future__ import annotations
+import atexit
 import dataclasses
+import functools
+import hashlib
+import importlib.metadata
+import importlib.util
 import logging
-from typing import TYPE_CHECKING
-
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+import orjson
 import pymupdf
 
+from .pool import page_shards, process_pool, resolve_workers
 from .schema import Span
-from .store import paths
+from .store import cache_path, open_pdf, paths, write_json_atomic
+from ..settings import (
+    ENRICH_ASSET_FORMAT,
+    ENRICH_ASSET_PNG_LEVEL,
+    ENRICH_ASSET_QUALITY,
+    ENRICH_ASSET_WORKERS,
+    ENRICH_BATCH_SIZE,
+    ENRICH_CACHE,
+    ENRICH_DOC_BUDGET_S,
+    ENRICH_LARGE_DPI,
+    ENRICH_MAX_AREA,
+    ENRICH_MIN_AREA,
+    ENRICH_SPAN_BUDGET_S,
+    ENRICH_WORKERS,
+)
 
 if TYPE_CHECKING:
     from PIL import Image as PILImage
@@ -15,6 +42,7 @@ if TYPE_CHECKING:
 log = logging.getLogger(__name__)
 
 ENRICHABLE_KINDS = {"formula", "table"}
+RENDER_DPI = 200
 
 # ---------------------------------------------------------------------------
 # Pix2text lazy singleton
@@ -24,23 +52,39 @@ _p2t_instance = None
 _P2T_NOT_INSTALLED = object()  # sentinel
 
 
+def _build_p2t():
+    from pix2text import Pix2Text
+    return Pix2Text.from_config(
+        enable_formula=True,
+        enable_table=True,
+        device="cpu",
+    )
+
+
+# what _get_p2t calls to build the instance; pool workers take the
+# executor's builder (see _init_worker)
+_p2t_builder = _build_p2t
+
+
 def _get_p2t():
     """Return the Pix2Text instance, or None if not installed."""
     global _p2t_instance
     if _p2t_instance is None:
         try:
-            from pix2text import Pix2Text
-            _p2t_instance = Pix2Text.from_config(
-                enable_formula=True,
-                enable_table=True,
-                device="cpu",
-            )
+            _p2t_instance = _p2t_builder()
         except ImportError:
             log.info("pix2text not installed — multimodal enrichment disabled")
             _p2t_instance = _P2T_NOT_INSTALLED
     return _p2t_instance if _p2t_instance is not _P2T_NOT_INSTALLED else None
 
 
+def _p2t_available() -> bool:
+    """Whether _get_p2t can succeed, checked without loading the models."""
+    if _p2t_instance is not None:
+        return _p2t_instance is not _P2T_NOT_INSTALLED
+    return importlib.util.find_spec("pix2text") is not None
+
+
 # ---------------------------------------------------------------------------
 # Bbox rendering
 # ---------------------------------------------------------------------------
@@ -61,36 +105,127 @@ def _render_bbox(
     return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
 
 
+# Pages with fewer regions than this, covering less than this fraction of the
+# page, are clip-rendered: at 200 dpi a whole-page render costs about as much
+# as two or three clip renders.
+_PAGE_RENDER_MIN_REGIONS = 3
+_PAGE_RENDER_MIN_AREA = 0.25
+
+
+class _PageCrops:
+    """Crops span regions out of one whole-page render per page.
+
+    Pages with several regions (or large ones) are rasterized once at `dpi`
+    and each region is a numpy slice of that buffer; only the PIL image made
+    from a slice copies pixels. Pages with one or two small regions, and
+    rotated pages, use clip rendering (_render_bbox). Regions must be
+    requested page by page: only the current page's render is kept.
+    """
+
+    def __init__(self, doc: pymupdf.Document, regions: dict[int, list[tuple]], dpi: int = 200):
+        self.doc = doc
+        self.dpi = dpi
+        self.matrix = pymupdf.Matrix(dpi / 72, dpi / 72)
+        self.whole_pages = {
+            page for page, boxes in regions.items()
+            if doc[page].rotation == 0 and (
+                len(boxes) >= _PAGE_RENDER_MIN_REGIONS
+                or sum(_area_fraction(doc[page], b) for b in boxes) >= _PAGE_RENDER_MIN_AREA
+            )
+        }
+        self.page_renders = 0
+        self.clip_renders = 0
+        self._current: tuple[int, pymupdf.Pixmap, np.ndarray] | None = None
+
+    def crop(self, page: int, bbox_pdf: tuple[float, float, float, float]) -> "PILImage.Image":
+        from PIL import Image
+
+        if page not in self.whole_pages:
+            self.clip_renders += 1
+            return _render_bbox(self.doc, page=page, bbox_pdf=bbox_pdf, dpi=self.dpi)
+        if self._current is None or self._current[0] != page:
+            self._current = None  # release the previous page first
+            pix = self.doc[page].get_pixmap(matrix=self.matrix)
+            pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+            self._current = (page, pix, pixels)
+            self.page_renders += 1
+        _, pix, pixels = self._current
+        box = (pymupdf.Rect(bbox_pdf) * self.matrix).irect & pix.irect
+        if box.is_empty:
+            raise ValueError(f"region {bbox_pdf} lies outside page {page}")
+        return Image.fromarray(pixels[box.y0 - pix.y:box.y1 - pix.y, box.x0 - pix.x:box.x1 - pix.x])
+
+
+def _area_fraction(page: pymupdf.Page, bbox_pdf: tuple) -> float:
+    area = abs(page.rect)
+    return abs(pymupdf.Rect(bbox_pdf) & page.rect) / area if area else 1.0
+
+
 # ---------------------------------------------------------------------------
 # Asset saving
 # ---------------------------------------------------------------------------
 
-def _save_asset(image: "PILImage.Image", doc_id: str, span_id: str) -> str:
-    """Save rendered bbox image to _assets/images/. Returns relative path from DATA_DIR."""
+_ASSET_FORMATS = {"png": ("PNG", ".png"), "webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+
+def _asset_options(fmt: str) -> dict:
+    if fmt == "png":
+        return {"compress_level": ENRICH_ASSET_PNG_LEVEL}
+    return {"quality": ENRICH_ASSET_QUALITY}
+
+
+def _save_asset(image: "PILImage.Image", doc_id: str, span_id: str) -> tuple[str, int]:
+    """Save rendered bbox image to _assets/images/ in METIS_ENRICH_ASSET_FORMAT.
+
+    Returns the path relative to DATA_DIR and the bytes written.
+    """
+    fmt = ENRICH_ASSET_FORMAT if ENRICH_ASSET_FORMAT in _ASSET_FORMATS else "png"
+    pil_format, ext = _ASSET_FORMATS[fmt]
     p = paths(doc_id)
     images_dir = p["assets"] / "images"
     images_dir.mkdir(parents=True, exist_ok=True)
-    filename = f"{span_id}.png"
+    filename = f"{span_id}{ext}"
     full_path = images_dir / filename
-    image.save(full_path)
+    image.save(full_path, format=pil_format, **_asset_options(fmt))
 
     # Return path relative to DATA_DIR (p["assets"].parent is DATA_DIR)
     rel = full_path.relative_to(p["assets"].parent)
-    return str(rel)
+    return str(rel), full_path.stat().st_size
+
+
+_asset_pool: ThreadPoolExecutor | None = None
+
+
+def _get_asset_pool() -> ThreadPoolExecutor:
+    """Threads that encode and write asset images while recognition goes on."""
+    global _asset_pool
+    if _asset_pool is None:
+        _asset_pool = ThreadPoolExecutor(max_workers=max(1, ENRICH_ASSET_WORKERS), thread_name_prefix="enrich-asset")
+    return _asset_pool
 
 
 # ---------------------------------------------------------------------------
 # Per-kind enrichment
 # ---------------------------------------------------------------------------
 
+def _wrap_latex(latex) -> str:
+    latex = latex.strip() if isinstance(latex, str) else str(latex).strip()
+    return f"$${latex}$$"
+
+
 def _enrich_formula(p2t, image: "PILImage.Image") -> str:
     """Run pix2text MFR on a formula image, return LaTeX wrapped in $$."""
-    latex = p2t.recognize_formula(image, return_text=True)
-    if isinstance(latex, str):
-        latex = latex.strip()
-    else:
-        latex = str(latex).strip()
-    return f"$${latex}$$"
+    return _wrap_latex(p2t.recognize_formula(image, return_text=True))
+
+
+def _enrich_formulas(p2t, images: list["PILImage.Image"]) -> list[str]:
+    """Run pix2text MFR on a batch of formula images in one model call."""
+    if len(images) == 1:
+        return [_enrich_formula(p2t, images[0])]
+    out = p2t.recognize_formula(images, batch_size=len(images), return_text=True)
+    if not isinstance(out, list) or len(out) != len(images):
+        raise RuntimeError(f"recognize_formula returned {type(out).__name__} for {len(images)} images")
+    return [_wrap_latex(latex) for latex in out]
 
 
 def _enrich_table(p2t, image: "PILImage.Image") -> str:
@@ -104,77 +239,474 @@ def _enrich_table(p2t, image: "PILImage.Image") -> str:
     return ""
 
 
+def _enrich_tables(p2t, images: list["PILImage.Image"]) -> list[str]:
+    """Table recognition for a batch; pix2text's table recognizer takes one image per call."""
+    return [_enrich_table(p2t, image) for image in images]
+
+
+# kind -> (batch extractor, single-image extractor, content_source)
+_EXTRACTORS = {
+    "formula": (_enrich_formulas, _enrich_formula, "pix2text_mfr"),
+    "table": (_enrich_tables, _enrich_table, "pix2text_table"),
+}
+
+
+def _extract_batch(p2t, kind: str, images: list["PILImage.Image"]) -> list[str | Exception]:
+    """Recognize a batch of same-kind images; per-image results, an exception for each failure.
+
+    If the batch call fails, every image is retried on its own so one bad
+    crop does not cost the rest of its batch.
+    """
+    batch_fn, single_fn, _ = _EXTRACTORS[kind]
+    try:
+        return list(batch_fn(p2t, images))
+    except Exception:
+        if len(images) == 1:
+            return [_capture(single_fn, p2t, images[0])]
+        log.warning("Batched %s recognition failed; retrying %d images one by one", kind, len(images), exc_info=True)
+    return [_capture(single_fn, p2t, image) for image in images]
+
+
+def _capture(fn, *args) -> str | Exception:
+    try:
+        return fn(*args)
+    except Exception as exc:
+        return exc
+
+
+_STAT_COUNTS = ("spans", "enriched", "failed", "batches", "cache_hits", "downgraded", "assets", "asset_bytes")
+
+
+def _add_stats(stats: dict, kind: str, *, wall_s: float, skipped: dict | None = None, **counts: int) -> None:
+    """Accumulate per-kind counts; spans_per_s is over the spans the model actually saw."""
+    st = stats.setdefault(kind, {**dict.fromkeys(_STAT_COUNTS, 0), "skipped": {}, "wall_s": 0.0})
+    for k in _STAT_COUNTS:
+        st[k] = st.get(k, 0) + counts.get(k, 0)
+    for reason, span_ids in (skipped or {}).items():
+        st.setdefault("skipped", {}).setdefault(reason, []).extend(span_ids)
+    st["wall_s"] = round(st["wall_s"] + wall_s, 4)
+    recognized = st["spans"] - st["cache_hits"]
+    st["spans_per_s"] = round(recognized / st["wall_s"], 2) if st["wall_s"] else 0.0
+    st["cache_hit_rate"] = round(st["cache_hits"] / st["spans"], 4) if st["spans"] else 0.0
+
+
+# ---------------------------------------------------------------------------
+# Result cache
+# ---------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=1)
+def _extractor_version() -> str:
+    try:
+        return f"pix2text-{importlib.metadata.version('pix2text')}"
+    except importlib.metadata.PackageNotFoundError:
+        return "pix2text-unknown"
+
+
+def _cache_key(kind: str, image: "PILImage.Image", dpi: int) -> str:
+    """Hash of the crop's pixels, the render dpi and the extractor that would read it."""
+    h = hashlib.sha256(f"{kind}|{_extractor_version()}|{dpi}|{image.mode}|{image.width}x{image.height}|".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def _cache_get(key: str) -> str | None:
+    try:
+        return orjson.loads(cache_path("enrich", key).read_bytes())["text"]
+    except FileNotFoundError:
+        return None
+    except Exception:
+        log.warning("Unreadable enrichment cache entry %s", key, exc_info=True)
+        return None
+
+
+def _cache_put(key: str, kind: str, text: str) -> None:
+    try:
+        write_json_atomic(cache_path("enrich", key), {"kind": kind, "extractor": _extractor_version(), "text": text})
+    except OSError:
+        log.warning("Failed to write enrichment cache entry %s", key, exc_info=True)
+
+
 # ---------------------------------------------------------------------------
 # Main entry point
 # ---------------------------------------------------------------------------
 
 def enrich_visual_spans(
     spans: list[Span],
-    pdf_bytes: bytes,
+    pdf: Path | bytes,
+    *,
+    batch_size: int | None = None,
+    stats: dict | None = None,
+    use_cache: bool | None = None,
+    deadline: float | None = None,
+    p2t=None,
 ) -> list[Span]:
     """Process visual spans through pix2text extractors.
 
-    Returns a new list with enriched spans replacing originals.
-    If pix2text is not installed, returns spans unchanged.
+    `pdf` is the stored PDF's path (opened memory-mapped) or raw bytes.
+    Returns a new list with enriched spans replacing originals; spans that
+    already carry a `content_source` are kept as they are. If pix2text is not installed, returns spans unchanged.
+
+    Crops of the same kind are recognized `batch_size` at a time (default
+    METIS_ENRICH_BATCH_SIZE). A span whose crop cannot be rendered or
+    recognized keeps its original text. If `stats` is given, per-kind counts
+    and recognition throughput are accumulated into it:
+    {kind: {"spans", "enriched", "failed", "batches", "cache_hits",
+    "cache_hit_rate", "downgraded", "skipped", "assets", "asset_bytes",
+    "wall_s", "spans_per_s"}}.
+
+    Crops are gated by cost: those under METIS_ENRICH_MIN_AREA of their
+    page are skipped, those over METIS_ENRICH_MAX_AREA are rendered at
+    METIS_ENRICH_LARGE_DPI ("downgraded"). A recognition call cannot be
+    interrupted, so METIS_ENRICH_SPAN_BUDGET_S is enforced around it: a
+    span whose share of its batch's time (by pixel count) overran the budget
+    keeps its original text, and once a kind's measured seconds per pixel
+    predict an overrun, such crops are skipped before they are rendered.
+    No new batch starts after `deadline` (a time.time() value). Skipped
+    spans keep their original text and are listed in `stats` as
+    {"skipped": {reason: [span_id, ...]}}, reason one of "too_small",
+    "too_large", "span_budget" or "doc_budget". Every span that is not
+    enriched gets that reason, or "failed", as its `enrich_status`, so an
+    attached asset is not mistaken for a recognized one.
+
+    Recognized text is cached on disk by a hash of the crop pixels, render
+    dpi and pix2text version (METIS_ENRICH_CACHE; `use_cache`), so a crop
+    seen in any earlier ingest skips the model. Text that overran the span
+    budget is cached too, though the span keeps its original text.
+
+    Asset images are written by a background thread pool while recognition
+    runs; the call only waits for writes still pending at the end. Spans
+    whose asset could not be written get no `asset_path`.
+
+    `p2t` is the recognizer to use instead of the process-wide Pix2Text.
     """
-    p2t = _get_p2t()
+    # spans reused from a previous version arrive already enriched; the rest
+    # are visited page by page so each page is rendered at most once
+    todo = sorted(
+        (i for i, span in enumerate(spans) if span.kind in ENRICHABLE_KINDS and span.content_source is None),
+        key=lambda i: spans[i].page,
+    )
+    if not todo:
+        return spans
+    p2t = _get_p2t() if p2t is None else p2t
     if p2t is None:
         return spans
+    batch_size = max(1, ENRICH_BATCH_SIZE if batch_size is None else batch_size)
+    use_cache = ENRICH_CACHE if use_cache is None else use_cache
+
+    doc = open_pdf(pdf) if isinstance(pdf, Path) else pymupdf.open(stream=pdf, filetype="pdf")
+    try:
+        enriched = list(spans)
+        counts: dict[str, dict] = {}
+        for i in todo:
+            counts.setdefault(spans[i].kind, {**dict.fromkeys(_STAT_COUNTS, 0), "skipped": {}, "wall_s": 0.0})
+        batches: dict[str, list[tuple[int, "PILImage.Image", str | None, float]]] = {}
+        assets: dict[int, Future] = {}
+        rates: dict[str, list[float]] = {}  # kind -> [recognition seconds, megapixels]
+
+        def skip(i: int, reason: str) -> None:
+            span = spans[i]
+            counts[span.kind]["skipped"].setdefault(reason, []).append(span.span_id)
+            enriched[i] = dataclasses.replace(span, enrich_status=reason)
+            log.info("Skipped enrichment of %s (%s): %s", span.span_id, span.kind, reason)
+
+        def fail(i: int) -> None:
+            counts[spans[i].kind]["failed"] += 1
+            enriched[i] = dataclasses.replace(spans[i], enrich_status="failed")
+
+        # area gating needs no rendering; only full-resolution crops share page renders
+        dpis: dict[int, int] = {}
+        for i in todo:
+            span = spans[i]
+            counts[span.kind]["spans"] += 1
+            area = _area_fraction(doc[span.page], span.bbox_pdf)
+            if area < ENRICH_MIN_AREA:
+                skip(i, "too_small")
+            elif area <= ENRICH_MAX_AREA:
+                dpis[i] = RENDER_DPI
+            elif ENRICH_LARGE_DPI > 0:
+                dpis[i] = ENRICH_LARGE_DPI
+                counts[span.kind]["downgraded"] += 1
+            else:
+                skip(i, "too_large")
+        regions: dict[int, list[tuple]] = {}
+        for i, dpi in dpis.items():
+            if dpi == RENDER_DPI:
+                regions.setdefault(spans[i].page, []).append(spans[i].bbox_pdf)
+        crops = _PageCrops(doc, regions, dpi=RENDER_DPI)
+
+        def finish(i: int, new_text: str) -> None:
+            span = spans[i]
+            content_source = _EXTRACTORS[span.kind][2]
+            enriched[i] = dataclasses.replace(
+                span,
+                text=new_text,
+                content_source=content_source,
+                original_text=span.text,
+                enrich_status=None,
+            )
+            counts[span.kind]["enriched"] += 1
+            log.info("Enriched %s (%s) via %s", span.span_id, span.kind, content_source)
 
-    doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
-    enriched: list[Span] = []
+        def recognize(kind: str) -> None:
+            batch, c = batches.pop(kind), counts[kind]
+            if deadline is not None and time.time() >= deadline:
+                for i, *_ in batch:
+                    skip(i, "doc_budget")
+                return
+            t0 = time.perf_counter()
+            results = _extract_batch(p2t, kind, [image for _, image, _, _ in batch])
+            elapsed = time.perf_counter() - t0
+            c["wall_s"] += elapsed
+            c["batches"] += 1
+            total_mpx = sum(mpx for *_, mpx in batch)
+            rate = rates.setdefault(kind, [0.0, 0.0])
+            rate[0] += elapsed
+            rate[1] += total_mpx
+
+            for (i, _, key, mpx), new_text in zip(batch, results):
+                span = spans[i]
+                if isinstance(new_text, Exception):
+                    log.warning("Enrichment failed for %s (%s)", span.span_id, span.kind, exc_info=new_text)
+                    fail(i)
+                    continue
+                # the text is valid even if it came too late for this ingest
+                if key is not None:
+                    _cache_put(key, kind, new_text)
+                share = elapsed * mpx / total_mpx if total_mpx else elapsed / len(batch)
+                if ENRICH_SPAN_BUDGET_S > 0 and share > ENRICH_SPAN_BUDGET_S:
+                    skip(i, "span_budget")
+                    continue
+                finish(i, new_text)
+
+        for i in todo:
+            if i not in dpis:
+                continue
+            span, dpi = spans[i], dpis[i]
+            c = counts[span.kind]
+            if deadline is not None and time.time() >= deadline:
+                skip(i, "doc_budget")
+                continue
+            x0, y0, x1, y1 = span.bbox_pdf
+            mpx = abs(x1 - x0) * abs(y1 - y0) * (dpi / 72) ** 2 / 1e6
+            rate = rates.get(span.kind)
+            if ENRICH_SPAN_BUDGET_S > 0 and rate and rate[1] and mpx * rate[0] / rate[1] > ENRICH_SPAN_BUDGET_S:
+                skip(i, "span_budget")
+                continue
+            # Render bbox as image
+            try:
+                if dpi == RENDER_DPI:
+                    image = crops.crop(span.page, span.bbox_pdf)
+                else:
+                    image = _render_bbox(doc, page=span.page, bbox_pdf=span.bbox_pdf, dpi=dpi)
+            except Exception:
+                log.warning("Failed to render bbox for %s", span.span_id, exc_info=True)
+                fail(i)
+                continue
 
-    for span in spans:
-        if span.kind not in ENRICHABLE_KINDS:
-            enriched.append(span)
-            continue
+            # Save asset image (in the background)
+            assets[i] = _get_asset_pool().submit(_save_asset, image, span.doc_id, span.span_id)
 
-        # Render bbox as image
-        try:
-            image = _render_bbox(
-                doc,
-                page=span.page,
-                bbox_pdf=span.bbox_pdf,
+            # Same pixels seen before: reuse the recognized text
+            key = _cache_key(span.kind, image, dpi) if use_cache else None
+            cached = _cache_get(key) if key is not None else None
+            if cached is not None:
+                c["cache_hits"] += 1
+                finish(i, cached)
+                continue
+
+            batch = batches.setdefault(span.kind, [])
+            batch.append((i, image, key, mpx))
+            if len(batch) >= batch_size:
+                recognize(span.kind)
+        for kind in list(batches):
+            recognize(kind)
+
+        for i, fut in assets.items():
+            span = spans[i]
+            try:
+                asset_path, n_bytes = fut.result()
+            except Exception:
+                log.warning("Failed to save asset for %s", span.span_id, exc_info=True)
+                continue
+            enriched[i] = dataclasses.replace(enriched[i], asset_path=asset_path)
+            counts[span.kind]["assets"] += 1
+            counts[span.kind]["asset_bytes"] += n_bytes
+
+        log.info("enrichment renders: %d pages, %d clips", crops.page_renders, crops.clip_renders)
+        for kind, c in counts.items():
+            log.info(
+                "%s enrichment: %d/%d spans (%d cached, %d skipped) in %d batches, %.2fs",
+                kind, c["enriched"], c["spans"], c["cache_hits"],
+                sum(map(len, c["skipped"].values())), c["batches"], c["wall_s"],
             )
-        except Exception:
-            log.warning("Failed to render bbox for %s", span.span_id, exc_info=True)
-            enriched.append(span)
-            continue
+            if stats is not None:
+                _add_stats(stats, kind, **c)
 
-        # Save asset image
-        asset_path = None
-        try:
-            asset_path = _save_asset(image, span.doc_id, span.span_id)
-        except Exception:
-            log.warning("Failed to save asset for %s", span.span_id, exc_info=True)
+        return enriched
+    finally:
+        doc.close()
 
-        # Dispatch to extractor by kind
-        try:
-            if span.kind == "formula":
-                new_text = _enrich_formula(p2t, image)
-                content_source = "pix2text_mfr"
-            elif span.kind == "table":
-                new_text = _enrich_table(p2t, image)
-                content_source = "pix2text_table"
-            else:
-                enriched.append(span)
-                continue
 
-            enriched.append(dataclasses.replace(
-                span,
-                text=new_text,
-                asset_path=asset_path,
-                content_source=content_source,
-                original_text=span.text,
-            ))
-            log.info("Enriched %s (%s) via %s", span.span_id, span.kind, content_source)
+# ---------------------------------------------------------------------------
+# Process-pool executor
+# ---------------------------------------------------------------------------
+
+def _init_worker(builder: Callable | None) -> None:
+    global _p2t_builder
+    if builder is not None:
+        _p2t_builder = builder
+
+
+def _enrich_shard(
+    spans: list[Span], pdf: Path, batch_size: int | None, deadline: float | None = None, p2t=None,
+) -> tuple[list[Span], dict]:
+    stats: dict = {}
+    return enrich_visual_spans(spans, pdf, batch_size=batch_size, stats=stats, deadline=deadline, p2t=p2t), stats
+
+
+def _merge_stats(stats: dict, shard_stats: dict) -> None:
+    for kind, st in shard_stats.items():
+        _add_stats(stats, kind, skipped=st.get("skipped"), **{k: st[k] for k in (*_STAT_COUNTS, "wall_s")})
 
-        except Exception:
-            log.warning("Enrichment failed for %s (%s)", span.span_id, span.kind, exc_info=True)
-            if asset_path:
-                enriched.append(dataclasses.replace(span, asset_path=asset_path))
-            else:
-                enriched.append(span)
 
-    doc.close()
-    return enriched
+class EnrichBudget:
+    """One document's enrichment time budget, spent across the `enrich` calls given it.
+
+    `budget_s` defaults to METIS_ENRICH_DOC_BUDGET_S (0 = none), so a
+    windowed ingest stops enriching once its whole document has used it up.
+    """
+
+    def __init__(self, budget_s: float | None = None):
+        self.budget_s = ENRICH_DOC_BUDGET_S if budget_s is None else budget_s
+        self.spent_s = 0.0
+
+    def deadline(self, now: float) -> float | None:
+        return now + self.budget_s - self.spent_s if self.budget_s > 0 else None
+
+
+class EnrichExecutor:
+    """Runs enrich_visual_spans on a pool of worker processes.
+
+    Each worker builds its own Pix2Text on first use and keeps it for the
+    executor's lifetime, so one executor should serve many documents (see
+    `shared_executor`). The enrichable spans are split into contiguous page
+    shards; results are merged back in span order and match serial
+    enrichment. Even a single page goes to the pool, so the parent never
+    loads a model of its own. With one worker or an in-memory PDF it enriches
+    serially, and it finishes serially if the pool breaks. In `stats`,
+    `wall_s` is summed over the workers. `enrich` may be called from several
+    threads at once.
+
+    `p2t_builder` replaces the default Pix2Text construction, both in the
+    workers and for serial enrichment; it must be picklable.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        batch_size: int | None = None,
+        p2t_builder: Callable | None = None,
+    ):
+        self.workers = resolve_workers(ENRICH_WORKERS if workers is None else workers)
+        self.batch_size = batch_size
+        self.p2t_builder = p2t_builder
+        self._lock = threading.Lock()
+        self._pool = None
+        self._p2t = None  # built from p2t_builder for serial enrichment
+
+    def __enter__(self) -> "EnrichExecutor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def enrich(
+        self, spans: list[Span], pdf: Path | bytes, stats: dict | None = None, budget: EnrichBudget | None = None,
+    ) -> list[Span]:
+        """Enrich `spans`; `budget` carries the document time budget across calls (a fresh one if None)."""
+        budget = EnrichBudget() if budget is None else budget
+        t0 = time.time()
+        try:
+            return self._enrich(spans, pdf, stats, budget.deadline(t0))
+        finally:
+            budget.spent_s += time.time() - t0
+
+    def _serial_p2t(self):
+        """The recognizer for in-process enrichment; None for the process-wide one."""
+        with self._lock:
+            if self.p2t_builder is not None and self._p2t is None:
+                self._p2t = self.p2t_builder()
+            return self._p2t
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = process_pool(self.workers, initializer=_init_worker, initargs=(self.p2t_builder,))
+            return self._pool
+
+    def _discard_pool(self, pool) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _enrich(self, spans: list[Span], pdf: Path | bytes, stats: dict | None, deadline: float | None) -> list[Span]:
+        by_page: dict[int, list[int]] = {}
+        for i, span in enumerate(spans):
+            if span.kind in ENRICHABLE_KINDS and span.content_source is None:
+                by_page.setdefault(span.page, []).append(i)
+        available = self.p2t_builder is not None or _p2t_available()
+        if not by_page or self.workers <= 1 or not isinstance(pdf, Path) or not available:
+            # with nothing to recognize, enrich_visual_spans returns before loading a model
+            p2t = self._serial_p2t() if by_page else None
+            return enrich_visual_spans(spans, pdf, batch_size=self.batch_size, stats=stats, deadline=deadline, p2t=p2t)
+
+        pages = sorted(by_page)
+        shards = [[i for pg in shard for i in by_page[pg]] for shard in page_shards(pages, self.workers)]
+        enriched = list(spans)
+        shard_stats: list[dict] = []
+        done = 0
+        pool = self._get_pool()
+        try:
+            futures = [
+                pool.submit(_enrich_shard, [spans[i] for i in shard], pdf, self.batch_size, deadline)
+                for shard in shards
+            ]
+            for shard, fut in zip(shards, futures):
+                out, st = fut.result()
+                for i, span in zip(shard, out):
+                    enriched[i] = span
+                shard_stats.append(st)
+                done += 1
+        except BrokenProcessPool as exc:
+            log.warning("parallel enrichment failed (%s), continuing serially", exc)
+            self._discard_pool(pool)
+            for shard in shards[done:]:
+                out, st = _enrich_shard([spans[i] for i in shard], pdf, self.batch_size, deadline, self._serial_p2t())
+                for i, span in zip(shard, out):
+                    enriched[i] = span
+                shard_stats.append(st)
+        if stats is not None:
+            for st in shard_stats:
+                _merge_stats(stats, st)
+        return enriched
+
+
+_executor: EnrichExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor() -> EnrichExecutor:
+    """The process-wide EnrichExecutor (METIS_ENRICH_WORKERS), created on first use and closed at exit."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = EnrichExecutor()
+            atexit.register(_executor.close)
+        return _executor
@@ -125,11 +125,18 @@ class EvidenceItem(BaseModel):
     text: str
 
 
+class IngestLineage(BaseModel):
+    parent: str
+    reused_pages: dict[str, conint(ge=0)]
+
+
 class IngestResponse(BaseModel):
     doc_id: str
     ingest: Any
+    lineage: IngestLineage | None = None
     n_pages: conint(ge=0)
     n_spans: conint(ge=0)
+    tier: str | None = None
 
 
 class VectorizeResponse(BaseModel):
@@ -1,12 +1,24 @@
 from __future__ import annotations
 import logging
+import os
+import tempfile
+import numpy as np
 import pymupdf
 from collections import Counter
-from typing import Dict, List, Tuple
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
 from .schema import Span
-from .store import doc_id_from_bytes, paths, write_json, write_spans_jsonl
-from .enrich import enrich_visual_spans
-from ..settings import MIN_CHARS, ENABLE_ENRICHMENT
+from .store import JsonMapWriter, SpansDigest, append_spans_jsonl, doc_lock, open_pdf, paths, store_pdf_bytes, write_json
+from .deferred import start_enrichment
+from .enrich import EnrichBudget, shared_executor
+from .timing import StageTimer
+from .lineage import ParentPages, lineage, page_fingerprints, plan_reuse, write_fingerprints
+from .neighbors import LINK_FIELDS, ro_links_from_arrays, write_ro_links
+from .ngram import GRAM_FIELDS, NgramIndex, gram_codes, write_ngram_index
+from .pool import ordered_map, page_shards, process_pool, resolve_workers
+from .spatial import DocSpatialIndex, SpatialIndex, pack_words, page_word_boxes, word_offsets, write_doc_index
+from ..settings import MIN_CHARS, ENABLE_ENRICHMENT, INGEST_WORKERS, INGEST_PARALLEL_MIN_PAGES, INGEST_WINDOW_PAGES, DEFER_ENRICHMENT
 
 log = logging.getLogger(__name__)
 
@@ -14,59 +26,310 @@ def _norm_bbox(b: Tuple[float,float,float,float], w: float, h: float):
     x0,y0,x1,y1 = b
     return (x0/w, y0/h, x1/w, y1/h)
 
+class _IndexBuilder:
+    """Collects the span-store side indexes page by page: spatial, reading-order links and n-grams.
+
+    Only compact per-page arrays are kept (boxes, ids, trigram codes), not
+    spans or word lists, and the result is identical to building each index
+    from the full span list. These arrays still grow with the document until
+    write(): the packed spatial and n-gram indexes need every page at once.
+    Pages given no words are indexed from pymupdf's own word boxes, as in
+    build_doc_index_from_pdf.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.page_sizes = [(pg.rect.width, pg.rect.height) for pg in doc]
+        self.n_spans = 0
+        self.links_digest = SpansDigest(LINK_FIELDS)
+        self.gram_digest = SpansDigest(GRAM_FIELDS)
+        self.cols: Dict[str, list] = {k: [] for k in (
+            "span_boxes", "span_pages", "span_ids", "reading_order", "body",
+            "word_boxes", "word_pages", "word_bytes", "word_lengths", "gram_codes", "gram_rows",
+        )}
+
+    def add_page(self, page_i: int, page_spans: List[Span], words: list | None = None) -> None:
+        c = self.cols
+        c["span_boxes"].append(np.asarray([s.bbox_norm for s in page_spans], dtype=np.float64).reshape(-1, 4))
+        c["span_pages"].append(np.asarray([s.page for s in page_spans], dtype=np.int64))
+        c["span_ids"].append(np.asarray([s.span_id for s in page_spans], dtype=np.str_))
+        c["reading_order"].append(np.asarray([s.reading_order for s in page_spans], dtype=np.int64))
+        c["body"].append(np.asarray([not (s.is_header or s.is_footer) for s in page_spans], dtype=bool))
+        self.links_digest.update(page_spans)
+        self.gram_digest.update(page_spans)
+        for row, s in enumerate(page_spans, start=self.n_spans):
+            if not (s.is_header or s.is_footer):
+                codes = gram_codes(s.text)
+                c["gram_codes"].append(codes)
+                c["gram_rows"].append(np.full(len(codes), row, dtype=np.int32))
+        self.n_spans += len(page_spans)
+
+        if words is None:
+            words = self.doc[page_i].get_text("words")
+        c["word_boxes"].append(np.asarray(page_word_boxes(words, self.page_sizes[page_i]), dtype=np.float64).reshape(-1, 4))
+        c["word_pages"].append(np.full(len(words), page_i, dtype=np.int64))
+        w_bytes, w_lengths = pack_words([w[4] for w in words])
+        c["word_bytes"].append(w_bytes)
+        c["word_lengths"].append(w_lengths)
+
+    def write(self, p: dict) -> None:
+        c = self.cols
+        cat = lambda k, dtype: np.concatenate(c[k]) if c[k] else np.zeros(0, dtype=dtype)
+        n_pages = len(self.page_sizes)
+        pages = cat("span_pages", np.int64)
+        word_pages = cat("word_pages", np.int64)
+        write_doc_index(p["spatial"], DocSpatialIndex(
+            spans=SpatialIndex.build(cat("span_boxes", np.float64), pages, n_pages),
+            span_ids=cat("span_ids", np.str_),
+            words=SpatialIndex.build(cat("word_boxes", np.float64), word_pages, n_pages),
+            word_bytes=cat("word_bytes", np.uint8),
+            word_offsets=word_offsets(cat("word_lengths", np.int64)),
+            word_pages=word_pages,
+        ))
+        write_ro_links(
+            p["ro_links"],
+            ro_links_from_arrays(cat("reading_order", np.int64), pages, cat("body", bool)),
+            self.links_digest.hexdigest(),
+        )
+        write_ngram_index(p["ngrams"], NgramIndex.from_codes(c["gram_codes"], c["gram_rows"], self.gram_digest.hexdigest()))
+
+class _PageSink:
+    """Writes ingestion output page by page so finished pages are queryable early.
+
+    spans.jsonl is appended per page and doc.json tracks `pages_done`, then
+    `complete` once everything (side indexes included) is written. Nothing a
+    reader may be using is removed or truncated: the side indexes (and, on a
+    re-ingest, spans.jsonl) are written to temp files under `out` and
+    replaced into place by finish(), or discarded if ingestion fails. A first
+    ingest streams straight into spans.jsonl, which has no previous readers.
+    """
+
+    _STAGED = ("spatial", "ro_links", "ngrams")
+
+    def __init__(self, p: dict, meta: dict):
+        self.p = p
+        self.meta = meta
+        staged = self._STAGED + (("spans",) if p["spans"].exists() else ())
+        self.out = dict(p)
+        for key in staged:
+            fd, tmp = tempfile.mkstemp(dir=p[key].parent, prefix=f".{p[key].name}.", suffix=".partial")
+            os.close(fd)
+            self.out[key] = Path(tmp)
+        self.out["spans"].write_bytes(b"")
+        write_json(p["doc"], meta)
+
+    def __enter__(self) -> "_PageSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.discard()
+
+    def add_page(self, page_i: int, page_spans: List[Span], kinds: Counter | None = None, reused: bool = False) -> dict:
+        append_spans_jsonl(self.out["spans"], page_spans)
+        ingest = self.meta["ingest"]
+        self.meta["n_spans"] += len(page_spans)
+        ingest["pages_done"] += 1
+        ingest["pages_reused"] += reused
+        ingest["pages_reprocessed"] += not reused
+        write_json(self.p["doc"], self.meta)
+        return {
+            "event": "page",
+            "page": page_i,
+            "pages_done": ingest["pages_done"],
+            "n_pages": self.meta["n_pages"],
+            "n_spans": self.meta["n_spans"],
+            "kinds": dict(kinds if kinds is not None else Counter(s.kind or "text" for s in page_spans)),
+            "reused": reused,
+        }
+
+    def finish(self, timer: StageTimer) -> None:
+        """Move the staged files into place and write the final doc.json (timings, `complete`)."""
+        # under doc_lock, so a deferred enrichment job cannot write back
+        # spans read from the version replaced here
+        with doc_lock(self.meta["doc_id"]):
+            for key in ("spans", *self._STAGED):
+                if self.out[key] != self.p[key]:
+                    os.replace(self.out[key], self.p[key])
+        self.meta["ingest"]["timings"] = timer.report()
+        self.meta["ingest"]["complete"] = True
+        write_json(self.p["doc"], self.meta)
+
+    def discard(self) -> None:
+        """Remove the staged files of an ingest that did not finish."""
+        for key, path in self.out.items():
+            if path != self.p[key]:
+                path.unlink(missing_ok=True)
+
+
+def _plan_pages(doc_id: str, doc, meta: dict, parent: str | None) -> Tuple[ParentPages | None, List[int]]:
+    """Fingerprint the pages, match them against `parent`, and list the pages to extract.
+
+    Records the reuse counters, and the lineage when a parent is given, in `meta`.
+    """
+    fps = page_fingerprints(doc)
+    write_fingerprints(doc_id, fps)
+    reuse = plan_reuse(parent, fps, meta["ingest"]) if parent != doc_id else None
+    meta["ingest"].update(pages_reused=0, pages_reprocessed=0)
+    if parent:
+        meta["lineage"] = lineage(reuse, parent)
+    return reuse, [i for i in range(doc.page_count) if reuse is None or i not in reuse.page_map]
+
+
+def drain_ingest(events: Iterator[dict]) -> dict:
+    """Run an ingest event generator to completion and return the document metadata."""
+    for event in events:
+        if event["event"] == "done":
+            return event["meta"]
+    raise RuntimeError("ingestion ended without a 'done' event")
+
 # ---------------------------------------------------------------------------
 # blocks-based ingestion 
 # ---------------------------------------------------------------------------
 
-def ingest_pdf_bytes(pdf_bytes: bytes, *, source_filename: str | None = None) -> dict:
-    doc_id = doc_id_from_bytes(pdf_bytes)
-    p = paths(doc_id)
-    p["pdf"].write_bytes(pdf_bytes)
+def _blocks_page(page) -> List[Tuple[int, Tuple[float, float, float, float], str]]:
+    """Text blocks of one page as (block_index, bbox_pdf, text), MIN_CHARS filtered."""
+    # blocks: (x0,y0,x1,y1,"text", block_no, block_type)
+    blocks = page.get_text("blocks")
+    # sort by top-left reading order (good enough v0)
+    blocks.sort(key=lambda b: (b[1], b[0]))
+
+    out = []
+    for bi, b in enumerate(blocks):
+        x0,y0,x1,y1,text,*_ = b
+        t = " ".join(text.split())
+        if len(t) < MIN_CHARS:
+            continue
+        out.append((bi, (float(x0),float(y0),float(x1),float(y1)), t))
+    return out
+
+
+def _blocks_shard(pdf_path: str, pages: Sequence[int]) -> list:
+    """Worker: open the PDF from disk and extract blocks for a run of pages."""
+    d = pymupdf.open(pdf_path)
+    try:
+        return [(d[i].rect.width, d[i].rect.height, _blocks_page(d[i])) for i in pages]
+    finally:
+        d.close()
 
-    d = pymupdf.open(stream=pdf_bytes, filetype="pdf")
-    spans: List[Span] = []
-    ro = 0
 
-    for page_i in range(d.page_count):
-        page = d[page_i]
-        w, h = page.rect.width, page.rect.height
+def _extract_workers(workers: int, pages: Sequence[int]) -> int:
+    """Processes that will extract `pages`: 1 (serial, in-process) unless
+    `workers` > 1 and there are enough pages to amortize worker startup."""
+    if workers <= 1 or len(pages) < INGEST_PARALLEL_MIN_PAGES:
+        return 1
+    return min(workers, len(page_shards(pages, workers)))
 
-        # blocks: (x0,y0,x1,y1,"text", block_no, block_type)
-        blocks = page.get_text("blocks")
-        # sort by top-left reading order (good enough v0)
-        blocks.sort(key=lambda b: (b[1], b[0]))
 
-        for bi, b in enumerate(blocks):
-            x0,y0,x1,y1,text,*_ = b
-            t = " ".join(text.split())
-            if len(t) < MIN_CHARS:
-                continue
-            span = Span(
-                span_id=f"p{page_i:03d}_b{bi:03d}",
-                doc_id=doc_id,
-                page=page_i,
-                bbox_pdf=(float(x0),float(y0),float(x1),float(y1)),
-                bbox_norm=_norm_bbox((float(x0),float(y0),float(x1),float(y1)), w, h),
-                text=t,
-                reading_order=ro,
-                is_header=False,
-                is_footer=False,
-                source="pymupdf_blocks",
-            )
-            spans.append(span)
-            ro += 1
+def _blocks_pages(d, pdf_path: str, workers: int, pages: Sequence[int]) -> Iterator[tuple]:
+    """Yield (width, height, blocks) for each of `pages`, in order.
 
+    Runs serially in-process when `workers` is 1 (see _extract_workers), or
+    over page shards in a process pool. Parallel results are yielded shard
+    by shard in order, with a couple of shards per worker in flight.
+    """
+    if workers <= 1:
+        for i in pages:
+            yield (d[i].rect.width, d[i].rect.height, _blocks_page(d[i]))
+        return
+    shards = page_shards(pages, workers)
+    with process_pool(workers) as pool:
+        for shard in ordered_map(pool, _blocks_shard, [pdf_path] * len(shards), shards, in_flight=2 * workers):
+            yield from shard
+
+
+def iter_ingest_blocks(
+    doc_id: str,
+    *,
+    source_filename: str | None = None,
+    workers: int | None = None,
+    parent: str | None = None,
+) -> Iterator[dict]:
+    """Ingest a stored PDF with pymupdf text blocks, yielding progress events.
+
+    Yields a "page" event per page as its spans are appended to spans.jsonl,
+    then a "done" event carrying the document metadata. `workers` > 1
+    extracts pages in parallel processes (default METIS_INGEST_WORKERS;
+    0 = one per CPU). Output is identical to serial. Pages unchanged from
+    the `parent` doc_id (a previous version) are copied instead of extracted.
+    """
+    p = paths(doc_id)
+    workers = resolve_workers(INGEST_WORKERS if workers is None else workers)
+
+    d = open_pdf(p["pdf"])
     meta = {
         "doc_id": doc_id,
         "n_pages": d.page_count,
-        "n_spans": len(spans),
-        "ingest": {"engine": "pymupdf", "min_chars": MIN_CHARS},
+        "n_spans": 0,
+        "ingest": {"engine": "pymupdf", "min_chars": MIN_CHARS, "workers": workers, "pages_done": 0},
     }
     if source_filename:
         meta["source_filename"] = source_filename
-    write_json(p["doc"], meta)
-    write_spans_jsonl(p["spans"], spans)
-    return meta
+    timer = StageTimer()
+    with timer.stage("fingerprint"):
+        reuse, todo = _plan_pages(doc_id, d, meta, parent)
+    workers = meta["ingest"]["workers"] = _extract_workers(workers, todo)
+    with _PageSink(p, meta) as sink:
+        indexes = _IndexBuilder(d)
+        extracted = _blocks_pages(d, str(p["pdf"]), workers, todo)
+
+        # merge in page order so span_ids and reading_order match the serial engine
+        for page_i in range(d.page_count):
+            reused = reuse is not None and page_i in reuse.page_map
+            ro = meta["n_spans"]
+            if reused:
+                with timer.stage("reuse"):
+                    page_spans = reuse.take(doc_id, page_i, ro)
+            else:
+                with timer.stage("extract"):
+                    w, h, blocks = next(extracted)
+                with timer.stage("spans"):
+                    page_spans = [
+                        Span(
+                            span_id=f"p{page_i:03d}_b{bi:03d}",
+                            doc_id=doc_id,
+                            page=page_i,
+                            bbox_pdf=bbox_pdf,
+                            bbox_norm=_norm_bbox(bbox_pdf, w, h),
+                            text=t,
+                            reading_order=ro + k,
+                            is_header=False,
+                            is_footer=False,
+                            source="pymupdf_blocks",
+                        )
+                        for k, (bi, bbox_pdf, t) in enumerate(blocks)
+                    ]
+            with timer.stage("indexes"):
+                indexes.add_page(page_i, page_spans)
+            with timer.stage("write_spans"):
+                event = sink.add_page(page_i, page_spans, reused=reused)
+            yield event
+
+        with timer.stage("indexes"):
+            indexes.write(sink.out)
+        sink.finish(timer)
+    yield {"event": "done", "meta": meta}
+
+
+def iter_ingest_pdf_bytes(
+    pdf_bytes: bytes,
+    *,
+    source_filename: str | None = None,
+    workers: int | None = None,
+    parent: str | None = None,
+) -> Iterator[dict]:
+    return iter_ingest_blocks(store_pdf_bytes(pdf_bytes), source_filename=source_filename, workers=workers, parent=parent)
+
+
+def ingest_pdf_bytes(
+    pdf_bytes: bytes,
+    *,
+    source_filename: str | None = None,
+    workers: int | None = None,
+    parent: str | None = None,
+) -> dict:
+    """Ingest a PDF with pymupdf text blocks; see iter_ingest_blocks."""
+    return drain_ingest(iter_ingest_pdf_bytes(pdf_bytes, source_filename=source_filename, workers=workers, parent=parent))
 
 # ---------------------------------------------------------------------------
 # layout-based ingestion via pymupdf4llm
@@ -120,6 +383,50 @@ def _find_text_pos(page_text: str, needle: str) -> Tuple[int, int] | None:
     return (idx, idx + len(prefix))
 
 
+def _layout_shard(pdf_path: str, pages: Sequence[int], md_kwargs: dict) -> list:
+    """Worker: run pymupdf4llm over one run of pages of the PDF on disk."""
+    pymupdf4llm = ensure_pymupdf4llm()
+    doc = open_pdf(Path(pdf_path))
+    try:
+        # chunks may be defaultdicts with a lambda factory, which can't be pickled
+        return [dict(c) for c in pymupdf4llm.to_markdown(doc, pages=list(pages), **md_kwargs)]
+    finally:
+        doc.close()
+
+
+def _layout_chunks(
+    pymupdf4llm, doc, pdf_path: str, md_kwargs: dict, workers: int, pages: Sequence[int], window: int,
+) -> Iterator[dict]:
+    """Yield page chunks for each of `pages`, in order.
+
+    pymupdf4llm analyses each page independently, so running `to_markdown`
+    over single pages, or over page-range shards in worker processes, yields
+    the same chunks as one call. Shards are at most `window` pages and only
+    two per worker are in flight, so the chunks held in the parent stay
+    bounded by the window rather than the document. If the pool breaks (e.g.
+    a worker is killed for memory), the remaining pages are run serially.
+    """
+    done = 0
+    if workers > 1:
+        shards = page_shards(pages, workers, max_size=window)
+        n = len(shards)
+        try:
+            with process_pool(workers) as pool:
+                for shard in ordered_map(pool, _layout_shard, [pdf_path] * n, shards, [md_kwargs] * n, in_flight=2 * workers):
+                    for chunk in shard:
+                        yield chunk
+                        done += 1
+            return
+        except BrokenProcessPool as exc:
+            log.warning("parallel layout extraction failed (%s), continuing serially from page %d", exc, done)
+    if hasattr(pymupdf4llm, "IdentifyHeaders"):
+        # without pymupdf.layout, header levels come from a whole-document font
+        # scan that would otherwise be redone for every single-page call
+        md_kwargs = {**md_kwargs, "hdr_info": pymupdf4llm.IdentifyHeaders(doc)}
+    for page_i in pages[done:]:
+        yield pymupdf4llm.to_markdown(doc, pages=[page_i], **md_kwargs)[0]
+
+
 def _rect_to_tuple(r) -> Tuple[float, float, float, float]:
     """Convert a pymupdf Rect (or tuple/list) to a plain 4-tuple of floats."""
     if hasattr(r, "x0"):  # pymupdf.Rect
@@ -127,28 +434,179 @@ def _rect_to_tuple(r) -> Tuple[float, float, float, float]:
     return tuple(float(v) for v in r[:4])
 
 
-def ingest_pdf_bytes_layout(
-    pdf_bytes: bytes,
+def _layout_page_spans(doc_id: str, page_i: int, page, chunk: dict, ro: int) -> Tuple[List[Span], Counter]:
+    """Build one page's spans from its pymupdf4llm chunk, numbering reading order from `ro`."""
+    w, h = page.rect.width, page.rect.height
+    page_text: str = chunk.get("text", "")
+    spans: List[Span] = []
+
+    page_counter: Counter = Counter()
+    page_boxes = chunk.get("page_boxes")
+
+    if page_boxes is not None:
+        # --- pymupdf_layout path: iterate classified page_boxes ---
+        for li, box in enumerate(page_boxes):
+            kind = box.get("class") or box.get("type") or "unknown"
+            bbox_raw = box.get("bbox")
+            if bbox_raw is None:
+                log.warning("page %d box %d (%s): no bbox, skipping", page_i, li, kind)
+                continue
+            bbox_pdf = _rect_to_tuple(bbox_raw)
+
+            pos_raw = box.get("pos")
+            pos = tuple(int(v) for v in pos_raw) if pos_raw is not None else None
+
+            # Extract span text from page markdown via pos
+            if pos is not None and kind != "picture":
+                text = page_text[pos[0]:pos[1]]
+                text = " ".join(text.split())
+            elif kind == "picture":
+                text = "[[PICTURE]]"
+            else:
+                text = ""
+
+            # MIN_CHARS filter only for text-like kinds
+            if kind in ("text", "table") and len(text) < MIN_CHARS:
+                continue
+
+            page_counter[kind] += 1
+            span = Span(
+                span_id=f"p{page_i:03d}_L{li:04d}",
+                doc_id=doc_id,
+                page=page_i,
+                bbox_pdf=bbox_pdf,
+                bbox_norm=_norm_bbox(bbox_pdf, w, h),
+                text=text,
+                reading_order=ro,
+                is_header=(kind == "page-header"),
+                is_footer=(kind == "page-footer"),
+                kind=kind,
+                pos=pos,
+                source="pymupdf4llm_page_boxes",
+            )
+            spans.append(span)
+            ro += 1
+    else:
+        # --- Fallback path (no pymupdf_layout): blocks + tables/images ---
+        li = 0
+        # Text blocks from pymupdf
+        blocks = page.get_text("blocks")
+        blocks.sort(key=lambda b: (b[1], b[0]))
+        for bi, b in enumerate(blocks):
+            x0, y0, x1, y1, text_raw, *rest = b
+            block_type = rest[1] if len(rest) > 1 else 0
+            if block_type != 0:
+                continue
+            t = " ".join(text_raw.split())
+            if len(t) < MIN_CHARS:
+                continue
+            bbox_pdf = (float(x0), float(y0), float(x1), float(y1))
+            pos = _find_text_pos(page_text, t)
+            page_counter["text"] += 1
+            spans.append(Span(
+                span_id=f"p{page_i:03d}_L{li:04d}",
+                doc_id=doc_id, page=page_i,
+                bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
+                text=t, reading_order=ro,
+                kind="text", pos=pos, source="pymupdf4llm_layout",
+            ))
+            ro += 1; li += 1
+
+        # Tables
+        for tbl in (chunk.get("tables") or []):
+            bbox_raw = tbl.get("bbox")
+            if bbox_raw is None:
+                continue
+            bbox_pdf = _rect_to_tuple(bbox_raw)
+            rect = pymupdf.Rect(bbox_pdf)
+            tbl_text = " ".join(page.get_text("text", clip=rect).split())
+            page_counter["table"] += 1
+            spans.append(Span(
+                span_id=f"p{page_i:03d}_L{li:04d}",
+                doc_id=doc_id, page=page_i,
+                bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
+                text=tbl_text if len(tbl_text) >= MIN_CHARS else f"[[TABLE {tbl.get('rows',0)}x{tbl.get('columns',0)}]]",
+                reading_order=ro, kind="table", source="pymupdf4llm_layout",
+            ))
+            ro += 1; li += 1
+
+        # Images
+        for img in (chunk.get("images") or []):
+            bbox_raw = img.get("bbox")
+            if bbox_raw is None:
+                continue
+            bbox_pdf = _rect_to_tuple(bbox_raw)
+            page_counter["picture"] += 1
+            spans.append(Span(
+                span_id=f"p{page_i:03d}_L{li:04d}",
+                doc_id=doc_id, page=page_i,
+                bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
+                text="[[PICTURE]]", reading_order=ro,
+                kind="picture", source="pymupdf4llm_layout",
+            ))
+            ro += 1; li += 1
+
+        # Graphics
+        for gfx in (chunk.get("graphics") or []):
+            bbox_raw = gfx.get("bbox")
+            if bbox_raw is None:
+                continue
+            bbox_pdf = _rect_to_tuple(bbox_raw)
+            page_counter["graphic"] += 1
+            spans.append(Span(
+                span_id=f"p{page_i:03d}_L{li:04d}",
+                doc_id=doc_id, page=page_i,
+                bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
+                text="[[GRAPHIC]]", reading_order=ro,
+                kind="graphic", source="pymupdf4llm_layout",
+            ))
+            ro += 1; li += 1
+
+    return spans, page_counter
+
+
+def iter_ingest_layout(
+    doc_id: str,
     *,
     extract_words: bool = False,
     write_images: bool = False,
     dpi: int = 200,
     source_filename: str | None = None,
-) -> dict:
-    """Ingest a PDF using pymupdf4llm for layout-aware spans.
+    workers: int | None = None,
+    parent: str | None = None,
+    out: Dict[str, Path] | None = None,
+    window: int | None = None,
+    defer_enrichment: bool | None = None,
+) -> Iterator[dict]:
+    """Ingest a stored PDF using pymupdf4llm for layout-aware spans, yielding progress events.
 
     With pymupdf_layout installed, chunks contain `page_boxes` with classified
     regions (text, title, picture, section-header, caption, etc.) and char
     offsets into the page markdown. Without it, falls back to pymupdf blocks
     + separate tables/images/graphics lists.
+
+    Pages are processed in windows of `window` pages (default
+    METIS_INGEST_WINDOW_PAGES): each window's spans are enriched and appended
+    to spans.jsonl ("page" events), and its markdown and words are streamed to
+    their files, so finished pages are queryable early and spans, markdown
+    and words are not held for the whole document. The side indexes are
+    built from compact per-page arrays (see _IndexBuilder), which do grow
+    with the page count, and written last, then a "done" event with the
+    metadata.
+    `workers` > 1 runs layout analysis over page shards in parallel processes
+    (default METIS_INGEST_WORKERS; 0 = one per CPU). Pages unchanged from the
+    `parent` doc_id (a previous version ingested with the same settings) take
+    its spans, markdown and words instead of being analysed again. `out`
+    redirects the output files (same keys as `paths`) to a staging location.
     """
     pymupdf4llm = ensure_pymupdf4llm()
+    workers = resolve_workers(INGEST_WORKERS if workers is None else workers)
+    window = max(1, INGEST_WINDOW_PAGES if window is None else window)
+    # staged output (tier upgrade) is always enriched inline
+    defer = ENABLE_ENRICHMENT and out is None and (DEFER_ENRICHMENT if defer_enrichment is None else defer_enrichment)
 
-    doc_id = doc_id_from_bytes(pdf_bytes)
-    p = paths(doc_id)
-    p["pdf"].write_bytes(pdf_bytes)
-
-    doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+    p = out or paths(doc_id)
+    doc = open_pdf(p["pdf"])
 
     # Prepare image output directory if requested
     image_path = None
@@ -168,179 +626,194 @@ def ingest_pdf_bytes_layout(
         md_kwargs["image_path"] = str(image_path)
         md_kwargs["dpi"] = dpi
 
-    chunks = pymupdf4llm.to_markdown(doc, **md_kwargs)
-
-    spans: List[Span] = []
-    page_md: Dict[str, str] = {}    # str(page_i) -> markdown text (str keys for JSON)
-    words_by_page: Dict[str, list] = {}
-    ro = 0
-    total_counter: Counter = Counter()
-
-    for page_i, chunk in enumerate(chunks):
-        page = doc[page_i]
-        w, h = page.rect.width, page.rect.height
-
-        page_text: str = chunk.get("text", "")
-        page_md[str(page_i)] = page_text
-
-        if extract_words and "words" in chunk:
-            # words are tuples: (x0, y0, x1, y1, word, block_no, line_no, word_no)
-            # store as-is for debug rendering
-            words_by_page[str(page_i)] = chunk["words"]
-
-        page_counter: Counter = Counter()
-        page_boxes = chunk.get("page_boxes")
-
-        if page_boxes is not None:
-            # --- pymupdf_layout path: iterate classified page_boxes ---
-            for li, box in enumerate(page_boxes):
-                kind = box.get("class") or box.get("type") or "unknown"
-                bbox_raw = box.get("bbox")
-                if bbox_raw is None:
-                    log.warning("page %d box %d (%s): no bbox, skipping", page_i, li, kind)
-                    continue
-                bbox_pdf = _rect_to_tuple(bbox_raw)
-
-                pos_raw = box.get("pos")
-                pos = tuple(int(v) for v in pos_raw) if pos_raw is not None else None
-
-                # Extract span text from page markdown via pos
-                if pos is not None and kind != "picture":
-                    text = page_text[pos[0]:pos[1]]
-                    text = " ".join(text.split())
-                elif kind == "picture":
-                    text = "[[PICTURE]]"
-                else:
-                    text = ""
-
-                # MIN_CHARS filter only for text-like kinds
-                if kind in ("text", "table") and len(text) < MIN_CHARS:
-                    continue
-
-                page_counter[kind] += 1
-                span = Span(
-                    span_id=f"p{page_i:03d}_L{li:04d}",
-                    doc_id=doc_id,
-                    page=page_i,
-                    bbox_pdf=bbox_pdf,
-                    bbox_norm=_norm_bbox(bbox_pdf, w, h),
-                    text=text,
-                    reading_order=ro,
-                    is_header=(kind == "page-header"),
-                    is_footer=(kind == "page-footer"),
-                    kind=kind,
-                    pos=pos,
-                    source="pymupdf4llm_page_boxes",
-                )
-                spans.append(span)
-                ro += 1
-        else:
-            # --- Fallback path (no pymupdf_layout): blocks + tables/images ---
-            li = 0
-            # Text blocks from pymupdf
-            blocks = page.get_text("blocks")
-            blocks.sort(key=lambda b: (b[1], b[0]))
-            for bi, b in enumerate(blocks):
-                x0, y0, x1, y1, text_raw, *rest = b
-                block_type = rest[1] if len(rest) > 1 else 0
-                if block_type != 0:
-                    continue
-                t = " ".join(text_raw.split())
-                if len(t) < MIN_CHARS:
-                    continue
-                bbox_pdf = (float(x0), float(y0), float(x1), float(y1))
-                pos = _find_text_pos(page_text, t)
-                page_counter["text"] += 1
-                spans.append(Span(
-                    span_id=f"p{page_i:03d}_L{li:04d}",
-                    doc_id=doc_id, page=page_i,
-                    bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
-                    text=t, reading_order=ro,
-                    kind="text", pos=pos, source="pymupdf4llm_layout",
-                ))
-                ro += 1; li += 1
-
-            # Tables
-            for tbl in (chunk.get("tables") or []):
-                bbox_raw = tbl.get("bbox")
-                if bbox_raw is None:
-                    continue
-                bbox_pdf = _rect_to_tuple(bbox_raw)
-                rect = pymupdf.Rect(bbox_pdf)
-                tbl_text = " ".join(page.get_text("text", clip=rect).split())
-                page_counter["table"] += 1
-                spans.append(Span(
-                    span_id=f"p{page_i:03d}_L{li:04d}",
-                    doc_id=doc_id, page=page_i,
-                    bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
-                    text=tbl_text if len(tbl_text) >= MIN_CHARS else f"[[TABLE {tbl.get('rows',0)}x{tbl.get('columns',0)}]]",
-                    reading_order=ro, kind="table", source="pymupdf4llm_layout",
-                ))
-                ro += 1; li += 1
-
-            # Images
-            for img in (chunk.get("images") or []):
-                bbox_raw = img.get("bbox")
-                if bbox_raw is None:
-                    continue
-                bbox_pdf = _rect_to_tuple(bbox_raw)
-                page_counter["picture"] += 1
-                spans.append(Span(
-                    span_id=f"p{page_i:03d}_L{li:04d}",
-                    doc_id=doc_id, page=page_i,
-                    bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
-                    text="[[PICTURE]]", reading_order=ro,
-                    kind="picture", source="pymupdf4llm_layout",
-                ))
-                ro += 1; li += 1
-
-            # Graphics
-            for gfx in (chunk.get("graphics") or []):
-                bbox_raw = gfx.get("bbox")
-                if bbox_raw is None:
-                    continue
-                bbox_pdf = _rect_to_tuple(bbox_raw)
-                page_counter["graphic"] += 1
-                spans.append(Span(
-                    span_id=f"p{page_i:03d}_L{li:04d}",
-                    doc_id=doc_id, page=page_i,
-                    bbox_pdf=bbox_pdf, bbox_norm=_norm_bbox(bbox_pdf, w, h),
-                    text="[[GRAPHIC]]", reading_order=ro,
-                    kind="graphic", source="pymupdf4llm_layout",
-                ))
-                ro += 1; li += 1
-
-        total_counter += page_counter
-        log.info("page %d: %s", page_i, dict(page_counter))
-
-    log.info("total spans: %d, region counts: %s", len(spans), dict(total_counter))
-
-    # --- Multimodal enrichment (optional) ---
-    if ENABLE_ENRICHMENT:
-        spans = enrich_visual_spans(spans, pdf_bytes)
-
     meta = {
         "doc_id": doc_id,
         "n_pages": doc.page_count,
-        "n_spans": len(spans),
+        "n_spans": 0,
         "ingest": {
             "engine": "pymupdf4llm",
             "min_chars": MIN_CHARS,
             "extract_words": extract_words,
             "write_images": write_images,
             "dpi": dpi,
+            "workers": workers,
+            "window": window,
+            "pages_done": 0,
         },
     }
     if source_filename:
         meta["source_filename"] = source_filename
+    timer = StageTimer()
+    with timer.stage("fingerprint"):
+        reuse, todo = _plan_pages(doc_id, doc, meta, parent)
+    workers = meta["ingest"]["workers"] = _extract_workers(workers, todo)
+    with _PageSink(p, meta) as sink:
+        indexes = _IndexBuilder(doc)
+        page_md = JsonMapWriter(p["page_md"])    # str(page_i) -> markdown text (str keys for JSON)
+        # words sidecar next to page_md, only written if any page has words
+        words_out = JsonMapWriter(p["page_md"].with_suffix(".words.json"), write_empty=False)
+        total_counter: Counter = Counter()
+        ro = 0
+        pending: list = []    # (page_i, spans, counter, reused, words) of the current window
+        # the process-wide enrichment workers (METIS_ENRICH_WORKERS); the time budget is this document's
+        enricher, budget = shared_executor(), EnrichBudget()
+
+        def flush() -> Iterator[dict]:
+            spans = [s for item in pending for s in item[1]]
+            # --- Multimodal enrichment (optional) ---
+            if ENABLE_ENRICHMENT and not defer:
+                with timer.stage("enrichment"):
+                    spans = enricher.enrich(
+                        spans, p["pdf"], stats=meta["ingest"].setdefault("enrichment", {}), budget=budget,
+                    )
+            start = 0
+            for page_i, page_spans, page_counter, reused, words in pending:
+                page_spans = spans[start:start + len(page_spans)]
+                start += len(page_spans)
+                with timer.stage("indexes"):
+                    indexes.add_page(page_i, page_spans, words)
+                with timer.stage("write_spans"):
+                    event = sink.add_page(page_i, page_spans, page_counter, reused=reused)
+                yield event
+            pending.clear()
+
+        chunks = _layout_chunks(pymupdf4llm, doc, str(p["pdf"]), md_kwargs, workers, todo, window)
+        for page_i in range(doc.page_count):
+            reused = reuse is not None and page_i in reuse.page_map
+            page_counter = None
+            words = None
+            if reused:
+                with timer.stage("reuse"):
+                    src = str(reuse.page_map[page_i])
+                    md = reuse.page_md.get(src, "")
+                    words = reuse.words.get(src)
+                    page_spans = reuse.take(doc_id, page_i, ro)
+            else:
+                with timer.stage("to_markdown"):
+                    chunk = next(chunks)
+                with timer.stage("spans"):
+                    md = chunk.get("text", "")
+
+                    if extract_words and "words" in chunk:
+                        # words are tuples: (x0, y0, x1, y1, word, block_no, line_no, word_no)
+                        # store as-is for debug rendering
+                        words = chunk["words"]
+
+                    page_spans, page_counter = _layout_page_spans(doc_id, page_i, doc[page_i], chunk, ro)
+                    del chunk
+                total_counter += page_counter
+                log.info("page %d: %s", page_i, dict(page_counter))
+            ro += len(page_spans)
+            with timer.stage("write_page_md"):
+                page_md.add(str(page_i), md)
+                if words is not None:
+                    words_out.add(str(page_i), words)
+            pending.append((page_i, page_spans, page_counter, reused, words))
+            if len(pending) >= window:
+                yield from flush()
+        yield from flush()
+
+        log.info("total spans: %d, region counts: %s", ro, dict(total_counter))
+
+        with timer.stage("write_page_md"):
+            page_md.close()
+            words_out.close()
+        with timer.stage("indexes"):
+            indexes.write(sink.out)
+
+        if defer:
+            meta["enrichment"] = {"status": "pending"}
+        sink.finish(timer)
+    if defer:
+        start_enrichment(doc_id)
+    yield {"event": "done", "meta": meta}
+
+
+def iter_ingest_pdf_bytes_layout(
+    pdf_bytes: bytes,
+    *,
+    extract_words: bool = False,
+    write_images: bool = False,
+    dpi: int = 200,
+    source_filename: str | None = None,
+    workers: int | None = None,
+    parent: str | None = None,
+    window: int | None = None,
+    defer_enrichment: bool | None = None,
+) -> Iterator[dict]:
+    return iter_ingest_layout(
+        store_pdf_bytes(pdf_bytes),
+        extract_words=extract_words,
+        write_images=write_images,
+        dpi=dpi,
+        source_filename=source_filename,
+        workers=workers,
+        parent=parent,
+        window=window,
+        defer_enrichment=defer_enrichment,
+    )
+
 
-    write_json(p["doc"], meta)
-    write_spans_jsonl(p["spans"], spans)
-    write_json(p["page_md"], page_md)
+def ingest_pdf_bytes_layout(
+    pdf_bytes: bytes,
+    *,
+    extract_words: bool = False,
+    write_images: bool = False,
+    dpi: int = 200,
+    source_filename: str | None = None,
+    workers: int | None = None,
+    parent: str | None = None,
+    window: int | None = None,
+    defer_enrichment: bool | None = None,
+) -> dict:
+    """Ingest a PDF using pymupdf4llm; see iter_ingest_layout."""
+    return drain_ingest(iter_ingest_pdf_bytes_layout(
+        pdf_bytes,
+        extract_words=extract_words,
+        write_images=write_images,
+        dpi=dpi,
+        source_filename=source_filename,
+        workers=workers,
+        parent=parent,
+        window=window,
+        defer_enrichment=defer_enrichment,
+    ))
 
-    # Store words if extracted (sidecar file next to page_md)
-    if words_by_page:
-        words_path = p["page_md"].with_suffix(".words.json")
-        write_json(words_path, words_by_page)
+# ---------------------------------------------------------------------------
+# engine dispatch for stored documents
+# ---------------------------------------------------------------------------
 
-    return meta
+def iter_ingest(
+    doc_id: str,
+    *,
+    engine: str = "layout",
+    extract_words: bool = False,
+    write_images: bool = False,
+    dpi: int = 200,
+    source_filename: str | None = None,
+    workers: int | None = None,
+    parent: str | None = None,
+    window: int | None = None,
+    defer_enrichment: bool | None = None,
+) -> Iterator[dict]:
+    """Ingest a PDF already in the store (see store_pdf) with the "layout" or "blocks" engine.
+
+    `parent` names a previous version of the document whose unchanged pages
+    are reused (see core.lineage). `window` (layout engine only) is the
+    number of pages processed and flushed at a time; `defer_enrichment`
+    (layout engine only) moves enrichment to a background job (see
+    core.deferred).
+    """
+    if engine == "layout":
+        return iter_ingest_layout(
+            doc_id,
+            extract_words=extract_words,
+            write_images=write_images,
+            dpi=dpi,
+            source_filename=source_filename,
+            workers=workers,
+            parent=parent,
+            window=window,
+            defer_enrichment=defer_enrichment,
+        )
+    return iter_ingest_blocks(doc_id, source_filename=source_filename, workers=workers, parent=parent)
@@ -0,0 +1,130 @@
+"""Per-page fingerprints and reuse of unchanged pages from a previous version.
+
+A page fingerprint hashes what extraction depends on: the page geometry, its
+decompressed content streams and the raw streams of the images and form
+XObjects it draws. It needs no rendering or text extraction (about a
+millisecond per page).
+
+When a new version of a document is ingested with its predecessor named as
+`parent`, every page whose fingerprint matches a parent page takes that page's
+spans (already enriched), markdown and words instead of being re-extracted.
+Reused spans keep their text, so `vectorize_spans` can also copy their
+embeddings from the parent.
+"""
+from __future__ import annotations
+import hashlib
+from dataclasses import dataclass, field, replace
+from typing import Dict, List
+
+import orjson
+
+from .schema import Span
+from .store import ingest_complete, iter_spans_jsonl, open_pdf, paths, read_json_map, write_json
+
+# ingest settings that must match for a parent page's output to be reusable
+REUSE_SETTINGS = ("engine", "min_chars", "extract_words", "write_images", "dpi")
+
+
+def page_fingerprint(doc, page) -> str:
+    h = hashlib.sha256()
+    h.update(repr((tuple(page.rect), page.rotation)).encode())
+    h.update(page.read_contents())
+    for xref in sorted({img[0] for img in page.get_images(full=True)} | {x[0] for x in page.get_xobjects()}):
+        h.update(doc.xref_stream_raw(xref) or b"")
+    return h.hexdigest()
+
+
+def page_fingerprints(doc) -> List[str]:
+    return [page_fingerprint(doc, page) for page in doc]
+
+
+def write_fingerprints(doc_id: str, fingerprints: List[str]) -> None:
+    write_json(paths(doc_id)["fingerprints"], fingerprints)
+
+
+def read_fingerprints(doc_id: str) -> List[str]:
+    """A document's page fingerprints, computed from its PDF for older docs."""
+    p = paths(doc_id)
+    if p["fingerprints"].exists():
+        return orjson.loads(p["fingerprints"].read_bytes())
+    doc = open_pdf(p["pdf"])
+    try:
+        fps = page_fingerprints(doc)
+    finally:
+        doc.close()
+    write_fingerprints(doc_id, fps)
+    return fps
+
+
+@dataclass
+class ParentPages:
+    """Reusable output of a parent document, indexed by parent page number.
+
+    Only the pages in `page_map` are loaded.
+    """
+    doc_id: str
+    page_map: Dict[int, int]                     # new page -> parent page
+    spans: Dict[int, List[Span]] = field(default_factory=dict)
+    page_md: Dict[str, str] = field(default_factory=dict)
+    words: Dict[str, list] = field(default_factory=dict)
+
+    def take(self, doc_id: str, page_i: int, ro: int) -> List[Span]:
+        """The parent's spans for the page reused as `page_i`, renumbered for this document."""
+        src = self.page_map[page_i]
+        old, new = f"p{src:03d}_", f"p{page_i:03d}_"
+        return [
+            replace(
+                s,
+                doc_id=doc_id,
+                page=page_i,
+                span_id=new + s.span_id[len(old):] if s.span_id.startswith(old) else s.span_id,
+                reading_order=ro + k,
+            )
+            for k, s in enumerate(self.spans.get(src, []))
+        ]
+
+
+def plan_reuse(parent: str | None, fingerprints: List[str], settings: dict) -> ParentPages | None:
+    """Match this document's pages against `parent`'s; None if nothing can be reused.
+
+    The parent must be fully ingested with the same settings (REUSE_SETTINGS).
+    """
+    if not parent:
+        return None
+    pp = paths(parent)
+    if not (pp["spans"].exists() and ingest_complete(parent)):
+        return None
+    ingest = orjson.loads(pp["doc"].read_bytes()).get("ingest", {})
+    if any(ingest.get(k) != settings.get(k) for k in REUSE_SETTINGS):
+        return None
+
+    by_fp: Dict[str, int] = {}
+    for i, fp in enumerate(read_fingerprints(parent)):
+        by_fp.setdefault(fp, i)
+    page_map = {i: by_fp[fp] for i, fp in enumerate(fingerprints) if fp in by_fp}
+    if not page_map:
+        return None
+
+    reused = ParentPages(doc_id=parent, page_map=page_map)
+    wanted = set(page_map.values())
+    for s in iter_spans_jsonl(pp["spans"]):
+        if s.page in wanted:
+            reused.spans.setdefault(s.page, []).append(s)
+    wanted_keys = [str(i) for i in wanted]
+    if pp["page_md"].exists():
+        reused.page_md = read_json_map(pp["page_md"], wanted_keys)
+    words_path = pp["page_md"].with_suffix(".words.json")
+    if words_path.exists():
+        reused.words = read_json_map(words_path, wanted_keys)
+    return reused
+
+
+def lineage(parent: ParentPages | None, parent_id: str | None) -> dict | None:
+    """The `lineage` record stored in doc.json (None when no parent was given)."""
+    if not parent_id:
+        return None
+    return {
+        "parent": parent_id,
+        # new page -> parent page it was copied from (JSON object keys are strings)
+        "reused_pages": {str(k): v for k, v in sorted(parent.page_map.items())} if parent else {},
+    }
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 from dataclasses import dataclass
-from typing import Iterator, Protocol
+from typing import AsyncIterator, Iterator, Protocol
 
 from .schema import Message, ToolCall
 
@@ -23,6 +23,7 @@ class StreamEvent:
     evidence: list[dict] | None = None
     tool_call_id: str | None = None
     tool_name: str | None = None
+    stats: dict | None = None  # agent_done: {"tool_cache": {tool: {"hits", "misses"}}} for the turn
 
 
 class ChatModel(Protocol):
@@ -35,13 +36,147 @@ class ChatModel(Protocol):
         ...
 
 
+class AsyncChatModel(Protocol):
+    def astream(
+        self,
+        messages: list[Message],
+        tools: list[ToolDef],
+        system: str,
+    ) -> AsyncIterator[StreamEvent]:
+        ...
+
+
+class _AnthropicStreamDecoder:
+    """Turns Anthropic stream events into StreamEvents (shared by stream and astream)."""
+
+    def __init__(self):
+        self.tool_name: str | None = None
+        self.tool_id: str | None = None
+        self.json = ""
+
+    def feed(self, event) -> StreamEvent | None:
+        if event.type == "content_block_start":
+            block = event.content_block
+            if block.type == "tool_use":
+                self.tool_name = block.name
+                self.tool_id = block.id
+                self.json = ""
+                return StreamEvent(kind="tool_call_start", text=block.name)
+        elif event.type == "content_block_delta":
+            delta = event.delta
+            if delta.type == "text_delta":
+                return StreamEvent(kind="text_delta", text=delta.text)
+            elif delta.type == "input_json_delta":
+                self.json += delta.partial_json
+                return StreamEvent(kind="tool_call_delta", text=delta.partial_json)
+        elif event.type == "content_block_stop":
+            if self.tool_name is not None:
+                args = json.loads(self.json) if self.json else {}
+                ev = StreamEvent(
+                    kind="tool_call_done",
+                    tool_call=ToolCall(
+                        id=self.tool_id,
+                        name=self.tool_name,
+                        arguments=args,
+                    ),
+                )
+                self.tool_name = None
+                self.tool_id = None
+                self.json = ""
+                return ev
+        return None
+
+    @staticmethod
+    def message_done(response) -> StreamEvent:
+        """Assemble the final message from the completed response."""
+        text_parts = []
+        tool_calls = []
+        for block in response.content:
+            if block.type == "text":
+                text_parts.append(block.text)
+            elif block.type == "tool_use":
+                tool_calls.append(ToolCall(
+                    id=block.id,
+                    name=block.name,
+                    arguments=block.input,
+                ))
+        final_msg = Message(
+            role="assistant",
+            content="".join(text_parts) if text_parts else None,
+            tool_calls=tool_calls if tool_calls else None,
+        )
+        return StreamEvent(kind="message_done", message=final_msg)
+
+
+class _OpenAIStreamDecoder:
+    """Turns OpenAI chat-completion chunks into StreamEvents (shared by stream and astream)."""
+
+    def __init__(self):
+        self.text_parts: list[str] = []
+        self.tool_calls_by_index: dict[int, dict] = {}
+
+    def feed(self, chunk) -> Iterator[StreamEvent]:
+        delta = chunk.choices[0].delta if chunk.choices else None
+        if delta is None:
+            return
+
+        if delta.content:
+            self.text_parts.append(delta.content)
+            yield StreamEvent(kind="text_delta", text=delta.content)
+
+        if delta.tool_calls:
+            for tc_delta in delta.tool_calls:
+                idx = tc_delta.index
+                if idx not in self.tool_calls_by_index:
+                    self.tool_calls_by_index[idx] = {
+                        "id": tc_delta.id or "",
+                        "name": "",
+                        "arguments": "",
+                    }
+                    yield StreamEvent(kind="tool_call_start", text=tc_delta.function.name if tc_delta.function and tc_delta.function.name else "")
+                entry = self.tool_calls_by_index[idx]
+                if tc_delta.id:
+                    entry["id"] = tc_delta.id
+                if tc_delta.function:
+                    if tc_delta.function.name:
+                        entry["name"] = tc_delta.function.name
+                    if tc_delta.function.arguments:
+                        entry["arguments"] += tc_delta.function.arguments
+                        yield StreamEvent(kind="tool_call_delta", text=tc_delta.function.arguments)
+
+    def finish(self) -> Iterator[StreamEvent]:
+        # Assemble final message
+        assembled_tool_calls = []
+        for idx in sorted(self.tool_calls_by_index):
+            entry = self.tool_calls_by_index[idx]
+            args = json.loads(entry["arguments"]) if entry["arguments"] else {}
+            tc = ToolCall(id=entry["id"], name=entry["name"], arguments=args)
+            assembled_tool_calls.append(tc)
+            yield StreamEvent(kind="tool_call_done", tool_call=tc)
+
+        final_msg = Message(
+            role="assistant",
+            content="".join(self.text_parts) if self.text_parts else None,
+            tool_calls=assembled_tool_calls if assembled_tool_calls else None,
+        )
+        yield StreamEvent(kind="message_done", message=final_msg)
+
+
 class AnthropicModel:
     def __init__(self, api_key: str, model: str, temperature: float = 0.0):
         import anthropic
         self._client = anthropic.Anthropic(api_key=api_key)
+        self._api_key = api_key
+        self._aclient = None
         self._model = model
         self._temperature = temperature
 
+    def _async_client(self):
+        if self._aclient is None:
+            import anthropic
+            self._aclient = anthropic.AsyncAnthropic(api_key=self._api_key)
+        return self._aclient
+
     def _to_anthropic_messages(self, messages: list[Message]) -> list[dict]:
         out = []
         for m in messages:
@@ -92,80 +227,58 @@ class AnthropicModel:
         tools: list[ToolDef],
         system: str,
     ) -> Iterator[StreamEvent]:
+        with self._client.messages.stream(**self._request(messages, tools, system)) as stream:
+            decoder = _AnthropicStreamDecoder()
+            for event in stream:
+                ev = decoder.feed(event)
+                if ev is not None:
+                    yield ev
+            yield decoder.message_done(stream.get_final_message())
+
+    async def astream(
+        self,
+        messages: list[Message],
+        tools: list[ToolDef],
+        system: str,
+    ) -> AsyncIterator[StreamEvent]:
+        """`stream` on the async client: no thread is held while waiting on the API."""
+        async with self._async_client().messages.stream(**self._request(messages, tools, system)) as stream:
+            decoder = _AnthropicStreamDecoder()
+            async for event in stream:
+                ev = decoder.feed(event)
+                if ev is not None:
+                    yield ev
+            yield decoder.message_done(await stream.get_final_message())
+
+    def _request(self, messages: list[Message], tools: list[ToolDef], system: str) -> dict:
         import anthropic as anthropic_module
-        api_messages = self._to_anthropic_messages(messages)
         api_tools = self._to_anthropic_tools(tools)
-
-        with self._client.messages.stream(
+        return dict(
             model=self._model,
             max_tokens=4096,
             system=system,
-            messages=api_messages,
+            messages=self._to_anthropic_messages(messages),
             tools=api_tools if api_tools else anthropic_module.NOT_GIVEN,
             temperature=self._temperature,
-        ) as stream:
-            current_tool_name = None
-            current_tool_id = None
-            accumulated_json = ""
-
-            for event in stream:
-                if event.type == "content_block_start":
-                    block = event.content_block
-                    if block.type == "tool_use":
-                        current_tool_name = block.name
-                        current_tool_id = block.id
-                        accumulated_json = ""
-                        yield StreamEvent(kind="tool_call_start", text=block.name)
-                elif event.type == "content_block_delta":
-                    delta = event.delta
-                    if delta.type == "text_delta":
-                        yield StreamEvent(kind="text_delta", text=delta.text)
-                    elif delta.type == "input_json_delta":
-                        accumulated_json += delta.partial_json
-                        yield StreamEvent(kind="tool_call_delta", text=delta.partial_json)
-                elif event.type == "content_block_stop":
-                    if current_tool_name is not None:
-                        args = json.loads(accumulated_json) if accumulated_json else {}
-                        yield StreamEvent(
-                            kind="tool_call_done",
-                            tool_call=ToolCall(
-                                id=current_tool_id,
-                                name=current_tool_name,
-                                arguments=args,
-                            ),
-                        )
-                        current_tool_name = None
-                        current_tool_id = None
-                        accumulated_json = ""
-
-            # Assemble final message from the completed response
-            response = stream.get_final_message()
-            text_parts = []
-            tool_calls = []
-            for block in response.content:
-                if block.type == "text":
-                    text_parts.append(block.text)
-                elif block.type == "tool_use":
-                    tool_calls.append(ToolCall(
-                        id=block.id,
-                        name=block.name,
-                        arguments=block.input,
-                    ))
-            final_msg = Message(
-                role="assistant",
-                content="".join(text_parts) if text_parts else None,
-                tool_calls=tool_calls if tool_calls else None,
-            )
-            yield StreamEvent(kind="message_done", message=final_msg)
+        )
 
 
 class OpenAIModel:
+    _base_url: str | None = None
+
     def __init__(self, api_key: str, model: str, temperature: float = 0.0):
         import openai
-        self._client = openai.OpenAI(api_key=api_key)
+        self._client = openai.OpenAI(api_key=api_key, base_url=self._base_url)
+        self._api_key = api_key
+        self._aclient = None
         self._model = model
         self._temperature = temperature
 
+    def _async_client(self):
+        if self._aclient is None:
+            import openai
+            self._aclient = openai.AsyncOpenAI(api_key=self._api_key, base_url=self._base_url)
+        return self._aclient
 
     def _to_openai_messages(self, messages: list[Message], system: str) -> list[dict]:
         out = [{"role": "system", "content": system}]
@@ -217,77 +330,41 @@ class OpenAIModel:
         tools: list[ToolDef],
         system: str,
     ) -> Iterator[StreamEvent]:
-        api_messages = self._to_openai_messages(messages, system)
-        api_tools = self._to_openai_tools(tools)
+        response = self._client.chat.completions.create(**self._request(messages, tools, system))
+        decoder = _OpenAIStreamDecoder()
+        for chunk in response:
+            yield from decoder.feed(chunk)
+        yield from decoder.finish()
 
+    async def astream(
+        self,
+        messages: list[Message],
+        tools: list[ToolDef],
+        system: str,
+    ) -> AsyncIterator[StreamEvent]:
+        """`stream` on the async client: no thread is held while waiting on the API."""
+        response = await self._async_client().chat.completions.create(**self._request(messages, tools, system))
+        decoder = _OpenAIStreamDecoder()
+        async for chunk in response:
+            for ev in decoder.feed(chunk):
+                yield ev
+        for ev in decoder.finish():
+            yield ev
+
+    def _request(self, messages: list[Message], tools: list[ToolDef], system: str) -> dict:
         kwargs = dict(
             model=self._model,
-            messages=api_messages,
+            messages=self._to_openai_messages(messages, system),
             temperature=self._temperature,
             stream=True,
         )
+        api_tools = self._to_openai_tools(tools)
         if api_tools:
             kwargs["tools"] = api_tools
-
-        response = self._client.chat.completions.create(**kwargs)
-
-        text_parts = []
-        tool_calls_by_index: dict[int, dict] = {}
-
-        for chunk in response:
-            delta = chunk.choices[0].delta if chunk.choices else None
-            if delta is None:
-                continue
-
-            if delta.content:
-                text_parts.append(delta.content)
-                yield StreamEvent(kind="text_delta", text=delta.content)
-
-            if delta.tool_calls:
-                for tc_delta in delta.tool_calls:
-                    idx = tc_delta.index
-                    if idx not in tool_calls_by_index:
-                        tool_calls_by_index[idx] = {
-                            "id": tc_delta.id or "",
-                            "name": "",
-                            "arguments": "",
-                        }
-                        yield StreamEvent(kind="tool_call_start", text=tc_delta.function.name if tc_delta.function and tc_delta.function.name else "")
-                    entry = tool_calls_by_index[idx]
-                    if tc_delta.id:
-                        entry["id"] = tc_delta.id
-                    if tc_delta.function:
-                        if tc_delta.function.name:
-                            entry["name"] = tc_delta.function.name
-                        if tc_delta.function.arguments:
-                            entry["arguments"] += tc_delta.function.arguments
-                            yield StreamEvent(kind="tool_call_delta", text=tc_delta.function.arguments)
-
-        # Assemble final message
-        assembled_tool_calls = []
-        for idx in sorted(tool_calls_by_index):
-            entry = tool_calls_by_index[idx]
-            args = json.loads(entry["arguments"]) if entry["arguments"] else {}
-            tc = ToolCall(id=entry["id"], name=entry["name"], arguments=args)
-            assembled_tool_calls.append(tc)
-            yield StreamEvent(kind="tool_call_done", tool_call=tc)
-
-        final_msg = Message(
-            role="assistant",
-            content="".join(text_parts) if text_parts else None,
-            tool_calls=assembled_tool_calls if assembled_tool_calls else None,
-        )
-        yield StreamEvent(kind="message_done", message=final_msg)
+        return kwargs
 
 
 class OpenRouterModel(OpenAIModel):
     """OpenAI-compatible adapter routed through OpenRouter."""
 
-    def __init__(self, api_key: str, model: str, temperature: float = 0.0):
-        import openai
-        self._client = openai.OpenAI(
-            api_key=api_key,
-            base_url="https://openrouter.ai/api/v1",
-        )
-        self._model = model
-        self._temperature = temperature
+    _base_url = "https://openrouter.ai/api/v1"
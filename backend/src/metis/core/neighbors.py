@@ -0,0 +1,150 @@
+"""Precomputed reading-order adjacency for neighbor expansion.
+
+Ingestion stores one int32 row per span (spans.jsonl order) holding the row of
+its previous/next body span in reading order, both within the page and across
+the whole document. Headers and footers are left unlinked. Expanding k hits by
+a window of w then costs O(k * w) pointer hops instead of re-sorting the page.
+The links are saved with a digest of the span fields they depend on, and a
+file that no longer matches spans.jsonl is ignored.
+"""
+from __future__ import annotations
+import os
+import tempfile
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from .schema import Span
+from .store import SpansDigest, paths, read_spans_jsonl
+from ..settings import NEIGHBOR_WINDOW
+
+PREV_PAGE, NEXT_PAGE, PREV_DOC, NEXT_DOC = range(4)
+
+# what build_ro_links reads from each span
+LINK_FIELDS = ("span_id", "page", "reading_order", "is_header", "is_footer")
+
+
+def links_digest(spans: List[Span]) -> str:
+    return SpansDigest(LINK_FIELDS).update(spans).hexdigest()
+
+
+def build_ro_links(spans: List[Span]) -> np.ndarray:
+    """Return an (N, 4) int32 array of prev/next rows; -1 where there is none."""
+    return ro_links_from_arrays(
+        np.asarray([s.reading_order for s in spans], dtype=np.int64),
+        np.asarray([s.page for s in spans], dtype=np.int64),
+        np.asarray([not (s.is_header or s.is_footer) for s in spans], dtype=bool),
+    )
+
+
+def ro_links_from_arrays(reading_order: np.ndarray, pages: np.ndarray, body: np.ndarray) -> np.ndarray:
+    """build_ro_links over per-span columns (reading order, page, not header/footer)."""
+    links = np.full((len(reading_order), 4), -1, dtype=np.int32)
+    body = np.flatnonzero(body)
+    if len(body) < 2:
+        return links
+    order = body[np.argsort(reading_order[body], kind="stable")]
+    links[order[1:], PREV_DOC] = order[:-1]
+    links[order[:-1], NEXT_DOC] = order[1:]
+    pages = pages[order]
+    same = pages[1:] == pages[:-1]
+    links[order[1:][same], PREV_PAGE] = order[:-1][same]
+    links[order[:-1][same], NEXT_PAGE] = order[1:][same]
+    return links
+
+
+def write_ro_links(path: Path, links: np.ndarray, digest: str) -> None:
+    """Save links built from spans with links_digest `digest`."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, links=np.ascontiguousarray(links, dtype=np.int32), digest=np.str_(digest))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_ro_links(path: Path, spans: List[Span]) -> np.ndarray | None:
+    """The persisted links, or None if missing or not built from `spans`."""
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        if "digest" not in z.files or str(z["digest"]) != links_digest(spans):
+            return None
+        return z["links"]
+
+
+class NeighborIndex:
+    def __init__(self, spans: List[Span], links: np.ndarray):
+        self.spans = spans
+        self.links = links
+        self.row_by_id = {s.span_id: i for i, s in enumerate(spans)}
+
+    @classmethod
+    def from_store(cls, p: dict, spans: List[Span]) -> "NeighborIndex":
+        """Use the persisted links when present, else build them from `spans`."""
+        lp = p.get("ro_links")
+        links = load_ro_links(lp, spans) if lp is not None else None
+        return cls(spans, build_ro_links(spans) if links is None else links)
+
+    def expand(self, span_ids: List[str], window: int, scope: str = "page") -> List[List[Span]]:
+        """For each span id, the span plus up to `window` neighbors per side, in reading order.
+
+        `scope` is "page" (stop at page boundaries) or "document". Unknown ids
+        yield an empty group.
+        """
+        prev_col, next_col = (PREV_PAGE, NEXT_PAGE) if scope == "page" else (PREV_DOC, NEXT_DOC)
+        groups: List[List[Span]] = []
+        for sid in span_ids:
+            row = self.row_by_id.get(sid)
+            if row is None:
+                groups.append([])
+                continue
+            before, after = [], []
+            r = row
+            for _ in range(window):
+                r = int(self.links[r, prev_col])
+                if r < 0:
+                    break
+                before.append(r)
+            r = row
+            for _ in range(window):
+                r = int(self.links[r, next_col])
+                if r < 0:
+                    break
+                after.append(r)
+            groups.append([self.spans[i] for i in reversed(before)] + [self.spans[row]] + [self.spans[i] for i in after])
+        return groups
+
+
+_index_cache: dict[str, tuple[tuple, NeighborIndex]] = {}
+
+def _stamp(path: Path) -> tuple:
+    if not path.exists():
+        return ()
+    st = path.stat()
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def neighbor_index(doc_id: str) -> NeighborIndex:
+    """The document's NeighborIndex (spans plus links), cached until spans.jsonl or the links change."""
+    p = paths(doc_id)
+    stamp = (_stamp(p["spans"]), _stamp(p["ro_links"]))
+    cached = _index_cache.get(doc_id)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, NeighborIndex.from_store(p, read_spans_jsonl(p["spans"])))
+        _index_cache[doc_id] = cached
+    return cached[1]
+
+
+def expand_neighbors(
+    doc_id: str,
+    span_ids: List[str],
+    window: int = NEIGHBOR_WINDOW,
+    *,
+    scope: str = "page",
+) -> List[List[Span]]:
+    """Expand span ids to their reading-order neighbors (see NeighborIndex.expand)."""
+    return neighbor_index(doc_id).expand(span_ids, window, scope=scope)
@@ -0,0 +1,122 @@
+"""Document-wide character n-gram inverted index over span text.
+
+Each span's text is case-folded, whitespace-collapsed and cut into character
+trigrams; a trigram is packed into one int64 (three 21-bit code points). The
+index stores the sorted distinct trigrams with CSR posting lists of span rows
+(spans.jsonl order). Headers and footers are not indexed.
+
+A lookup binary-searches the query's trigrams and counts hits only over their
+posting lists, so candidate generation touches the spans that share text with
+the query rather than every span in the document. The index records a digest
+of the span fields it was built from, so a reader can tell a stale file.
+"""
+from __future__ import annotations
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from .schema import Span
+from .store import SpansDigest
+
+N = 3
+
+# what NgramIndex.build reads from each span
+GRAM_FIELDS = ("span_id", "text", "is_header", "is_footer")
+
+
+def ngram_digest(spans: List[Span]) -> str:
+    return SpansDigest(GRAM_FIELDS).update(spans).hexdigest()
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def gram_codes(text: str) -> np.ndarray:
+    """Sorted distinct trigram codes of normalized `text` (empty if shorter than N)."""
+    cp = np.frombuffer(normalize(text).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    if len(cp) < N:
+        return np.zeros(0, dtype=np.int64)
+    codes = (cp[:-2] << 42) | (cp[1:-1] << 21) | cp[2:]
+    return np.unique(codes)
+
+
+@dataclass(frozen=True)
+class NgramIndex:
+    grams: np.ndarray     # (G,) int64 sorted distinct trigram codes
+    offsets: np.ndarray   # (G + 1,) posting range per gram
+    postings: np.ndarray  # (P,) int32 span rows, ascending within each gram
+    digest: str = ""      # ngram_digest of the spans it was built from ("" if unknown)
+
+    @classmethod
+    def build(cls, spans: List[Span]) -> "NgramIndex":
+        codes, rows = [], []
+        for i, s in enumerate(spans):
+            if s.is_header or s.is_footer:
+                continue
+            c = gram_codes(s.text)
+            codes.append(c)
+            rows.append(np.full(len(c), i, dtype=np.int32))
+        return cls.from_codes(codes, rows, ngram_digest(spans))
+
+    @classmethod
+    def from_codes(cls, codes: List[np.ndarray], rows: List[np.ndarray], digest: str = "") -> "NgramIndex":
+        """Build from per-span trigram codes and matching span-row arrays."""
+        if not codes:
+            return cls(np.zeros(0, np.int64), np.zeros(1, np.int64), np.zeros(0, np.int32), digest)
+        codes_arr = np.concatenate(codes)
+        rows_arr = np.concatenate(rows)
+        order = np.lexsort((rows_arr, codes_arr))
+        codes_arr, rows_arr = codes_arr[order], rows_arr[order]
+        grams, starts = np.unique(codes_arr, return_index=True)
+        offsets = np.append(starts, len(codes_arr)).astype(np.int64)
+        return cls(grams, offsets, rows_arr, digest)
+
+    def candidates(self, text: str, limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """Span rows sharing the most trigrams with `text`, best first.
+
+        Returns (rows, shared_gram_counts); ties keep span order.
+        """
+        q = gram_codes(text)
+        if len(q) == 0 or len(self.grams) == 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        pos = np.minimum(np.searchsorted(self.grams, q), len(self.grams) - 1)
+        pos = pos[self.grams[pos] == q]
+        if len(pos) == 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        hits = np.concatenate([self.postings[self.offsets[g]:self.offsets[g + 1]] for g in pos])
+        rows, counts = np.unique(hits, return_counts=True)
+        order = np.lexsort((rows, -counts))[:limit]
+        return rows[order].astype(np.int64), counts[order]
+
+
+def write_ngram_index(path: Path, index: NgramIndex) -> None:
+    # unique temp file: lookups of the same document may build and save it concurrently
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, grams=index.grams, offsets=index.offsets, postings=index.postings, digest=np.str_(index.digest))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+_index_cache: dict[str, tuple[tuple[int, int], NgramIndex]] = {}
+
+def load_ngram_index(path: Path) -> NgramIndex:
+    """Load a document's n-gram index, cached until the file changes."""
+    st = path.stat()
+    stamp = (st.st_ino, st.st_mtime_ns)
+    cached = _index_cache.get(str(path))
+    if cached is None or cached[0] != stamp:
+        with np.load(path, allow_pickle=False) as z:
+            digest = str(z["digest"]) if "digest" in z.files else ""
+            index = NgramIndex(grams=z["grams"], offsets=z["offsets"], postings=z["postings"], digest=digest)
+        cached = (stamp, index)
+        _index_cache[str(path)] = cached
+    return cached[1]
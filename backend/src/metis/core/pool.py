@@ -0,0 +1,66 @@
+"""Process pools for CPU-bound ingestion stages.
+
+Workers are started with the "spawn" method: the API server runs ingestion on
+threads, and forking a threaded process (or pymupdf's global state) is not
+safe. Work is split into contiguous page shards so results can be merged back
+in page order, and only a few shards are submitted ahead of the consumer so
+finished results do not pile up in the parent.
+"""
+from __future__ import annotations
+import math
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, List, Sequence
+
+
+def resolve_workers(workers: int) -> int:
+    """Map a worker setting to a process count (0 or less = one per CPU)."""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def page_shards(
+    pages: int | Sequence[int],
+    workers: int,
+    shards_per_worker: int = 4,
+    max_size: int | None = None,
+) -> List[Sequence[int]]:
+    """Split pages (a count, or a list of page numbers) into contiguous runs,
+    a few per worker for load balance and at most `max_size` pages each."""
+    if isinstance(pages, int):
+        pages = range(pages)
+    n = len(pages)
+    if n == 0:
+        return []
+    size = max(1, math.ceil(n / (workers * shards_per_worker)))
+    if max_size is not None:
+        size = min(size, max(1, max_size))
+    return [pages[s:s + size] for s in range(0, n, size)]
+
+
+def ordered_map(pool: Executor, fn: Callable, *iterables: Iterable, in_flight: int) -> Iterator:
+    """Like `pool.map`, but with at most `in_flight` calls submitted and not yet
+    consumed. Calls still queued when the iterator is closed are cancelled."""
+    pending: Deque[Future] = deque()
+    try:
+        for args in zip(*iterables):
+            pending.append(pool.submit(fn, *args))
+            if len(pending) >= in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+def process_pool(workers: int, initializer: Callable | None = None, initargs: tuple = ()) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
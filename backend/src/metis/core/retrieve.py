@@ -1,41 +1,142 @@
 from __future__ import annotations
 from typing import List
-from rapidfuzz import fuzz
+import numpy as np
+import orjson
+import pymupdf
+from rapidfuzz import fuzz, process, utils
 from .schema import BBox, Evidence, Span
-from .store import paths, read_spans_jsonl
-from ..settings import TOPK_EVIDENCE, NEIGHBOR_WINDOW
+from .neighbors import neighbor_index
+from .ngram import NgramIndex, load_ngram_index, ngram_digest, write_ngram_index
+from .spatial import DocSpatialIndex, SpatialIndex, build_doc_index_from_pdf, load_doc_index, span_index, write_doc_index
+from .store import ingest_complete, paths, read_spans_jsonl
+from ..settings import TOPK_EVIDENCE, NEIGHBOR_WINDOW, FUZZY_SCORE_CUTOFF, FUZZY_WORKERS, LOCATE_CANDIDATES, LOCATE_MIN_SCORE
 
-def retrieve(doc_id: str, page: int, selected_text: str) -> List[Evidence]:
-    p = paths(doc_id)
-    spans: List[Span] = read_spans_jsonl(p["spans"])
-    cand = [s for s in spans if s.page == page and not (s.is_header or s.is_footer)]
+def _top_k_rows(scores: np.ndarray, k: int, cutoff: float) -> list[list[tuple[float, int]]]:
+    """Per query row, return up to k (score, candidate_idx) pairs, best first.
+
+    Ties keep candidate order, matching a stable descending sort.
+    """
+    out = []
+    n = scores.shape[1]
+    for row in scores:
+        if n > k:
+            # everything scoring at least the k-th best (ties included)
+            kth = np.partition(row, n - k)[n - k]
+            idx = np.flatnonzero(row >= kth)
+        else:
+            idx = np.arange(n)
+        order = idx[np.lexsort((idx, -row[idx]))][:k]
+        out.append([(float(row[j]), int(j)) for j in order if row[j] >= cutoff])
+    return out
 
-    q = " ".join(selected_text.split())
-    scored = []
-    for s in cand:
-        score = fuzz.partial_ratio(q, s.text)
-        scored.append((score, s))
-    scored.sort(key=lambda x: x[0], reverse=True)
+def retrieve(doc_id: str, page: int | None, selected_text: str) -> List[Evidence]:
+    return retrieve_many(doc_id, page, [selected_text])[0]
+
+def retrieve_many(doc_id: str, page: int | None, selected_texts: List[str]) -> List[List[Evidence]]:
+    """Fuzzy-match several selected texts against one page in a single pass.
+
+    Scores every (query, span) pair with rapidfuzz's multi-threaded `cdist`
+    and returns one evidence list per query, in input order. With `page=None`
+    each text is located across the whole document via the n-gram index.
+    """
+    p = paths(doc_id)
+    # the spans come with their reading-order links, cached per document
+    neighbors = neighbor_index(doc_id)
+    spans: List[Span] = neighbors.spans
+    if page is None:
+        index = _ngram_index(doc_id, p, spans)
+        tops = [_locate(spans, index, t, TOPK_EVIDENCE) for t in selected_texts]
+    else:
+        cand = [s for s in spans if s.page == page and not (s.is_header or s.is_footer)]
+        if not cand or not selected_texts:
+            return [[] for _ in selected_texts]
 
-    top = scored[:TOPK_EVIDENCE]
-    out: List[Evidence] = []
+        queries = [" ".join(t.split()) for t in selected_texts]
+        scores = process.cdist(
+            queries,
+            [s.text for s in cand],
+            scorer=fuzz.partial_ratio,
+            score_cutoff=FUZZY_SCORE_CUTOFF,
+            workers=FUZZY_WORKERS,
+        )
+        tops = [[(score, cand[ci]) for score, ci in top] for top in _top_k_rows(scores, TOPK_EVIDENCE, FUZZY_SCORE_CUTOFF)]
 
     # include neighbor window in reading order (page-local)
-    ro_sorted = sorted(cand, key=lambda s: s.reading_order)
-    idx_by_id = {s.span_id: i for i, s in enumerate(ro_sorted)}
-
-    seen = set()
-    for score, s in top:
-        i = idx_by_id.get(s.span_id, None)
-        for j in range(max(0, i-NEIGHBOR_WINDOW), min(len(ro_sorted), i+NEIGHBOR_WINDOW+1)):
-            sj = ro_sorted[j]
-            if sj.span_id in seen: 
-                continue
-            seen.add(sj.span_id)
-            out.append(Evidence(span_id=sj.span_id, page=sj.page, bbox_norm=sj.bbox_norm, text=sj.text, score=float(score)))
-    # sort evidence by page reading order for nicer display
-    out.sort(key=lambda e: idx_by_id.get(e.span_id, 10**9))
-    return out
+    results: List[List[Evidence]] = []
+    for top in tops:
+        groups = neighbors.expand([s.span_id for _, s in top], NEIGHBOR_WINDOW)
+        out = []
+        seen = set()
+        for (score, _), group in zip(top, groups):
+            for sj in group:
+                if sj.span_id in seen:
+                    continue
+                seen.add(sj.span_id)
+                out.append(((sj.page, sj.reading_order), Evidence(span_id=sj.span_id, page=sj.page, bbox_norm=sj.bbox_norm, text=sj.text, score=score)))
+        # sort evidence by page reading order for nicer display
+        out.sort(key=lambda x: x[0])
+        results.append([e for _, e in out])
+    return results
+
+
+_ngram_index_cache: dict[str, tuple[tuple, NgramIndex]] = {}
+
+def _ngram_index(doc_id: str, p: dict, spans: List[Span]) -> NgramIndex:
+    """Return the persisted n-gram index if it was built from `spans`.
+
+    A missing (older docs) or stale index (its digest differs, e.g. after a
+    re-ingest, enrichment or tier swap) is rebuilt, and saved only once the
+    document's ingest is complete, so a lookup during a streaming ingest
+    never persists an index of part of it. The result is cached until
+    spans.jsonl or the index file changes (an index built during an ingest
+    is not cached).
+    """
+    np_path = p["ngrams"]
+    stamp = (_stamp(p["spans"]), _stamp(np_path))
+    cached = _ngram_index_cache.get(doc_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    index = load_ngram_index(np_path) if stamp[1] else None
+    if index is None or index.digest != ngram_digest(spans):
+        index = NgramIndex.build(spans)
+        if not ingest_complete(doc_id):
+            return index
+        write_ngram_index(np_path, index)
+        stamp = (stamp[0], _stamp(np_path))
+    _ngram_index_cache[doc_id] = (stamp, index)
+    return index
+
+
+def _locate(spans: List[Span], index: NgramIndex, text: str, top_k: int) -> list[tuple[float, Span]]:
+    """Shortlist spans by shared trigrams, then verify with partial_ratio.
+
+    The index only case-folds and collapses whitespace; verification also
+    ignores punctuation (rapidfuzz's default_process), since located text
+    often comes from outside the viewer (pasted, or quoted by the LLM).
+    """
+    rows, _ = index.candidates(text, LOCATE_CANDIDATES)
+    cand = [spans[i] for i in rows.tolist() if i < len(spans)]
+    if not cand:
+        return []
+    scores = process.cdist(
+        [text],
+        [s.text for s in cand],
+        scorer=fuzz.partial_ratio,
+        processor=utils.default_process,
+        score_cutoff=LOCATE_MIN_SCORE,
+        workers=FUZZY_WORKERS,
+    )
+    return [(score, cand[ci]) for score, ci in _top_k_rows(scores, top_k, LOCATE_MIN_SCORE)[0]]
+
+
+def locate_text(doc_id: str, text: str, top_k: int = TOPK_EVIDENCE) -> List[Evidence]:
+    """Find the spans anywhere in the document that contain `text`, best first."""
+    p = paths(doc_id)
+    spans = read_spans_jsonl(p["spans"])
+    return [
+        Evidence(span_id=s.span_id, page=s.page, bbox_norm=s.bbox_norm, text=s.text, score=score)
+        for score, s in _locate(spans, _ngram_index(doc_id, p, spans), text, top_k)
+    ]
 
 
 def bbox_iou(a: BBox, b: BBox) -> float:
@@ -53,27 +154,41 @@ def bbox_iou(a: BBox, b: BBox) -> float:
     return inter / union if union > 0 else 0.0
 
 
+def _matches(index: DocSpatialIndex, spans: List[Span]) -> bool:
+    """Whether the index was built from `spans` (its ids are positions in spans.jsonl)."""
+    return len(index.span_ids) == len(spans) and index.span_ids.tolist() == [s.span_id for s in spans]
+
+
+def _span_index(p: dict, spans: List[Span]) -> SpatialIndex:
+    """Return the persisted span index, or build one in memory for older docs
+    and while the persisted one is stale (e.g. during a re-ingest).
+
+    Index ids are positions in `spans` (spans.jsonl order).
+    """
+    sp = p.get("spatial")
+    if sp is not None and sp.exists():
+        index = load_doc_index(sp)
+        if _matches(index, spans):
+            return index.spans
+    n_pages = max((s.page for s in spans), default=-1) + 1
+    return span_index(spans, n_pages)
+
+
 def resolve_selections(doc_id: str, selections: list[dict]) -> list[dict]:
     """Find spans overlapping with bbox selections, ranked by IoU."""
     p = paths(doc_id)
     spans = read_spans_jsonl(p["spans"])
+    index = _span_index(p, spans)
 
     seen: set[str] = set()
     results: list[dict] = []
 
     for sel in selections:
-        page = sel["page"]
-        sel_bbox = tuple(sel["bbox_norm"])
-        page_spans = [s for s in spans if s.page == page]
-
-        scored = []
-        for s in page_spans:
-            iou = bbox_iou(sel_bbox, s.bbox_norm)
-            if iou > 0 and s.span_id not in seen:
-                scored.append((iou, s))
-
-        scored.sort(key=lambda x: x[0], reverse=True)
-        for iou, s in scored:
+        ids, ious = index.iou(sel["page"], tuple(sel["bbox_norm"]))
+        for i, iou in zip(ids.tolist(), ious.tolist()):
+            s = spans[i]
+            if s.span_id in seen:
+                continue
             seen.add(s.span_id)
             results.append({
                 "span_id": s.span_id,
@@ -85,3 +200,77 @@ def resolve_selections(doc_id: str, selections: list[dict]) -> list[dict]:
 
     return results
 
+
+_doc_index_cache: dict[str, tuple[tuple, DocSpatialIndex]] = {}
+
+def _stamp(path) -> tuple:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return ()
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def _doc_index(doc_id: str) -> DocSpatialIndex:
+    """Load the document's spatial index, checked against the current spans.jsonl.
+
+    A missing (older docs) or stale index is rebuilt in memory, and saved only
+    once the document's ingest is complete, so a request during an ingest
+    never persists an index of a partial spans.jsonl. The result is cached
+    until spans.jsonl or the index file changes.
+    """
+    p = paths(doc_id)
+    stamp = (_stamp(p["spans"]), _stamp(p["spatial"]))
+    cached = _doc_index_cache.get(doc_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    spans = read_spans_jsonl(p["spans"])
+    index = load_doc_index(p["spatial"]) if stamp[1] else None
+    if index is None or not _matches(index, spans):
+        words_path = p["page_md"].with_suffix(".words.json")
+        words = orjson.loads(words_path.read_bytes()) if words_path.exists() else {}
+        doc = pymupdf.open(p["pdf"])
+        index = build_doc_index_from_pdf(doc, spans, words)
+        doc.close()
+        if ingest_complete(doc_id):
+            write_doc_index(p["spatial"], index)
+            stamp = (stamp[0], _stamp(p["spatial"]))
+    _doc_index_cache[doc_id] = (stamp, index)
+    return index
+
+
+def hit_test(doc_id: str, page: int, x: float, y: float, level: str = "span") -> list[dict]:
+    """Spans (or words) on `page` containing the normalized point (x, y), innermost first."""
+    index = _doc_index(doc_id)
+    if level == "word":
+        ids = index.words.hit_test(page, x, y)
+        return [_word_item(index, i) for i in ids.tolist()]
+    ids = index.spans.hit_test(page, x, y)
+    return [_span_item(index, i) for i in ids.tolist()]
+
+
+def region_query(doc_id: str, page: int, bbox_norm: BBox, level: str = "span") -> list[dict]:
+    """Spans (or words) on `page` overlapping `bbox_norm`, in reading order.
+
+    `overlap` is the fraction of each box's area covered by the region, so a
+    box-drag can keep only items it mostly covers.
+    """
+    index = _doc_index(doc_id)
+    sub = index.words if level == "word" else index.spans
+    ids, inter, area = sub.overlap(page, tuple(bbox_norm))
+    frac = np.divide(inter, area, out=np.ones_like(inter), where=area > 0)
+    make = _word_item if level == "word" else _span_item
+    out = []
+    for i, f in zip(ids.tolist(), frac.tolist()):
+        item = make(index, i)
+        item["overlap"] = round(f, 4)
+        out.append(item)
+    return out
+
+
+def _span_item(index: DocSpatialIndex, i: int) -> dict:
+    return {"span_id": str(index.span_ids[i]), "bbox_norm": index.spans.boxes[i].tolist()}
+
+
+def _word_item(index: DocSpatialIndex, i: int) -> dict:
+    return {"text": index.word_text(i), "page": int(index.word_pages[i]), "bbox_norm": index.words.boxes[i].tolist()}
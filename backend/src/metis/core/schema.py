@@ -22,6 +22,7 @@ class Span:
     asset_path: Optional[str] = None        # relative path from DATA_DIR to rendered bbox image
     content_source: Optional[str] = None    # extractor: "pix2text_mfr", "pix2text_table", "vlm"
     original_text: Optional[str] = None     # original text before enrichment replaced it
+    enrich_status: Optional[str] = None     # why an enrichable span was not enriched: "failed" or a skip reason
 
 @dataclass(frozen=True)
 class Evidence:
@@ -0,0 +1,278 @@
+"""Per-page spatial index over normalized bounding boxes.
+
+Boxes are grouped by page and STR-packed (sort-tile-recursive) into small
+leaves, each with a minimum bounding rectangle. A query tests the page's leaf
+MBRs first, then runs vectorized IoU / overlap / containment tests over the
+boxes of the matching leaves only.
+"""
+from __future__ import annotations
+import math
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from .schema import BBox, Span
+
+LEAF_SIZE = 16
+
+
+def _str_order(boxes: np.ndarray, leaf_size: int) -> np.ndarray:
+    """Return the STR packing order for one page's boxes."""
+    n = len(boxes)
+    if n <= leaf_size:
+        return np.arange(n)
+    n_leaves = math.ceil(n / leaf_size)
+    n_slices = math.ceil(math.sqrt(n_leaves))
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    by_x = np.argsort(cx, kind="stable")
+    per_slice = n_slices * leaf_size
+    order = []
+    for s in range(0, n, per_slice):
+        sl = by_x[s:s + per_slice]
+        order.append(sl[np.argsort(cy[sl], kind="stable")])
+    return np.concatenate(order)
+
+
+@dataclass(frozen=True)
+class SpatialIndex:
+    boxes: np.ndarray              # (N, 4) float64 normalized boxes, in source order
+    ids: np.ndarray                # (N,) int64 source positions in (page, STR) packed order
+    page_offsets: np.ndarray       # (n_pages + 1,) box range per page
+    leaf_mbrs: np.ndarray          # (L, 4) float64 bounding rectangle of each leaf
+    leaf_offsets: np.ndarray       # (L + 1,) box range per leaf
+    page_leaf_offsets: np.ndarray  # (n_pages + 1,) leaf range per page
+
+    @classmethod
+    def build(
+        cls,
+        boxes: np.ndarray | list,
+        pages: np.ndarray | list,
+        n_pages: int,
+        leaf_size: int = LEAF_SIZE,
+    ) -> "SpatialIndex":
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        pages = np.asarray(pages, dtype=np.int64)
+        by_page = np.argsort(pages, kind="stable")
+        counts = np.bincount(pages, minlength=n_pages)[:n_pages] if len(pages) else np.zeros(n_pages, dtype=np.int64)
+        page_offsets = np.zeros(n_pages + 1, dtype=np.int64)
+        np.cumsum(counts, out=page_offsets[1:])
+
+        ids, mbrs, leaf_offsets, page_leaf_offsets = [], [], [0], [0]
+        for pg in range(n_pages):
+            members = by_page[page_offsets[pg]:page_offsets[pg + 1]]
+            members = members[_str_order(boxes[members], leaf_size)]
+            for s in range(0, len(members), leaf_size):
+                leaf = members[s:s + leaf_size]
+                lb = boxes[leaf]
+                mbrs.append((lb[:, 0].min(), lb[:, 1].min(), lb[:, 2].max(), lb[:, 3].max()))
+                leaf_offsets.append(leaf_offsets[-1] + len(leaf))
+            ids.append(members)
+            page_leaf_offsets.append(len(mbrs))
+
+        ids_arr = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        return cls(
+            boxes=boxes,
+            ids=ids_arr.astype(np.int64),
+            page_offsets=page_offsets,
+            leaf_mbrs=np.asarray(mbrs, dtype=np.float64).reshape(-1, 4),
+            leaf_offsets=np.asarray(leaf_offsets, dtype=np.int64),
+            page_leaf_offsets=np.asarray(page_leaf_offsets, dtype=np.int64),
+        )
+
+    @property
+    def n_pages(self) -> int:
+        return len(self.page_offsets) - 1
+
+    def _candidates(self, page: int, bbox: BBox) -> np.ndarray:
+        """Source ids of boxes in leaves whose MBR intersects bbox."""
+        if not 0 <= page < self.n_pages:
+            return np.zeros(0, dtype=np.int64)
+        lo, hi = self.page_leaf_offsets[page], self.page_leaf_offsets[page + 1]
+        m = self.leaf_mbrs[lo:hi]
+        hit = np.flatnonzero(
+            (m[:, 0] <= bbox[2]) & (m[:, 2] >= bbox[0]) & (m[:, 1] <= bbox[3]) & (m[:, 3] >= bbox[1])
+        ) + lo
+        if len(hit) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.ids[self.leaf_offsets[l]:self.leaf_offsets[l + 1]] for l in hit])
+
+    def overlap(self, page: int, bbox: BBox) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Boxes on `page` intersecting `bbox` with positive area.
+
+        Returns (ids, intersection_area, box_area), ordered by source id.
+        """
+        cand = np.sort(self._candidates(page, bbox))
+        b = self.boxes[cand]
+        iw = np.minimum(b[:, 2], bbox[2]) - np.maximum(b[:, 0], bbox[0])
+        ih = np.minimum(b[:, 3], bbox[3]) - np.maximum(b[:, 1], bbox[1])
+        keep = (iw > 0) & (ih > 0)
+        cand, b = cand[keep], b[keep]
+        inter = iw[keep] * ih[keep]
+        area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+        return cand, inter, area
+
+    def iou(self, page: int, bbox: BBox) -> tuple[np.ndarray, np.ndarray]:
+        """Boxes on `page` with IoU > 0 against `bbox`, best first (ties by source id)."""
+        ids, inter, area = self.overlap(page, bbox)
+        sel_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+        union = area + sel_area - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        order = np.argsort(-iou, kind="stable")
+        return ids[order], iou[order]
+
+    def hit_test(self, page: int, x: float, y: float) -> np.ndarray:
+        """Ids of boxes on `page` containing the point (x, y), smallest box first."""
+        cand = self._candidates(page, (x, y, x, y))
+        b = self.boxes[cand]
+        inside = (b[:, 0] <= x) & (x <= b[:, 2]) & (b[:, 1] <= y) & (y <= b[:, 3])
+        cand, b = cand[inside], b[inside]
+        area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+        return cand[np.argsort(area, kind="stable")]
+
+    def to_arrays(self, prefix: str) -> dict[str, np.ndarray]:
+        return {
+            f"{prefix}boxes": self.boxes,
+            f"{prefix}ids": self.ids,
+            f"{prefix}page_offsets": self.page_offsets,
+            f"{prefix}leaf_mbrs": self.leaf_mbrs,
+            f"{prefix}leaf_offsets": self.leaf_offsets,
+            f"{prefix}page_leaf_offsets": self.page_leaf_offsets,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str) -> "SpatialIndex":
+        return cls(
+            boxes=arrays[f"{prefix}boxes"],
+            ids=arrays[f"{prefix}ids"],
+            page_offsets=arrays[f"{prefix}page_offsets"],
+            leaf_mbrs=arrays[f"{prefix}leaf_mbrs"],
+            leaf_offsets=arrays[f"{prefix}leaf_offsets"],
+            page_leaf_offsets=arrays[f"{prefix}page_leaf_offsets"],
+        )
+
+
+@dataclass(frozen=True)
+class DocSpatialIndex:
+    """Span and word indexes for one document, plus the labels hit-tests return.
+
+    Word text is one UTF-8 buffer with offsets rather than a fixed-width str
+    array, which would pad every word to the longest one.
+    """
+    spans: SpatialIndex
+    span_ids: np.ndarray           # (N_spans,) str, in spans.jsonl order
+    words: SpatialIndex
+    word_bytes: np.ndarray         # (B,) uint8, UTF-8 text of all words, flattened in page order
+    word_offsets: np.ndarray       # (N_words + 1,) int64, word i is word_bytes[offsets[i]:offsets[i + 1]]
+    word_pages: np.ndarray         # (N_words,) int64
+
+    def word_text(self, i: int) -> str:
+        return self.word_bytes[self.word_offsets[i]:self.word_offsets[i + 1]].tobytes().decode("utf-8")
+
+
+def pack_words(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenated UTF-8 bytes and per-word lengths of `texts`."""
+    encoded = [t.encode("utf-8") for t in texts]
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), np.asarray([len(b) for b in encoded], dtype=np.int64)
+
+
+def word_offsets(lengths: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+
+
+def span_index(spans: list[Span], n_pages: int) -> SpatialIndex:
+    return SpatialIndex.build([s.bbox_norm for s in spans], [s.page for s in spans], n_pages)
+
+
+def build_doc_index(
+    spans: list[Span],
+    words_by_page: dict[str, list],
+    page_sizes: list[tuple[float, float]],
+) -> DocSpatialIndex:
+    """Build span and word indexes. Word boxes are PDF points and get normalized here."""
+    n_pages = len(page_sizes)
+    w_boxes, w_pages, w_text = [], [], []
+    for key in sorted(words_by_page, key=int):
+        pg = int(key)
+        boxes = page_word_boxes(words_by_page[key], page_sizes[pg])
+        w_boxes.extend(boxes)
+        w_pages.extend([pg] * len(boxes))
+        w_text.extend(word[4] for word in words_by_page[key])
+    w_bytes, w_lengths = pack_words(w_text)
+    return DocSpatialIndex(
+        spans=span_index(spans, n_pages),
+        span_ids=np.asarray([s.span_id for s in spans], dtype=np.str_),
+        words=SpatialIndex.build(w_boxes, w_pages, n_pages),
+        word_bytes=w_bytes,
+        word_offsets=word_offsets(w_lengths),
+        word_pages=np.asarray(w_pages, dtype=np.int64),
+    )
+
+
+def page_word_boxes(words: list, page_size: tuple[float, float]) -> list[tuple[float, float, float, float]]:
+    """Normalized boxes of one page's words ((x0, y0, x1, y1, text, ...) in PDF points)."""
+    pw, ph = page_size
+    return [(w[0] / pw, w[1] / ph, w[2] / pw, w[3] / ph) for w in words]
+
+
+def build_doc_index_from_pdf(doc, spans: list[Span], words_by_page: dict[str, list]) -> DocSpatialIndex:
+    """Build the document index from an open pymupdf document.
+
+    Pages without extracted words (blocks engine, or pymupdf4llm runs that did
+    not return them) are indexed from pymupdf's own word boxes.
+    """
+    page_sizes = [(pg.rect.width, pg.rect.height) for pg in doc]
+    words = dict(words_by_page)
+    for page_i in range(doc.page_count):
+        if str(page_i) not in words:
+            words[str(page_i)] = doc[page_i].get_text("words")
+    return build_doc_index(spans, words, page_sizes)
+
+
+def write_doc_index(path: Path, index: DocSpatialIndex) -> None:
+    # unique temp file + rename: readers (and a concurrent lazy build) never see a partial file
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                span_ids=index.span_ids,
+                word_bytes=index.word_bytes,
+                word_offsets=index.word_offsets,
+                word_pages=index.word_pages,
+                **index.spans.to_arrays("spans_"),
+                **index.words.to_arrays("words_"),
+            )
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+_index_cache: dict[str, tuple[tuple[int, int], DocSpatialIndex]] = {}
+
+def load_doc_index(path: Path) -> DocSpatialIndex:
+    """Load a document's spatial index, cached until the file changes."""
+    st = path.stat()
+    stamp = (st.st_ino, st.st_mtime_ns)
+    cached = _index_cache.get(str(path))
+    if cached is None or cached[0] != stamp:
+        with np.load(path, allow_pickle=False) as z:
+            arrays = {k: z[k] for k in z.files}
+        if "word_offsets" not in arrays:  # written before word text was packed
+            arrays["word_bytes"], lengths = pack_words(arrays.pop("word_text").tolist())
+            arrays["word_offsets"] = word_offsets(lengths)
+        index = DocSpatialIndex(
+            spans=SpatialIndex.from_arrays(arrays, "spans_"),
+            span_ids=arrays["span_ids"],
+            words=SpatialIndex.from_arrays(arrays, "words_"),
+            word_bytes=arrays["word_bytes"],
+            word_offsets=arrays["word_offsets"],
+            word_pages=arrays["word_pages"],
+        )
+        cached = (stamp, index)
+        _index_cache[str(path)] = cached
+    return cached[1]
@@ -1,14 +1,66 @@
 from __future__ import annotations
 from pathlib import Path
-import hashlib, orjson, time, secrets
+import fcntl, hashlib, io, mmap, orjson, os, tempfile, threading, time, secrets
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Iterable, List
+from typing import BinaryIO, Iterable, Iterator, List
+import pymupdf
 from .schema import Span
 from ..settings import DATA_DIR
 
+CHUNK_SIZE = 1 << 20
+
 def doc_id_from_bytes(b: bytes) -> str:
     return "sha256:" + hashlib.sha256(b).hexdigest()
 
+def doc_id_from_file(path: Path) -> str:
+    """doc_id of a file on disk, hashed in chunks without loading it whole."""
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return "sha256:" + h.hexdigest()
+
+def store_pdf(src: BinaryIO) -> str:
+    """Copy a PDF stream into the store, returning its doc_id.
+
+    The stream is read in chunks into a temp file in DATA_DIR while being
+    hashed, then renamed atomically onto the document's PDF path, so neither
+    the upload nor a partially written PDF is ever held in memory or visible.
+    """
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=DATA_DIR, prefix=".upload-", suffix=".pdf.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := src.read(CHUNK_SIZE):
+                h.update(chunk)
+                f.write(chunk)
+        doc_id = "sha256:" + h.hexdigest()
+        os.replace(tmp, paths(doc_id)["pdf"])
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return doc_id
+
+def store_pdf_file(path: Path) -> str:
+    with path.open("rb") as f:
+        return store_pdf(f)
+
+def store_pdf_bytes(pdf_bytes: bytes) -> str:
+    return store_pdf(io.BytesIO(pdf_bytes))
+
+def open_pdf(path: Path) -> pymupdf.Document:
+    """Open a stored PDF backed by a read-only memory map instead of a bytes copy.
+
+    Pages are shared with other processes through the OS page cache. Unlike
+    opening by filename the document has no `name`, which pymupdf4llm would
+    otherwise bake into the names of the images it writes.
+    """
+    with path.open("rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # pymupdf keeps a reference to the buffer for the document's lifetime
+    return pymupdf.open(stream=memoryview(mm), filetype="pdf")
+
 def paths(doc_id: str) -> dict:
     safe = doc_id.replace(":", "_")
     return {
@@ -19,34 +71,201 @@ def paths(doc_id: str) -> dict:
         "assets": DATA_DIR / f"{safe}_assets",
         "embeddings": DATA_DIR / f"{safe}.embeddings.npy",
         "embeddings_meta": DATA_DIR / f"{safe}.embeddings_meta.json",
+        "spatial": DATA_DIR / f"{safe}.spatial.npz",
+        "ro_links": DATA_DIR / f"{safe}.ro_links.npz",
+        "ngrams": DATA_DIR / f"{safe}.ngrams.npz",
+        "fingerprints": DATA_DIR / f"{safe}.page_fingerprints.json",
         "conversations": DATA_DIR / f"{safe}.conversations.json",
     }
 
+class SpansDigest:
+    """Incremental digest of the span fields a side index is derived from.
+
+    Stored with the index, it tells a reader whether the index still matches
+    spans.jsonl: a re-ingest, tier swap or enrichment that changes any of
+    `fields` (in spans.jsonl order) changes the digest.
+    """
+
+    def __init__(self, fields: tuple[str, ...]):
+        self.fields = fields
+        self._h = hashlib.blake2b(digest_size=16)
+
+    def update(self, spans: Iterable[Span]) -> "SpansDigest":
+        for s in spans:
+            self._h.update(orjson.dumps([getattr(s, f) for f in self.fields]))
+        return self
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+_doc_locks: dict[str, threading.Lock] = {}
+_doc_locks_guard = threading.Lock()
+
+def doc_lock(doc_id: str) -> threading.Lock:
+    """Per-document lock for files that must change (and be read) together within this
+    process: the embeddings matrix, its span ids and spans.jsonl."""
+    with _doc_locks_guard:
+        return _doc_locks.setdefault(doc_id, threading.Lock())
+
+@contextmanager
+def ingest_claim(doc_id: str) -> Iterator[bool]:
+    """Exclusive lock on ingesting a document, across processes; yields whether
+    another holder had to be waited for.
+
+    An flock on a lock file next to the document's files, so it is released
+    even if the holder is killed.
+    """
+    path = DATA_DIR / f"{doc_id.replace(':', '_')}.ingest.lock"
+    with path.open("ab") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            waited = False
+        except BlockingIOError:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            waited = True
+        try:
+            yield waited
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 def write_json(path: Path, obj) -> None:
     path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
 
+def ingest_complete(doc_id: str) -> bool:
+    """Whether the document's last ingest ran to the end (doc.json `ingest.complete`).
+
+    Documents ingested before progress tracking (no `pages_done`) count as complete.
+    """
+    try:
+        meta = orjson.loads(paths(doc_id)["doc"].read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return False  # missing, or being rewritten by an ingest
+    ingest = meta.get("ingest", {})
+    return bool(ingest.get("complete", "pages_done" not in ingest))
+
+class JsonMapWriter:
+    """Write a JSON object one entry at a time, byte-identical to write_json of the whole dict.
+
+    Entries go to a temp file that close() renames into place; with
+    write_empty=False nothing is written when no entry was added.
+    """
+
+    def __init__(self, path: Path, write_empty: bool = True):
+        self.path = path
+        self.write_empty = write_empty
+        self.tmp = path.with_name(path.name + ".tmp")
+        self.n = 0
+        self._f: BinaryIO | None = None
+
+    def add(self, key: str, value) -> None:
+        if self._f is None:
+            self._f = self.tmp.open("wb")
+        entry = orjson.dumps({key: value}, option=orjson.OPT_INDENT_2)[1:-2]  # '\n  "key": value'
+        self._f.write((b"," if self.n else b"{") + entry)
+        self.n += 1
+
+    def close(self) -> None:
+        if self._f is None:
+            if self.write_empty:
+                write_json(self.path, {})
+            return
+        self._f.write(b"\n}")
+        self._f.close()
+        os.replace(self.tmp, self.path)
+
+def read_json_map(path: Path, keys: Iterable[str]) -> dict:
+    """The entries of `keys` in a JSON object written by write_json or JsonMapWriter.
+
+    Both write one top-level entry per two-space-indented line (values nest
+    deeper), so the file is scanned line by line and only the wanted entries
+    are parsed: memory is bounded by them, not by the file.
+    """
+    keys = set(keys)
+    out: dict = {}
+    with path.open("rb") as f:
+        if f.readline().rstrip() != b"{":  # "{}", or not written by write_json
+            f.seek(0)
+            return {k: v for k, v in orjson.loads(f.read()).items() if k in keys}
+        key, value = None, []
+        for line in f:
+            start = line.startswith(b'  "')
+            if start or line.rstrip() == b"}":
+                if key in keys:
+                    out[key] = orjson.loads(b"".join(value).rstrip().rstrip(b","))
+                key, value = None, []
+            if start:
+                sep = line.index(b'": ')
+                key = orjson.loads(line[2:sep + 1])
+                if key in keys:
+                    value.append(line[sep + 3:])
+            elif key in keys:
+                value.append(line)
+    return out
+
 def write_spans_jsonl(path: Path, spans: Iterable[Span]) -> None:
-    with path.open("wb") as f:
+    # write-then-rename so concurrent readers never see a truncated file
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
         for s in spans:
             f.write(orjson.dumps(s.__dict__) + b"\n")
+    os.replace(tmp, path)
 
-def read_spans_jsonl(path: Path) -> List[Span]:
+def append_spans_jsonl(path: Path, spans: Iterable[Span]) -> None:
+    """Append spans in a single write, for incremental (page-by-page) ingestion."""
+    data = b"".join(orjson.dumps(s.__dict__) + b"\n" for s in spans)
+    with path.open("ab") as f:
+        f.write(data)
+
+def _span_fields() -> set:
     import dataclasses
-    valid_fields = {f.name for f in dataclasses.fields(Span)}
-    spans: List[Span] = []
-    for line in path.read_bytes().splitlines():
-        d = orjson.loads(line)
-        # tolerate missing optional fields and ignore unknown keys
-        filtered = {k: v for k, v in d.items() if k in valid_fields}
-        # convert pos list back to tuple if present
-        if "pos" in filtered and filtered["pos"] is not None:
-            filtered["pos"] = tuple(filtered["pos"])
-        # convert bbox tuples (orjson deserializes as lists)
-        for bk in ("bbox_pdf", "bbox_norm"):
-            if bk in filtered and filtered[bk] is not None:
-                filtered[bk] = tuple(filtered[bk])
-        spans.append(Span(**filtered))
-    return spans
+    return {f.name for f in dataclasses.fields(Span)}
+
+def _span_from_line(line: bytes, valid_fields: set) -> Span:
+    d = orjson.loads(line)
+    # tolerate missing optional fields and ignore unknown keys
+    filtered = {k: v for k, v in d.items() if k in valid_fields}
+    # convert pos list back to tuple if present
+    if "pos" in filtered and filtered["pos"] is not None:
+        filtered["pos"] = tuple(filtered["pos"])
+    # convert bbox tuples (orjson deserializes as lists)
+    for bk in ("bbox_pdf", "bbox_norm"):
+        if bk in filtered and filtered[bk] is not None:
+            filtered[bk] = tuple(filtered[bk])
+    return Span(**filtered)
+
+def read_spans_jsonl(path: Path) -> List[Span]:
+    valid_fields = _span_fields()
+    data = path.read_bytes()
+    lines = data.splitlines()
+    if data and not data.endswith(b"\n"):
+        lines = lines[:-1]  # trailing line still being appended by an ingest
+    return [_span_from_line(line, valid_fields) for line in lines]
+
+def iter_spans_jsonl(path: Path) -> Iterator[Span]:
+    """read_spans_jsonl one line at a time, so a caller keeping only some spans holds no more."""
+    valid_fields = _span_fields()
+    with path.open("rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # trailing line still being appended by an ingest
+            yield _span_from_line(line, valid_fields)
+
+def cache_path(namespace: str, key: str) -> Path:
+    """Path of a content-addressed cache entry under DATA_DIR/_cache/<namespace>/ (sharded by key prefix)."""
+    return DATA_DIR / "_cache" / namespace / key[:2] / f"{key}.json"
+
+
+def write_json_atomic(path: Path, obj) -> None:
+    """write_json through a unique temp file, safe with concurrent writers (other processes included)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 def conv_path(doc_id: str, conv_id: str) -> Path:
     """Path to a single conversation's JSONL message file."""
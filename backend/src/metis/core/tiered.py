@@ -0,0 +1,176 @@
+"""Two-tier ingestion: blocks-engine spans now, a layout-engine upgrade in the background.
+
+`iter_ingest_tiered` runs the fast blocks engine, so search and chat work
+within seconds, marks the document `"tier": "blocks"` and starts a
+background upgrade. The upgrade runs the layout engine (plus enrichment)
+into a staging directory, re-embeds the new spans if the document had been
+vectorized meanwhile, then swaps every file into place with `os.replace`,
+doc.json last (`"tier": "layout"`). Each file is replaced atomically and
+readers reload on inode/mtime change, so no reader sees a partly written
+file. The swap holds the document's doc_lock, which embedding writers and
+readers also take, so embeddings are never lost or paired with the other
+tier's spans. `wait_for_upgrade` blocks until a running upgrade finishes (the
+`/documents/{doc_id}/events` SSE stream).
+"""
+from __future__ import annotations
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator
+
+import orjson
+
+from .ingest import drain_ingest, iter_ingest_blocks, iter_ingest_layout
+from .store import doc_lock, paths, write_json
+
+log = logging.getLogger(__name__)
+
+# derived files replaced by an upgrade; doc.json is swapped separately, last
+_SWAP_KEYS = ("spans", "page_md", "words", "spatial", "ro_links", "ngrams", "embeddings", "embeddings_meta")
+
+_jobs: Dict[str, threading.Event] = {}
+_jobs_lock = threading.Lock()
+
+
+def _with_words(p: Dict[str, Path]) -> Dict[str, Path]:
+    return {**p, "words": p["page_md"].with_suffix(".words.json")}
+
+
+def _staging_paths(doc_id: str) -> Dict[str, Path]:
+    """paths(doc_id) with the derived files under DATA_DIR/_staging (PDF and assets stay put)."""
+    p = paths(doc_id)
+    stage = p["doc"].parent / "_staging"
+    stage.mkdir(exist_ok=True)
+    out = {k: (stage / v.name if k in _SWAP_KEYS or k == "doc" else v) for k, v in p.items()}
+    return _with_words(out)
+
+
+def _read_meta(p: Dict[str, Path]) -> dict:
+    return orjson.loads(p["doc"].read_bytes())
+
+
+def _set_upgrade(doc_id: str, **upgrade) -> None:
+    p = paths(doc_id)
+    meta = _read_meta(p)
+    meta["upgrade"] = {**meta.get("upgrade", {}), **upgrade}
+    write_json(p["doc"], meta)
+
+
+def _embed_staged(doc_id: str, p: Dict[str, Path], stage: Dict[str, Path]) -> None:
+    """Embed the staged spans if the document has been vectorized (possibly while the upgrade ran)."""
+    if p["embeddings_meta"].exists() and not stage["embeddings_meta"].exists():
+        from .vectorize import vectorize_spans
+        model = orjson.loads(p["embeddings_meta"].read_bytes()).get("model")
+        vectorize_spans(doc_id, model_name=model, out=stage)
+
+
+def iter_ingest_tiered(
+    doc_id: str,
+    *,
+    extract_words: bool = False,
+    write_images: bool = False,
+    dpi: int = 200,
+    source_filename: str | None = None,
+    workers: int | None = None,
+) -> Iterator[dict]:
+    """Blocks-engine ingest (progress events as iter_ingest_blocks), then start the layout upgrade.
+
+    The "done" metadata carries `"tier": "blocks"` and the pending upgrade.
+    """
+    for ev in iter_ingest_blocks(doc_id, source_filename=source_filename, workers=workers):
+        if ev["event"] == "done":
+            meta = ev["meta"]
+            meta["tier"] = "blocks"
+            meta["upgrade"] = {"engine": "pymupdf4llm", "status": "pending"}
+            write_json(paths(doc_id)["doc"], meta)
+            start_upgrade(doc_id, extract_words=extract_words, write_images=write_images, dpi=dpi, workers=workers)
+        yield ev
+
+
+def start_upgrade(doc_id: str, **kwargs) -> bool:
+    """Run `upgrade_to_layout` on a background thread; False if one is already running."""
+    with _jobs_lock:
+        if doc_id in _jobs:
+            return False
+        _jobs[doc_id] = threading.Event()
+
+    def run() -> None:
+        try:
+            upgrade_to_layout(doc_id, **kwargs)
+        except Exception:
+            log.exception("layout upgrade failed: %s", doc_id)
+        finally:
+            with _jobs_lock:
+                _jobs.pop(doc_id).set()
+
+    threading.Thread(target=run, name=f"upgrade-{doc_id[:19]}", daemon=True).start()
+    return True
+
+
+def upgrade_to_layout(
+    doc_id: str,
+    *,
+    extract_words: bool = False,
+    write_images: bool = False,
+    dpi: int = 200,
+    workers: int | None = None,
+) -> dict:
+    """Re-ingest a document with the layout engine and swap the result in; returns the new metadata."""
+    p = _with_words(paths(doc_id))
+    stage = _staging_paths(doc_id)
+    for k in (*_SWAP_KEYS, "doc"):
+        stage[k].unlink(missing_ok=True)
+
+    current = _read_meta(p)
+    _set_upgrade(doc_id, status="running")
+    try:
+        meta = drain_ingest(iter_ingest_layout(
+            doc_id,
+            extract_words=extract_words,
+            write_images=write_images,
+            dpi=dpi,
+            source_filename=current.get("source_filename"),
+            workers=workers,
+            out=stage,
+        ))
+        meta["tier"] = "layout"
+        meta["upgrade"] = {"engine": "pymupdf4llm", "status": "done"}
+        _embed_staged(doc_id, p, stage)
+        write_json(stage["doc"], meta)
+
+        with doc_lock(doc_id):
+            # vectorizing takes the same lock, so this re-check cannot miss
+            # embeddings written after the one above, and readers of the
+            # embeddings see either tier, never a mix
+            _embed_staged(doc_id, p, stage)
+            for k in _SWAP_KEYS:
+                if stage[k].exists():
+                    os.replace(stage[k], p[k])
+                elif k in ("words", "embeddings", "embeddings_meta"):
+                    p[k].unlink(missing_ok=True)  # stale blocks-tier leftovers
+            os.replace(stage["doc"], p["doc"])
+    except Exception as exc:
+        _set_upgrade(doc_id, status="failed", error=f"{type(exc).__name__}: {exc}")
+        raise
+    log.info("upgraded %s to the layout tier (%d spans)", doc_id, meta["n_spans"])
+    return meta
+
+
+def wait_for_upgrade(doc_id: str, timeout: float | None = None) -> dict:
+    """Block until the document's running upgrade (if any) finishes; returns its doc.json.
+
+    An upgrade left "pending" or "running" by a restarted server is reported
+    as "interrupted".
+    """
+    with _jobs_lock:
+        job = _jobs.get(doc_id)
+    if job is not None:
+        job.wait(timeout)
+    meta = _read_meta(paths(doc_id))
+    upgrade = meta.get("upgrade")
+    with _jobs_lock:
+        running = doc_id in _jobs
+    if upgrade and upgrade.get("status") in ("pending", "running") and not running:
+        meta["upgrade"] = {**upgrade, "status": "interrupted"}
+    return meta
@@ -0,0 +1,100 @@
+"""Per-stage ingestion instrumentation: wall time, CPU time and memory peaks.
+
+Each stage accumulates over every time it is entered (e.g. once per page):
+wall and CPU seconds of this process, the growth of the process's peak RSS
+while it ran, and optionally the peak of Python allocations above the
+stage's starting point (tracemalloc; METIS_INGEST_TRACEMALLOC, slows
+ingestion noticeably). CPU spent in worker processes is not included, so a
+parallel stage shows as wall time spent waiting.
+"""
+from __future__ import annotations
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator
+
+from ..settings import INGEST_TRACEMALLOC
+
+
+def _peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KiB on Linux
+
+
+class StageTimer:
+    def __init__(self, trace_memory: bool | None = None):
+        self.trace_memory = INGEST_TRACEMALLOC if trace_memory is None else trace_memory
+        self._started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.stages: Dict[str, dict] = {}
+        self._t0 = time.perf_counter()
+        self._c0 = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        st = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rss_peak_kb": 0})
+        rss0 = _peak_rss_kb()
+        if self.trace_memory:
+            traced0 = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            st["calls"] += 1
+            st["wall_s"] += time.perf_counter() - t0
+            st["cpu_s"] += time.process_time() - c0
+            st["rss_peak_kb"] += _peak_rss_kb() - rss0
+            if self.trace_memory:
+                peak = (tracemalloc.get_traced_memory()[1] - traced0) // 1024
+                st["py_peak_kb"] = max(st.get("py_peak_kb", 0), peak)
+
+    def report(self) -> dict:
+        """Rounded per-stage totals plus a "total" entry; stops tracemalloc if it started it."""
+        out = {
+            name: {k: round(v, 4) if isinstance(v, float) else v for k, v in st.items()}
+            for name, st in self.stages.items()
+        }
+        out["total"] = {
+            "wall_s": round(time.perf_counter() - self._t0, 4),
+            "cpu_s": round(time.process_time() - self._c0, 4),
+            "rss_peak_kb": _peak_rss_kb(),
+        }
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return out
+
+
+def aggregate_timings(metas: Iterable[dict]) -> dict:
+    """Sum the recorded stage timings of many documents (doc.json metadata).
+
+    Returns {"n_docs", "n_pages", "stages": {name: {"docs", "wall_s", "cpu_s",
+    "ms_per_page", "share", "max_rss_peak_kb"}}}; documents ingested before
+    timings were recorded are skipped.
+    """
+    n_docs = n_pages = 0
+    stages: Dict[str, dict] = {}
+    for meta in metas:
+        timings = meta.get("ingest", {}).get("timings")
+        if not timings:
+            continue
+        n_docs += 1
+        n_pages += meta.get("n_pages", 0)
+        for name, st in timings.items():
+            agg = stages.setdefault(name, {"docs": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_rss_peak_kb": 0})
+            agg["docs"] += 1
+            agg["wall_s"] += st.get("wall_s", 0.0)
+            agg["cpu_s"] += st.get("cpu_s", 0.0)
+            agg["max_rss_peak_kb"] = max(agg["max_rss_peak_kb"], st.get("rss_peak_kb", 0))
+    total = stages.get("total", {}).get("wall_s", 0.0)
+    for agg in stages.values():
+        agg["ms_per_page"] = round(1000 * agg["wall_s"] / n_pages, 2) if n_pages else 0.0
+        agg["share"] = round(agg["wall_s"] / total, 4) if total else 0.0
+        agg["wall_s"] = round(agg["wall_s"], 3)
+        agg["cpu_s"] = round(agg["cpu_s"], 3)
+    return {"n_docs": n_docs, "n_pages": n_pages, "stages": stages}
@@ -0,0 +1,109 @@
+"""Cross-turn cache of agent tool results.
+
+Entries are keyed by (doc_id, tool, normalized arguments, index version) and
+shared by every ToolRegistry in the process, so a `rag_retrieve` or
+`read_page` repeated in a later turn (the web API builds a registry per
+request) skips the tool. The index version is the inode/mtime of the files a
+tool reads, so a re-ingested, re-enriched or re-vectorized document misses
+the cache; vectorizing also drops the document's entries outright.
+"""
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable
+
+import orjson
+
+from .store import paths
+from ..settings import TOOL_CACHE_SIZE
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Cache a tool's results for one document; `depends_on` are the paths() keys it reads."""
+    doc_id: str
+    depends_on: tuple[str, ...] = ()
+
+
+class ToolCache:
+    """Thread-safe LRU of tool results."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, doc_id: str) -> int:
+        """Drop every entry of a document; returns how many there were."""
+        with self._lock:
+            stale = [k for k in self._entries if k[0] == doc_id]
+            for k in stale:
+                del self._entries[k]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+tool_cache = ToolCache(TOOL_CACHE_SIZE)
+
+
+def invalidate_tool_cache(doc_id: str) -> int:
+    return tool_cache.invalidate(doc_id)
+
+
+def index_version(doc_id: str, depends_on: tuple[str, ...]) -> tuple[Hashable, ...]:
+    """(st_ino, st_mtime_ns) of each file a tool reads; None for a missing file."""
+    p = paths(doc_id)
+    version = []
+    for k in depends_on:
+        try:
+            st = p[k].stat()
+        except FileNotFoundError:
+            version.append(None)
+        else:
+            version.append((st.st_ino, st.st_mtime_ns))
+    return tuple(version)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def normalize_arguments(arguments: dict[str, Any], parameters: dict) -> bytes:
+    """Canonical form of tool arguments: schema defaults filled in, whitespace
+    in strings collapsed, keys sorted."""
+    args = {
+        name: prop["default"]
+        for name, prop in parameters.get("properties", {}).items()
+        if "default" in prop
+    }
+    args.update(arguments)
+    return orjson.dumps(_normalize(args), option=orjson.OPT_SORT_KEYS)
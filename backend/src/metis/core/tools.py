@@ -1,18 +1,36 @@
 from __future__ import annotations
 
 import json
+import threading
 from typing import Any, Callable
 
 import orjson
 from .llm import ToolDef
+from .neighbors import expand_neighbors
 from .vectorize import retrieve_hybrid
 from .store import paths
+from .toolcache import CachePolicy, index_version, normalize_arguments, tool_cache
+from ..settings import TOOL_CACHE
 from tavily import TavilyClient
 
+# files each document tool reads; a change to any of them invalidates its cached results
+_TOOL_INDEXES = {
+    "rag_retrieve": ("spans", "embeddings", "ro_links"),
+    "read_page": ("page_md",),
+}
+
+
+def cache_policy(tool: str, doc_id: str) -> CachePolicy | None:
+    """The cache policy of a document tool; None for tools that are not cached (web_search)."""
+    depends_on = _TOOL_INDEXES.get(tool)
+    return CachePolicy(doc_id, depends_on) if depends_on is not None else None
+
 
 class ToolRegistry:
     def __init__(self):
-        self._tools: dict[str, tuple[ToolDef, Callable[..., str]]] = {}
+        self._tools: dict[str, tuple[ToolDef, Callable[..., str], CachePolicy | None]] = {}
+        self._cache_counts: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
 
     def register(
         self,
@@ -20,40 +38,79 @@ class ToolRegistry:
         description: str,
         parameters: dict,
         fn: Callable[..., str],
+        cache: CachePolicy | None = None,
     ) -> None:
+        """Add a tool; with a `cache` policy its results are shared across turns (see toolcache)."""
         self._tools[name] = (
             ToolDef(name=name, description=description, parameters=parameters),
             fn,
+            cache,
         )
 
     def tool_defs(self) -> list[ToolDef]:
-        return [td for td, _ in self._tools.values()]
+        return [td for td, _, _ in self._tools.values()]
 
     def call(self, name: str, arguments: dict[str, Any]) -> str:
         if name not in self._tools:
             return json.dumps({"error": f"Unknown tool: {name}"})
-        _, fn = self._tools[name]
+        td, fn, policy = self._tools[name]
+        key = None
+        if policy is not None and TOOL_CACHE:
+            key = (
+                policy.doc_id,
+                name,
+                normalize_arguments(arguments, td.parameters),
+                index_version(policy.doc_id, policy.depends_on),
+            )
+            cached = tool_cache.get(key)
+            self._count(name, "misses" if cached is None else "hits")
+            if cached is not None:
+                return cached
         try:
-            return fn(**arguments)
+            result = fn(**arguments)
         except Exception as exc:
             return json.dumps({"error": f"{type(exc).__name__}: {exc}"})
+        if key is not None:
+            tool_cache.put(key, result)
+        return result
+
+    def _count(self, name: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._cache_counts.setdefault(name, {"hits": 0, "misses": 0})
+            counts[outcome] += 1
+
+    def cache_counts(self, since: dict[str, dict[str, int]] | None = None) -> dict[str, dict[str, int]]:
+        """Per-tool cache {"hits", "misses"} of this registry, minus an earlier snapshot `since`."""
+        with self._lock:
+            out = {name: dict(c) for name, c in self._cache_counts.items()}
+        for name, before in (since or {}).items():
+            for k, n in before.items():
+                out[name][k] -= n
+        return {name: c for name, c in out.items() if c["hits"] or c["misses"]}
 
 
 def make_rag_retrieve_tool(doc_id: str) -> tuple[ToolDef, Callable[..., str]]:
-    def rag_retrieve(query: str, top_k: int = 5) -> str:
+    def rag_retrieve(query: str, top_k: int = 5, neighbors: int = 0) -> str:
         evidence = retrieve_hybrid(doc_id=doc_id, query=query, top_k=top_k)
-        return json.dumps(
-            [
-                {
-                    "span_id": e.span_id,
-                    "text": e.text,
-                    "page": e.page,
-                    "score": e.score,
-                    "bbox_norm": e.bbox_norm,
-                }
-                for e in evidence
-            ]
-        )
+        items = [
+            {
+                "span_id": e.span_id,
+                "text": e.text,
+                "page": e.page,
+                "score": e.score,
+                "bbox_norm": e.bbox_norm,
+            }
+            for e in evidence
+        ]
+        if neighbors > 0 and evidence:
+            # Attach surrounding passages (reading order) as context for each hit
+            groups = expand_neighbors(doc_id, [e.span_id for e in evidence], neighbors, scope="document")
+            for item, group in zip(items, groups):
+                item["context"] = [
+                    {"span_id": s.span_id, "text": s.text, "page": s.page}
+                    for s in group if s.span_id != item["span_id"]
+                ]
+        return json.dumps(items)
 
     tool_def = ToolDef(
         name="rag_retrieve",
@@ -73,6 +130,11 @@ def make_rag_retrieve_tool(doc_id: str) -> tuple[ToolDef, Callable[..., str]]:
                     "description": "Number of results to return (default: 5)",
                     "default": 5,
                 },
+                "neighbors": {
+                    "type": "integer",
+                    "description": "Adjacent passages (in reading order) to include as context on each side of a result (default: 0)",
+                    "default": 0,
+                },
             },
             "required": ["query"],
         },
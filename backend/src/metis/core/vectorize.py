@@ -1,10 +1,17 @@
 from __future__ import annotations
-from typing import List
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List
 import numpy as np
 import orjson
 from .schema import Span, Evidence
-from .store import paths, read_spans_jsonl, write_json
-from ..settings import MIN_CHARS, EMBED_MODEL, TOPK_EVIDENCE, MMR_LAMBDA
+from .neighbors import expand_neighbors
+from .store import doc_lock, paths, read_spans_jsonl, write_json
+from .toolcache import invalidate_tool_cache
+from ..settings import MIN_CHARS, EMBED_CACHE_SIZE, EMBED_MODEL, TOPK_EVIDENCE, MMR_LAMBDA
 
 _SKIP_KINDS = {"picture", "graphic", "formula", "table"}
 
@@ -33,6 +40,50 @@ def _load_model(model_name: str):
         _model_cache[model_name] = SentenceTransformer(model_name)
     return _model_cache[model_name]
 
+# path -> ((st_ino, st_mtime_ns), mapping), least recently used first
+_emb_cache: OrderedDict[str, tuple[tuple[int, int], np.ndarray]] = OrderedDict()
+_emb_cache_lock = threading.Lock()
+
+def _open_embeddings(path: Path) -> np.ndarray:
+    """Open an embeddings matrix as a read-only memory map.
+
+    All processes mapping the same file share one physical copy through the OS
+    page cache. The mapping is cached per path and reopened once the file has
+    been replaced (new inode or mtime); at most METIS_EMBED_CACHE_SIZE
+    mappings are kept, least recently used dropped first.
+    """
+    st = path.stat()
+    stamp = (st.st_ino, st.st_mtime_ns)
+    key = str(path)
+    with _emb_cache_lock:
+        cached = _emb_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            _emb_cache.move_to_end(key)
+            return cached[1]
+    arr = np.load(path, mmap_mode="r")
+    with _emb_cache_lock:
+        _emb_cache[key] = (stamp, arr)
+        _emb_cache.move_to_end(key)
+        while len(_emb_cache) > max(1, EMBED_CACHE_SIZE):
+            _emb_cache.popitem(last=False)
+    return arr
+
+def _save_embeddings(path: Path, embeddings: np.ndarray) -> None:
+    """Write embeddings as C-contiguous float32 and atomically swap the file in.
+
+    Replacing (rather than truncating) the file keeps mappings held by other
+    workers valid until they reopen it.
+    """
+    arr = np.ascontiguousarray(embeddings, dtype=np.float32)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
 import nltk
 nltk.download("punkt_tab", quiet=True)
 nltk.download("stopwords", quiet=True)
@@ -50,17 +101,23 @@ def _tokenize(text: str) -> list[str]:
 
 from rank_bm25 import BM25Okapi
 
-_bm25_cache: dict[str, tuple[BM25Okapi, list[str]]] = {}
+# doc_id -> (index, span_ids, texts, tokens per span)
+_bm25_cache: dict[str, tuple[BM25Okapi, list[str], list[str], list[list[str]]]] = {}
 
 def _get_bm25_index(doc_id: str, spans: list[Span]) -> tuple[BM25Okapi | None, list[str]]:
-    if doc_id not in _bm25_cache:
+    span_ids = [s.span_id for s in spans]
+    texts = [s.text for s in spans]
+    cached = _bm25_cache.get(doc_id)
+    # rebuilt when the document's spans change (re-ingest, tier upgrade, enrichment);
+    # only spans that are new or whose text changed are tokenized again
+    if cached is None or cached[1] != span_ids or cached[2] != texts:
         if not spans:
             return None, []
-        tokenized = [_tokenize(s.text) for s in spans]
+        known = dict(zip(zip(cached[1], cached[2]), cached[3])) if cached else {}
+        tokenized = [known[k] if k in known else _tokenize(k[1]) for k in zip(span_ids, texts)]
         bm25 = BM25Okapi(tokenized)
-        span_ids = [s.span_id for s in spans]
-        _bm25_cache[doc_id] = (bm25, span_ids)
-    return _bm25_cache[doc_id]
+        cached = _bm25_cache[doc_id] = (bm25, span_ids, texts, tokenized)
+    return cached[0], cached[1]
 
 def _bm25_retrieve(doc_id: str, query: str, spans: list[Span]) -> list[tuple[str, float]]:
     bm25, span_ids = _get_bm25_index(doc_id, spans)
@@ -125,6 +182,32 @@ def _mmr_rerank(
 
     return selected
 
+def _with_neighbors(doc_id: str, results: List[Evidence], window: int) -> List[Evidence]:
+    """Follow each hit with its reading-order neighbors (document scope).
+
+    Neighbors inherit the score of the hit they were expanded from; spans that
+    are hits themselves keep their own entry.
+    """
+    if window <= 0 or not results:
+        return results
+    hit_ids = {e.span_id for e in results}
+    groups = expand_neighbors(doc_id, [e.span_id for e in results], window, scope="document")
+    out: List[Evidence] = []
+    seen: set[str] = set()
+    for e, group in zip(results, groups):
+        for s in group or []:
+            if s.span_id in seen or (s.span_id in hit_ids and s.span_id != e.span_id):
+                continue
+            seen.add(s.span_id)
+            out.append(e if s.span_id == e.span_id else Evidence(
+                span_id=s.span_id,
+                page=s.page,
+                bbox_norm=s.bbox_norm,
+                text=s.text,
+                score=e.score,
+            ))
+    return out
+
 def retrieve_hybrid(
     doc_id: str,
     query: str,
@@ -134,16 +217,18 @@ def retrieve_hybrid(
     rrf_k: int = 60,
     mmr_lambda: float | None = None,
     model_name: str | None = None,
+    neighbor_window: int = 0,
 ) -> List[Evidence]:
     mmr_lambda = mmr_lambda if mmr_lambda is not None else MMR_LAMBDA
     model_name = model_name or EMBED_MODEL
     p = paths(doc_id)
 
-    # Load embeddings and spans
-    embeddings = np.load(p["embeddings"])
-    meta = orjson.loads(p["embeddings_meta"].read_bytes())
+    # Load embeddings (memory-mapped) and spans, as one version of the document
+    with doc_lock(doc_id):
+        embeddings = _open_embeddings(p["embeddings"])
+        meta = orjson.loads(p["embeddings_meta"].read_bytes())
+        all_spans = read_spans_jsonl(p["spans"])
     span_ids_embedded = meta["span_ids"]
-    all_spans = read_spans_jsonl(p["spans"])
     span_by_id = {s.span_id: s for s in all_spans}
 
     # Build embeddable span lists (same set used for both dense and BM25)
@@ -193,15 +278,26 @@ def retrieve_hybrid(
             score=float(score),
         ))
 
-    return results
+    return _with_neighbors(doc_id, results, neighbor_window)
 
-def vectorize_spans(doc_id: str, model_name: str | None = None) -> dict:
+def vectorize_spans(doc_id: str, model_name: str | None = None, *, out: dict | None = None) -> dict:
+    """Embed the document's spans; `out` reads and writes staged files instead of `paths(doc_id)`.
+
+    The document's files are embedded under doc_lock, so a tier upgrade
+    cannot swap in new spans between reading them and writing their embeddings.
+    """
+    if out is not None:
+        return _vectorize(doc_id, model_name, out)
+    with doc_lock(doc_id):
+        return _vectorize(doc_id, model_name, paths(doc_id))
+
+
+def _vectorize(doc_id: str, model_name: str | None, p: dict) -> dict:
     model_name = model_name or EMBED_MODEL
-    p = paths(doc_id)
 
     if p["embeddings"].exists() and p["embeddings_meta"].exists():
         meta = orjson.loads(p["embeddings_meta"].read_bytes())
-        embeddings = np.load(p["embeddings"])
+        embeddings = _open_embeddings(p["embeddings"])
         return {
             "doc_id": doc_id,
             "n_embedded": embeddings.shape[0],
@@ -224,18 +320,18 @@ def vectorize_spans(doc_id: str, model_name: str | None = None) -> dict:
             "was_cached": False,
         }
 
-    model = _load_model(model_name)
     texts = [s.text for s in embeddable]
-    embeddings = model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
-    embeddings = np.array(embeddings, dtype=np.float32)
+    rows, n_reused = _parent_embeddings(p, texts, model_name)
+    embeddings, _ = _encode_missing(rows, texts, model_name)
 
-    np.save(p["embeddings"], embeddings)
+    _save_embeddings(p["embeddings"], embeddings)
     meta = {
         "model": model_name,
         "span_ids": [s.span_id for s in embeddable],
         "dim": int(embeddings.shape[1]),
     }
     write_json(p["embeddings_meta"], meta)
+    invalidate_tool_cache(doc_id)
 
     return {
         "doc_id": doc_id,
@@ -244,19 +340,102 @@ def vectorize_spans(doc_id: str, model_name: str | None = None) -> dict:
         "model": model_name,
         "dim": meta["dim"],
         "was_cached": False,
+        "n_reused": n_reused,
     }
 
 
-def retrieve_semantic(doc_id: str, query: str, *, page: int | None = None, top_k: int = TOPK_EVIDENCE, model_name: str | None = None) -> List[Evidence]:
+def _encode_missing(rows: list, texts: List[str], model_name: str) -> tuple[np.ndarray, int]:
+    """Fill the None rows by encoding their texts; returns the matrix and the number encoded."""
+    todo = [i for i, row in enumerate(rows) if row is None]
+    if todo:
+        model = _load_model(model_name)
+        encoded = model.encode([texts[i] for i in todo], normalize_embeddings=True, show_progress_bar=False)
+        for i, vec in zip(todo, encoded):
+            rows[i] = vec
+    return np.array(rows, dtype=np.float32), len(todo)
+
+
+def reembed_spans(doc_id: str, span_ids: Iterable[str]) -> dict:
+    """Patch a vectorized document's embeddings after the text of `span_ids` changed.
+
+    Only those spans (and spans that became embeddable, e.g. enriched
+    formulas) are encoded; every other row is copied from the stored
+    matrix. The BM25 index is refreshed the same way. A document that has
+    not been vectorized is left alone. Runs under doc_lock, like vectorize_spans.
+    """
+    with doc_lock(doc_id):
+        return _reembed(doc_id, span_ids)
+
+
+def _reembed(doc_id: str, span_ids: Iterable[str]) -> dict:
+    p = paths(doc_id)
+    if not (p["embeddings"].exists() and p["embeddings_meta"].exists()):
+        return {"doc_id": doc_id, "n_embedded": 0, "n_reembedded": 0}
+    meta = orjson.loads(p["embeddings_meta"].read_bytes())
+    old = _open_embeddings(p["embeddings"])
+    old_row = {sid: j for j, sid in enumerate(meta["span_ids"])}
+    changed = set(span_ids)
+
+    embeddable = _filter_embeddable(read_spans_jsonl(p["spans"]))
+    rows = [
+        None if s.span_id in changed or s.span_id not in old_row else old[old_row[s.span_id]]
+        for s in embeddable
+    ]
+    embeddings, n_encoded = _encode_missing(rows, [s.text for s in embeddable], meta["model"])
+    if not embeddable:
+        embeddings = np.zeros((0, meta["dim"]), dtype=np.float32)
+    _save_embeddings(p["embeddings"], embeddings)
+    write_json(p["embeddings_meta"], {**meta, "span_ids": [s.span_id for s in embeddable]})
+    _get_bm25_index(doc_id, embeddable)
+    invalidate_tool_cache(doc_id)
+    return {"doc_id": doc_id, "n_embedded": len(embeddable), "n_reembedded": n_encoded}
+
+
+def _parent_embeddings(p: dict, texts: List[str], model_name: str) -> tuple[list, int]:
+    """Rows copied from the parent version's embeddings for texts it already embedded.
+
+    Returns one entry per text (None where the text still has to be encoded)
+    and the number of copied rows. Only used when the document was ingested
+    with a `parent` and that parent was vectorized with the same model.
+    """
+    rows: list = [None] * len(texts)
+    if not p["doc"].exists():
+        return rows, 0
+    parent = (orjson.loads(p["doc"].read_bytes()).get("lineage") or {}).get("parent")
+    if not parent:
+        return rows, 0
+    pp = paths(parent)
+    if not (pp["embeddings"].exists() and pp["embeddings_meta"].exists()):
+        return rows, 0
+    pmeta = orjson.loads(pp["embeddings_meta"].read_bytes())
+    if pmeta.get("model") != model_name:
+        return rows, 0
+    text_by_id = {s.span_id: s.text for s in read_spans_jsonl(pp["spans"])}
+    row_by_text = {}
+    for j, sid in enumerate(pmeta["span_ids"]):
+        if sid in text_by_id:
+            row_by_text.setdefault(text_by_id[sid], j)
+    parent_emb = _open_embeddings(pp["embeddings"])
+    n = 0
+    for i, t in enumerate(texts):
+        j = row_by_text.get(t)
+        if j is not None:
+            rows[i] = parent_emb[j]
+            n += 1
+    return rows, n
+
+
+def retrieve_semantic(doc_id: str, query: str, *, page: int | None = None, top_k: int = TOPK_EVIDENCE, model_name: str | None = None, neighbor_window: int = 0) -> List[Evidence]:
     model_name = model_name or EMBED_MODEL
     p = paths(doc_id)
 
-    embeddings = np.load(p["embeddings"])
-    meta = orjson.loads(p["embeddings_meta"].read_bytes())
+    with doc_lock(doc_id):
+        embeddings = _open_embeddings(p["embeddings"])
+        meta = orjson.loads(p["embeddings_meta"].read_bytes())
+        all_spans = read_spans_jsonl(p["spans"])
     span_ids_embedded = meta["span_ids"]
 
     # Build span lookup
-    all_spans = read_spans_jsonl(p["spans"])
     span_by_id = {s.span_id: s for s in all_spans}
 
     # Embed query
@@ -287,4 +466,4 @@ def retrieve_semantic(doc_id: str, query: str, *, page: int | None = None, top_k
         if len(results) >= top_k:
             break
 
-    return results
+    return _with_neighbors(doc_id, results, neighbor_window)
@@ -28,8 +28,29 @@ def _cfg(env_var: str, toml_key: str, default: str = "") -> str:
 MIN_CHARS = int(os.getenv("METIS_MIN_CHARS", "20"))
 TOPK_EVIDENCE = int(os.getenv("METIS_TOPK_EVIDENCE", "8"))
 NEIGHBOR_WINDOW = int(os.getenv("METIS_NEIGHBOR_WINDOW", "1"))
+# Fuzzy evidence matching (rapidfuzz): minimum partial_ratio score to keep, and
+# thread count for batch scoring (-1 = all cores).
+FUZZY_SCORE_CUTOFF = float(os.getenv("METIS_FUZZY_SCORE_CUTOFF", "0"))
+FUZZY_WORKERS = int(os.getenv("METIS_FUZZY_WORKERS", "-1"))
+# Page-free text location: spans shortlisted from the n-gram index before fuzzy
+# verification, and the minimum partial_ratio a located span must reach.
+LOCATE_CANDIDATES = int(os.getenv("METIS_LOCATE_CANDIDATES", "64"))
+LOCATE_MIN_SCORE = float(os.getenv("METIS_LOCATE_MIN_SCORE", "60"))
+
+# Page-parallel ingestion: worker processes (1 = serial, 0 = one per CPU), and
+# the page count below which a document is always extracted serially.
+INGEST_WORKERS = int(os.getenv("METIS_INGEST_WORKERS", "1"))
+INGEST_PARALLEL_MIN_PAGES = int(os.getenv("METIS_INGEST_PARALLEL_MIN_PAGES", "16"))
+# Layout ingestion processes and flushes this many pages at a time (spans,
+# enrichment, page markdown, words), so those are not held for the whole
+# document. The side-index arrays still grow with the page count.
+INGEST_WINDOW_PAGES = int(os.getenv("METIS_INGEST_WINDOW_PAGES", "16"))
+# Record Python allocation peaks per ingestion stage (tracemalloc; slow).
+INGEST_TRACEMALLOC = os.getenv("METIS_INGEST_TRACEMALLOC", "false").lower() in ("true", "1", "yes")
 
 EMBED_MODEL = os.getenv("METIS_EMBED_MODEL", "all-MiniLM-L6-v2")
+# Embedding matrices kept memory-mapped at once (least recently used are closed).
+EMBED_CACHE_SIZE = int(os.getenv("METIS_EMBED_CACHE_SIZE", "64"))
 
 # --- Agent / LLM settings ---
 LLM_PROVIDER = _cfg("METIS_LLM_PROVIDER", "provider", "anthropic")
@@ -44,9 +65,39 @@ TAVILY_API_KEY = _cfg("METIS_TAVILY_API_KEY", "tavily_api_key") or os.getenv("TA
 
 AGENT_MAX_ITER = int(os.getenv("METIS_AGENT_MAX_ITER", "10"))
 AGENT_TEMPERATURE = float(os.getenv("METIS_AGENT_TEMPERATURE", "0.0"))
+# Threads running the tool calls of one agent iteration concurrently.
+AGENT_TOOL_WORKERS = int(os.getenv("METIS_AGENT_TOOL_WORKERS", "4"))
+# Cache document tool results (rag_retrieve, read_page) across turns.
+TOOL_CACHE = os.getenv("METIS_TOOL_CACHE", "true").lower() in ("true", "1", "yes")
+TOOL_CACHE_SIZE = int(os.getenv("METIS_TOOL_CACHE_SIZE", "512"))
 MMR_LAMBDA = float(os.getenv("METIS_MMR_LAMBDA", "0.7"))
 CITATION_MIN_SCORE = float(os.getenv("METIS_CITATION_MIN_SCORE", "0.0"))
 
 # --- Multimodal enrichment ---
 ENABLE_ENRICHMENT = os.getenv("METIS_ENABLE_ENRICHMENT", "true").lower() in ("true", "1", "yes")
+# Write un-enriched spans first and enrich them in a background job.
+DEFER_ENRICHMENT = os.getenv("METIS_DEFER_ENRICHMENT", "false").lower() in ("true", "1", "yes")
+# Formula/table crops recognized per pix2text call.
+ENRICH_BATCH_SIZE = int(os.getenv("METIS_ENRICH_BATCH_SIZE", "16"))
+# Enrichment worker processes (1 = in the ingesting process, 0 = one per CPU);
+# each worker loads its own pix2text models.
+ENRICH_WORKERS = int(os.getenv("METIS_ENRICH_WORKERS", "1"))
+# Cache recognized formula/table text by crop content under DATA_DIR/_cache/enrich.
+ENRICH_CACHE = os.getenv("METIS_ENRICH_CACHE", "true").lower() in ("true", "1", "yes")
+# Enrichment crop images: format (png, webp or jpeg), webp/jpeg quality,
+# PNG compression level (0-9) and writer threads.
+ENRICH_ASSET_FORMAT = os.getenv("METIS_ENRICH_ASSET_FORMAT", "png").lower()
+ENRICH_ASSET_QUALITY = int(os.getenv("METIS_ENRICH_ASSET_QUALITY", "80"))
+ENRICH_ASSET_PNG_LEVEL = int(os.getenv("METIS_ENRICH_ASSET_PNG_LEVEL", "6"))
+ENRICH_ASSET_WORKERS = int(os.getenv("METIS_ENRICH_ASSET_WORKERS", "4"))
+# Enrichment cost gating. Crops smaller than MIN_AREA of their page (fraction)
+# are skipped; crops larger than MAX_AREA are rendered at LARGE_DPI instead of
+# the full 200 dpi (0 = skip them). A span whose recognition takes longer
+# than SPAN_BUDGET_S keeps its original text; once DOC_BUDGET_S of enrichment
+# has been spent on a document its remaining spans are skipped (0 = no limit).
+ENRICH_MIN_AREA = float(os.getenv("METIS_ENRICH_MIN_AREA", "0.0005"))
+ENRICH_MAX_AREA = float(os.getenv("METIS_ENRICH_MAX_AREA", "0.5"))
+ENRICH_LARGE_DPI = int(os.getenv("METIS_ENRICH_LARGE_DPI", "120"))
+ENRICH_SPAN_BUDGET_S = float(os.getenv("METIS_ENRICH_SPAN_BUDGET_S", "15"))
+ENRICH_DOC_BUDGET_S = float(os.getenv("METIS_ENRICH_DOC_BUDGET_S", "600"))
 
@@ -25,9 +25,25 @@ def pdf_bytes() -> bytes:
 
 
 @pytest.fixture()
-def client(tmp_path, monkeypatch) -> TestClient:
-    """TestClient with DATA_DIR patched to tmp_path (isolated per test)."""
+def data_dir(tmp_path, monkeypatch):
+    """DATA_DIR patched to tmp_path (isolated per test)."""
     monkeypatch.setattr("metis.core.store.DATA_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture()
+def enrichment(monkeypatch):
+    """Ingest-time enrichment (ENABLE_ENRICHMENT) turned off; call the result with True to turn it on."""
+    def set_enabled(enabled: bool) -> None:
+        monkeypatch.setattr("metis.core.ingest.ENABLE_ENRICHMENT", enabled)
+
+    set_enabled(False)
+    return set_enabled
+
+
+@pytest.fixture()
+def client(data_dir) -> TestClient:
+    """TestClient over an isolated DATA_DIR (see data_dir)."""
     return TestClient(app)
 
 
@@ -1,5 +1,6 @@
+import asyncio
 import json
-from metis.core.agent import run_agent
+from metis.core.agent import arun_agent, run_agent
 from metis.core.schema import Message, ToolCall, ToolResult
 from metis.core.llm import StreamEvent, ToolDef
 from metis.core.tools import ToolRegistry
@@ -70,3 +71,97 @@ def test_agent_loop_respects_max_iterations():
     )
     # Should stop after max_iterations even though model keeps issuing tool calls
     assert result is not None
+
+
+def test_tool_calls_run_concurrently_in_call_order():
+    import time
+
+    class ParallelCallsModel:
+        def __init__(self):
+            self.seen: list[Message] = []
+
+        def stream(self, messages, tools, system):
+            if messages[-1].role == "tool":
+                self.seen = list(messages)
+                msg = Message(role="assistant", content="done")
+                yield StreamEvent(kind="message_done", message=msg)
+                return
+            calls = [
+                ToolCall(id="tc_slow", name="rag_retrieve", arguments={"query": "slow"}),
+                ToolCall(id="tc_fast", name="rag_retrieve", arguments={"query": "fast"}),
+                ToolCall(id="tc_web", name="web_search", arguments={"query": "web"}),
+            ]
+            yield StreamEvent(kind="message_done", message=Message(role="assistant", tool_calls=calls))
+
+    def rag_retrieve(query):
+        time.sleep(0.3 if query == "slow" else 0.05)
+        return json.dumps([{"span_id": f"s_{query}", "text": query, "score": 1.0}])
+
+    def web_search(query):
+        time.sleep(0.05)
+        return json.dumps([{"title": query}])
+
+    registry = ToolRegistry()
+    registry.register(name="rag_retrieve", description="", parameters={}, fn=rag_retrieve)
+    registry.register(name="web_search", description="", parameters={}, fn=web_search)
+    events: list[StreamEvent] = []
+    model = ParallelCallsModel()
+
+    t0 = time.perf_counter()
+    result = run_agent(
+        model=model, doc_id="sha256:test", user_query="q", tools=registry,
+        system_prompt="test", on_stream=events.append,
+    )
+    assert time.perf_counter() - t0 < 0.35
+    assert result.content == "done"
+    tool_msg = model.seen[-1]
+    assert [r.tool_call_id for r in tool_msg.tool_results] == ["tc_slow", "tc_fast", "tc_web"]
+    assert json.loads(tool_msg.tool_results[0].content)[0]["span_id"] == "s_slow"
+    # citations stream as calls finish
+    assert [e.tool_call_id for e in events if e.kind == "citation_data"] == ["tc_fast", "tc_slow"]
+
+
+def test_async_agent_yields_the_sync_agents_events():
+    class AsyncMockModel(MockModel):
+        async def astream(self, messages, tools, system):
+            for event in self.stream(messages, tools, system):
+                yield event
+
+    registry = ToolRegistry()
+    registry.register(name="echo", description="Echo", parameters={}, fn=lambda text="": text)
+    kw = dict(doc_id="sha256:test", user_query="Say hello", tools=registry, system_prompt="test")
+
+    sync_events: list[StreamEvent] = []
+    run_agent(model=MockModel(), on_stream=sync_events.append, **kw)
+
+    async def collect():
+        return [event async for event in arun_agent(model=AsyncMockModel(), **kw)]
+
+    async_events = asyncio.run(collect())
+    assert async_events == sync_events
+    assert [e.kind for e in async_events][-2:] == ["message_done", "agent_done"]
+
+
+def test_async_agent_keeps_io_and_tools_off_the_event_loop(monkeypatch):
+    import threading
+    from metis.core import agent
+
+    class AsyncMockModel(MockModel):
+        async def astream(self, messages, tools, system):
+            for event in self.stream(messages, tools, system):
+                yield event
+
+    threads: list[threading.Thread] = []
+    real_load_history = agent._load_history
+    monkeypatch.setattr(agent, "_load_history", lambda *a: threads.append(threading.current_thread()) or real_load_history(*a))
+    registry = ToolRegistry()
+    registry.register(name="echo", description="Echo", parameters={}, fn=lambda text="": threads.append(threading.current_thread()) or text)
+
+    async def collect():
+        return [event async for event in arun_agent(
+            model=AsyncMockModel(), doc_id="sha256:test", user_query="Say hello", tools=registry, system_prompt="test",
+        )]
+
+    asyncio.run(collect())
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
@@ -0,0 +1,86 @@
+import orjson
+import pymupdf
+import pytest
+from metis.core.bulk import ingest_dir, read_manifest
+
+
+def _pdf(text: str) -> bytes:
+    doc = pymupdf.open()
+    for i in range(2):
+        doc.new_page().insert_text((50, 100), f"{text} on page {i}, long enough to keep.", fontsize=11)
+    return doc.tobytes()
+
+
+@pytest.fixture()
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr("metis.core.store.DATA_DIR", tmp_path / "data")
+    monkeypatch.setenv("METIS_DATA_DIR", str(tmp_path / "data"))  # for pool workers
+    (tmp_path / "data").mkdir()
+    src = tmp_path / "papers"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.pdf").write_bytes(_pdf("Paper A"))
+    (src / "sub" / "b.pdf").write_bytes(_pdf("Paper B"))
+    (src / "copy_of_a.pdf").write_bytes((src / "a.pdf").read_bytes())
+    (src / "broken.pdf").write_bytes(b"not a pdf")
+    (src / "notes.txt").write_text("ignored")
+    return src, tmp_path / "manifest.jsonl"
+
+
+def test_ingest_dir_summary_and_manifest(archive):
+    src, manifest = archive
+    summary = ingest_dir(src, engine="blocks", workers=1, manifest=manifest)
+    assert summary["n_files"] == 4
+    assert summary["n_ok"] == 2
+    assert summary["n_skipped"] == 1          # copy_of_a has the same doc_id as a
+    assert summary["n_failed"] == 1
+    assert summary["failures"][0]["path"].endswith("broken.pdf")
+    assert summary["n_pages"] == 4
+    assert summary["pages_per_sec"] > 0
+    records = [orjson.loads(line) for line in manifest.read_bytes().splitlines()]
+    assert {r["status"] for r in records} == {"ok", "skipped", "error"}
+
+
+def test_ingest_dir_resumes_from_manifest(archive):
+    src, manifest = archive
+    ingest_dir(src, engine="blocks", workers=1, manifest=manifest)
+    seen = []
+    summary = ingest_dir(src, engine="blocks", workers=1, manifest=manifest, on_result=seen.append)
+    assert summary["n_resumed"] == 3
+    assert [r["path"].rsplit("/", 1)[-1] for r in seen] == ["broken.pdf"]   # failures are retried
+    assert len(read_manifest(manifest)) == 3
+
+
+def test_ingest_dir_skips_documents_already_in_store(archive):
+    src, manifest = archive
+    ingest_dir(src, engine="blocks", workers=1, manifest=manifest)
+    manifest.unlink()
+    summary = ingest_dir(src, engine="blocks", workers=1, manifest=manifest)
+    assert summary["n_ok"] == 0
+    assert summary["n_skipped"] == 3
+    assert summary["n_pages"] == 0
+
+
+def test_ingest_dir_ingests_duplicate_content_once(archive):
+    src, manifest = archive
+    (src / "a.pdf").unlink()
+    (src / "sub" / "b.pdf").unlink()
+    (src / "broken.pdf").unlink()
+    (src / "another_copy.pdf").write_bytes((src / "copy_of_a.pdf").read_bytes())
+    summary = ingest_dir(src, engine="blocks", workers=2, manifest=manifest)
+    assert (summary["n_ok"], summary["n_skipped"], summary["n_failed"]) == (1, 1, 0)
+    records = [orjson.loads(line) for line in manifest.read_bytes().splitlines()]
+    assert len({r["doc_id"] for r in records}) == 1
+    assert [r["duplicate_of"] for r in records if r["status"] == "skipped"] == [records[0]["path"]]
+
+
+def test_ingest_dir_reingests_unfinished_documents(archive):
+    src, manifest = archive
+    ingest_dir(src, engine="blocks", workers=1, manifest=manifest)
+    manifest.unlink()
+    doc_json = next((src.parent / "data").glob("*.doc.json"))
+    meta = orjson.loads(doc_json.read_bytes())
+    del meta["ingest"]["complete"]       # e.g. killed while writing the side indexes
+    doc_json.write_bytes(orjson.dumps(meta))
+    summary = ingest_dir(src, engine="blocks", workers=1, manifest=manifest)
+    assert summary["n_ok"] == 1
+    assert summary["n_skipped"] == 2
@@ -11,3 +11,20 @@ def test_vectorize_command_exists():
 def test_retrieve_semantic_command_exists():
     result = runner.invoke(app, ["retrieve-semantic", "--help"])
     assert result.exit_code == 0
+
+def test_ingest_dir_command_exists():
+    result = runner.invoke(app, ["ingest-dir", "--help"])
+    assert result.exit_code == 0
+    assert "--vectorize" in result.output
+
+def test_ingest_stats_reports_stages(tmp_path, monkeypatch):
+    import orjson
+    monkeypatch.setattr("metis.settings.DATA_DIR", tmp_path)
+    timings = {"to_markdown": {"calls": 2, "wall_s": 1.5, "cpu_s": 1.4, "rss_peak_kb": 2048}, "total": {"wall_s": 2.0, "cpu_s": 1.8, "rss_peak_kb": 4096}}
+    (tmp_path / "a.doc.json").write_bytes(orjson.dumps({"doc_id": "a", "n_pages": 2, "ingest": {"engine": "pymupdf4llm", "timings": timings}}))
+    result = runner.invoke(app, ["ingest-stats", "--json"])
+    assert result.exit_code == 0
+    stats = orjson.loads(result.output)
+    assert stats["n_docs"] == 1
+    assert stats["stages"]["to_markdown"]["ms_per_page"] == 750.0
+    assert stats["stages"]["to_markdown"]["share"] == 0.75
@@ -0,0 +1,120 @@
+import dataclasses
+import threading
+
+import numpy as np
+import orjson
+import pytest
+from metis.core import deferred, vectorize
+from metis.core.enrich import EnrichExecutor
+from metis.core.ingest import drain_ingest, iter_ingest_layout
+from metis.core.store import paths, read_spans_jsonl, store_pdf_bytes, write_spans_jsonl
+
+
+def _enrich_first_span(monkeypatch, gate: threading.Event | None = None):
+    """Fake enrichment: the first embeddable span gets new text."""
+    def enrich(self, spans, pdf, stats=None, budget=None):
+        if gate is not None:
+            gate.wait(30)
+        out = list(spans)
+        i = next(i for i, s in enumerate(spans) if len(s.text) > 20 and s.content_source is None)
+        out[i] = dataclasses.replace(spans[i], text="$$E = mc^2$$ energy equivalence", content_source="pix2text_mfr", original_text=spans[i].text)
+        if stats is not None:
+            stats["formula"] = {"spans": 1, "enriched": 1}
+        return out
+
+    monkeypatch.setattr(EnrichExecutor, "enrich", enrich)
+
+
+def test_deferred_ingest_serves_spans_then_enriches(data_dir, pdf_bytes, monkeypatch, enrichment):
+    enrichment(True)
+    gate = threading.Event()
+    _enrich_first_span(monkeypatch, gate)
+    doc_id = store_pdf_bytes(pdf_bytes)
+    meta = drain_ingest(iter_ingest_layout(doc_id, write_images=False, workers=1, defer_enrichment=True))
+    p = paths(doc_id)
+    assert meta["enrichment"] == {"status": "pending"}
+    assert "enrichment" not in meta["ingest"]
+    assert not any(s.content_source for s in read_spans_jsonl(p["spans"]))
+
+    gate.set()
+    final = deferred.wait_for_enrichment(doc_id, timeout=30)
+    assert final["enrichment"] == {"status": "done", "changed": 1, "reembedded": 0}
+    assert final["ingest"]["enrichment"]["formula"]["enriched"] == 1
+    spans = read_spans_jsonl(p["spans"])
+    assert [s.content_source for s in spans].count("pix2text_mfr") == 1
+    assert len(spans) == meta["n_spans"]
+
+
+def test_enrichment_reembeds_only_changed_spans(data_dir, pdf_bytes, monkeypatch, enrichment):
+    encoded: list[str] = []
+
+    class FakeModel:
+        def encode(self, texts, **kw):
+            encoded.extend(texts)
+            return np.array([[float(len(t)), 1.0, 0.0] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(vectorize, "_load_model", lambda name: FakeModel())
+    doc_id = store_pdf_bytes(pdf_bytes)
+    drain_ingest(iter_ingest_layout(doc_id, write_images=False, workers=1))
+    vectorize.vectorize_spans(doc_id, model_name="fake")
+    p = paths(doc_id)
+    before = np.load(p["embeddings"]).copy()
+    ids_before = orjson.loads(p["embeddings_meta"].read_bytes())["span_ids"]
+    embeddable = vectorize._filter_embeddable(read_spans_jsonl(p["spans"]))
+    vectorize._get_bm25_index(doc_id, embeddable)
+
+    tokenized: list[str] = []
+    real_tokenize = vectorize._tokenize
+    monkeypatch.setattr(vectorize, "_tokenize", lambda t: tokenized.append(t) or real_tokenize(t))
+    encoded.clear()
+    _enrich_first_span(monkeypatch)
+    meta = deferred.enrich_document(doc_id)
+
+    assert meta["enrichment"] == {"status": "done", "changed": 1, "reembedded": 1}
+    assert encoded == tokenized == ["$$E = mc^2$$ energy equivalence"]
+    after = np.load(p["embeddings"])
+    assert orjson.loads(p["embeddings_meta"].read_bytes())["span_ids"] == ids_before
+    changed = [i for i in range(len(after)) if not np.array_equal(after[i], before[i])]
+    assert len(changed) == 1
+    embeddable = vectorize._filter_embeddable(read_spans_jsonl(p["spans"]))
+    top_id, top_score = vectorize._bm25_retrieve(doc_id, "energy equivalence", embeddable)[0]
+    assert top_id == ids_before[changed[0]]
+    assert top_score > 0
+
+
+def test_spans_replaced_during_enrichment_are_enriched_instead(data_dir, pdf_bytes, monkeypatch, enrichment):
+    doc_id = store_pdf_bytes(pdf_bytes)
+    drain_ingest(iter_ingest_layout(doc_id, write_images=False, workers=1))
+    p = paths(doc_id)
+    seen: list[str] = []
+
+    def enrich(self, spans, pdf, stats=None, budget=None):
+        seen.append(spans[0].text)
+        if len(seen) == 1:  # a re-ingest lands while the first version is enriched
+            write_spans_jsonl(p["spans"], [dataclasses.replace(s, text=f"{s.text} v2") for s in spans])
+        return [dataclasses.replace(spans[0], text=f"{spans[0].text} enriched", content_source="pix2text_mfr"), *spans[1:]]
+
+    monkeypatch.setattr(EnrichExecutor, "enrich", enrich)
+    deferred.enrich_document(doc_id)
+
+    assert len(seen) == 2 and seen[1].endswith(" v2")
+    spans = read_spans_jsonl(p["spans"])
+    assert spans[0].text.endswith(" v2 enriched")
+    assert all(s.text.endswith(" v2") for s in spans[1:])
+
+
+def test_failed_enrichment_is_recorded(data_dir, pdf_bytes, monkeypatch, enrichment):
+    doc_id = store_pdf_bytes(pdf_bytes)
+    drain_ingest(iter_ingest_layout(doc_id, write_images=False, workers=1))
+    before = paths(doc_id)["spans"].read_bytes()
+
+    def boom(self, spans, pdf, stats=None, budget=None):
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(EnrichExecutor, "enrich", boom)
+    with pytest.raises(RuntimeError):
+        deferred.enrich_document(doc_id)
+    meta = deferred.wait_for_enrichment(doc_id)
+    assert meta["enrichment"]["status"] == "failed"
+    assert "model crashed" in meta["enrichment"]["error"]
+    assert paths(doc_id)["spans"].read_bytes() == before
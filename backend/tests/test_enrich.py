@@ -2,6 +2,7 @@
 from __future__ import annotations
 from unittest.mock import patch, MagicMock
 import os
+import time
 import pytest
 import pymupdf
 
@@ -62,6 +63,37 @@ class TestRenderBbox:
         assert img.height > 0
 
 
+
+class TestPageCrops:
+    def test_pages_with_several_regions_render_once(self):
+        import numpy as np
+        from metis.core.enrich import _PageCrops
+        doc = pymupdf.open()
+        for _ in range(2):
+            page = doc.new_page(width=612, height=792)
+            for j in range(3):
+                page.insert_text((60, 120 + 80 * j), f"x^{j} + y_{j} = z", fontsize=14)
+        boxes = [(50.0, 100.0 + 80 * j, 300.0, 130.0 + 80 * j) for j in range(3)]
+        crops = _PageCrops(doc, {0: boxes, 1: boxes[:1]})
+
+        images = [crops.crop(0, b) for b in boxes]
+        assert crops.page_renders == 1 and crops.clip_renders == 0
+        for b, img in zip(boxes, images):
+            clip = _render_bbox(doc, page=0, bbox_pdf=b)
+            assert img.size == clip.size
+            assert np.array_equal(np.asarray(img), np.asarray(clip))
+
+        crops.crop(1, boxes[0])  # a single small region: clip rendering
+        assert crops.page_renders == 1 and crops.clip_renders == 1
+
+    def test_single_large_region_uses_page_render(self, simple_pdf_bytes):
+        from metis.core.enrich import _PageCrops
+        doc = pymupdf.open(stream=simple_pdf_bytes, filetype="pdf")
+        crops = _PageCrops(doc, {0: [(0.0, 0.0, 612.0, 500.0)]})
+        assert crops.crop(0, (0.0, 0.0, 612.0, 500.0)).size == (1700, 1389)
+        assert crops.page_renders == 1
+
+
 class TestEnrichVisualSpans:
     def test_text_spans_unchanged(self, simple_pdf_bytes):
         """Text spans pass through without modification."""
@@ -73,9 +105,8 @@ class TestEnrichVisualSpans:
         assert result[0].asset_path is None
 
     @patch("metis.core.enrich._get_p2t")
-    def test_formula_span_enriched(self, mock_get_p2t, simple_pdf_bytes, tmp_path, monkeypatch):
+    def test_formula_span_enriched(self, mock_get_p2t, simple_pdf_bytes, data_dir):
         """Formula span gets LaTeX text from pix2text."""
-        monkeypatch.setattr("metis.core.store.DATA_DIR", tmp_path)
         mock_p2t = MagicMock()
         mock_p2t.recognize_formula.return_value = "E = mc^2"
         mock_get_p2t.return_value = mock_p2t
@@ -91,9 +122,8 @@ class TestEnrichVisualSpans:
         mock_p2t.recognize_formula.assert_called_once()
 
     @patch("metis.core.enrich._get_p2t")
-    def test_table_span_enriched(self, mock_get_p2t, simple_pdf_bytes, tmp_path, monkeypatch):
+    def test_table_span_enriched(self, mock_get_p2t, simple_pdf_bytes, data_dir):
         """Table span gets markdown text from pix2text."""
-        monkeypatch.setattr("metis.core.store.DATA_DIR", tmp_path)
         mock_p2t = MagicMock()
         mock_p2t.table_ocr.recognize.return_value = {"markdown": ["| A | B |\n|---|---|\n| 1 | 2 |"]}
         mock_get_p2t.return_value = mock_p2t
@@ -116,9 +146,8 @@ class TestEnrichVisualSpans:
         assert result[0].content_source is None
 
     @patch("metis.core.enrich._get_p2t")
-    def test_pix2text_error_keeps_original_but_saves_asset(self, mock_get_p2t, simple_pdf_bytes, tmp_path, monkeypatch):
+    def test_pix2text_error_keeps_original_but_saves_asset(self, mock_get_p2t, simple_pdf_bytes, data_dir):
         """When pix2text raises, original text is preserved but asset is still saved."""
-        monkeypatch.setattr("metis.core.store.DATA_DIR", tmp_path)
         mock_p2t = MagicMock()
         mock_p2t.recognize_formula.side_effect = RuntimeError("model failed")
         mock_get_p2t.return_value = mock_p2t
@@ -129,11 +158,11 @@ class TestEnrichVisualSpans:
         assert result[0].text == "garbled"
         assert result[0].content_source is None
         assert result[0].asset_path is not None  # image saved before extraction attempt
+        assert result[0].enrich_status == "failed"
 
     @patch("metis.core.enrich._get_p2t")
-    def test_mixed_spans_only_enrichable_processed(self, mock_get_p2t, simple_pdf_bytes, tmp_path, monkeypatch):
+    def test_mixed_spans_only_enrichable_processed(self, mock_get_p2t, simple_pdf_bytes, data_dir):
         """Only formula/table spans are processed; text and picture pass through."""
-        monkeypatch.setattr("metis.core.store.DATA_DIR", tmp_path)
         mock_p2t = MagicMock()
         mock_p2t.recognize_formula.return_value = "x^2"
         mock_get_p2t.return_value = mock_p2t
@@ -153,11 +182,290 @@ class TestEnrichVisualSpans:
         assert result[2].content_source is None
 
 
+    @patch("metis.core.enrich._get_p2t")
+    def test_formulas_recognized_in_batches(self, mock_get_p2t, simple_pdf_bytes, data_dir):
+        """Formula crops go to pix2text batch_size at a time; results map back to their spans."""
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.side_effect = lambda imgs, **kw: (
+            [f"x_{i}" for i in range(len(imgs))] if isinstance(imgs, list) else "y"
+        )
+        mock_get_p2t.return_value = mock_p2t
+
+        spans = [_make_span(kind="formula", text=f"garbled {i}", span_id=f"p000_L{i:04d}") for i in range(5)]
+        spans.insert(2, _make_span(kind="text", text="Regular text.", span_id="p000_L0099"))
+        stats: dict = {}
+        result = enrich_visual_spans(spans, simple_pdf_bytes, batch_size=2, stats=stats, use_cache=False)
+
+        calls = mock_p2t.recognize_formula.call_args_list
+        assert [len(c.args[0]) if isinstance(c.args[0], list) else 1 for c in calls] == [2, 2, 1]
+        assert [s.text for s in result] == ["$$x_0$$", "$$x_1$$", "Regular text.", "$$x_0$$", "$$x_1$$", "$$y$$"]
+        assert [s.original_text for s in result if s.content_source] == [f"garbled {i}" for i in range(5)]
+        assert stats["formula"]["spans"] == stats["formula"]["enriched"] == 5
+        assert stats["formula"]["batches"] == 3
+        assert stats["formula"]["spans_per_s"] > 0
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_failed_batch_retries_spans_individually(self, mock_get_p2t, simple_pdf_bytes, data_dir):
+        """One bad crop fails only its own span, not the rest of its batch."""
+        n_calls = iter(range(100))
+
+        def recognize(img, **kw):
+            if isinstance(img, list) or next(n_calls) == 1:
+                raise RuntimeError("model failed")
+            return "z"
+
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.side_effect = recognize
+        mock_get_p2t.return_value = mock_p2t
+
+        spans = [_make_span(kind="formula", text=f"garbled {i}", span_id=f"p000_L{i:04d}") for i in range(3)]
+        stats: dict = {}
+        result = enrich_visual_spans(spans, simple_pdf_bytes, batch_size=3, stats=stats, use_cache=False)
+
+        assert [s.text for s in result] == ["$$z$$", "garbled 1", "$$z$$"]
+        assert result[1].content_source is None
+        assert result[1].asset_path is not None
+        assert stats["formula"] == {**stats["formula"], "spans": 3, "enriched": 2, "failed": 1, "batches": 1}
+
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_recognized_text_is_cached_by_crop_content(self, mock_get_p2t, simple_pdf_bytes, data_dir):
+        """A crop with the same pixels skips the model, across calls and documents."""
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.return_value = "E = mc^2"
+        mock_get_p2t.return_value = mock_p2t
+
+        first: dict = {}
+        enrich_visual_spans([_make_span(kind="formula", text="garbled")], simple_pdf_bytes, stats=first)
+        assert first["formula"]["cache_hits"] == 0
+        assert len(list((data_dir / "_cache" / "enrich").rglob("*.json"))) == 1
+
+        spans = [
+            _make_span(kind="formula", text="garbled", doc_id="sha256:other", span_id="p000_L0001"),
+            _make_span(kind="formula", text="other", span_id="p000_L0002", bbox_pdf=(40.0, 90.0, 200.0, 140.0)),
+        ]
+        again: dict = {}
+        result = enrich_visual_spans(spans, simple_pdf_bytes, stats=again)
+        assert [s.text for s in result] == ["$$E = mc^2$$", "$$E = mc^2$$"]
+        assert mock_p2t.recognize_formula.call_count == 2  # the new crop only
+        assert again["formula"]["cache_hits"] == 1
+        assert again["formula"]["cache_hit_rate"] == 0.5
+        assert result[0].content_source == "pix2text_mfr"
+        assert result[0].asset_path is not None
+
+        enrich_visual_spans(spans[:1], simple_pdf_bytes, use_cache=False)
+        assert mock_p2t.recognize_formula.call_count == 3
+
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_assets_written_in_configured_format(self, mock_get_p2t, simple_pdf_bytes, data_dir, monkeypatch):
+        """Assets are encoded as WebP when configured, and their size is reported."""
+        monkeypatch.setattr("metis.core.enrich.ENRICH_ASSET_FORMAT", "webp")
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.return_value = "x"
+        mock_get_p2t.return_value = mock_p2t
+
+        stats: dict = {}
+        result = enrich_visual_spans([_make_span(kind="formula", span_id="p000_L0001")], simple_pdf_bytes, stats=stats)
+        asset = data_dir / result[0].asset_path
+        assert asset.suffix == ".webp"
+        assert asset.read_bytes()[8:12] == b"WEBP"
+        assert stats["formula"]["assets"] == 1
+        assert stats["formula"]["asset_bytes"] == asset.stat().st_size
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_failed_asset_write_keeps_enrichment(self, mock_get_p2t, simple_pdf_bytes, data_dir, monkeypatch):
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.return_value = "x"
+        mock_get_p2t.return_value = mock_p2t
+
+        def full_disk(*a):
+            raise OSError("No space left on device")
+
+        monkeypatch.setattr("metis.core.enrich._save_asset", full_disk)
+        stats: dict = {}
+        result = enrich_visual_spans([_make_span(kind="formula")], simple_pdf_bytes, stats=stats)
+        assert result[0].text == "$$x$$"
+        assert result[0].asset_path is None
+        assert stats["formula"]["assets"] == 0
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_crops_gated_by_area(self, mock_get_p2t, simple_pdf_bytes, data_dir, monkeypatch):
+        """Tiny crops are skipped, page-sized ones recognized at the reduced dpi."""
+        sizes = []
+        mock_p2t = MagicMock()
+        mock_p2t.table_ocr.recognize.side_effect = lambda img, **kw: sizes.append(img.size) or {"markdown": ["| a |"]}
+        mock_get_p2t.return_value = mock_p2t
+
+        spans = [
+            _make_span(kind="table", span_id="p000_L0001", bbox_pdf=(50.0, 100.0, 60.0, 110.0)),
+            _make_span(kind="table", span_id="p000_L0002", bbox_pdf=(0.0, 0.0, 612.0, 720.0)),
+            _make_span(kind="table", span_id="p000_L0003"),
+        ]
+        stats: dict = {}
+        result = enrich_visual_spans(spans, simple_pdf_bytes, stats=stats, use_cache=False)
+        assert result[0].content_source is None and result[0].asset_path is None
+        assert result[0].enrich_status == "too_small"
+        assert [s.text for s in result[1:]] == ["| a |", "| a |"]
+        assert [s.enrich_status for s in result[1:]] == [None, None]
+        assert sizes[0] == (int(612 * 120 / 72), int(720 * 120 / 72))
+        assert stats["table"]["skipped"] == {"too_small": ["p000_L0001"]}
+        assert stats["table"]["downgraded"] == 1
+
+        monkeypatch.setattr("metis.core.enrich.ENRICH_LARGE_DPI", 0)
+        stats = {}
+        result = enrich_visual_spans(spans, simple_pdf_bytes, stats=stats, use_cache=False)
+        assert stats["table"]["skipped"] == {"too_small": ["p000_L0001"], "too_large": ["p000_L0002"]}
+        assert result[1].content_source is None
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_span_budget_overrun_keeps_original_text(self, mock_get_p2t, simple_pdf_bytes, data_dir, monkeypatch):
+        """An overrunning crop keeps its text, and larger crops of its kind are not tried."""
+        monkeypatch.setattr("metis.core.enrich.ENRICH_SPAN_BUDGET_S", 0.05)
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.side_effect = lambda img, **kw: time.sleep(0.1) or "x"
+        mock_get_p2t.return_value = mock_p2t
+
+        spans = [
+            _make_span(kind="formula", text="slow", span_id="p000_L0001"),
+            _make_span(kind="formula", text="bigger", span_id="p000_L0002", bbox_pdf=(50.0, 100.0, 400.0, 200.0)),
+        ]
+        stats: dict = {}
+        result = enrich_visual_spans(spans, simple_pdf_bytes, batch_size=1, stats=stats, use_cache=False)
+        assert [s.text for s in result] == ["slow", "bigger"]
+        assert [s.enrich_status for s in result] == ["span_budget", "span_budget"]
+        assert result[0].asset_path is not None and result[1].asset_path is None
+        assert mock_p2t.recognize_formula.call_count == 1
+        assert stats["formula"]["skipped"] == {"span_budget": ["p000_L0001", "p000_L0002"]}
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_span_budget_overrun_is_still_cached(self, mock_get_p2t, simple_pdf_bytes, data_dir, monkeypatch):
+        monkeypatch.setattr("metis.core.enrich.ENRICH_SPAN_BUDGET_S", 0.05)
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.side_effect = lambda img, **kw: time.sleep(0.1) or "x"
+        mock_get_p2t.return_value = mock_p2t
+
+        spans = enrich_visual_spans([_make_span(kind="formula", text="slow")], simple_pdf_bytes)
+        assert spans[0].text == "slow" and spans[0].enrich_status == "span_budget"
+        stats: dict = {}
+        again = enrich_visual_spans(spans, simple_pdf_bytes, stats=stats)
+        assert again[0].text == "$$x$$" and again[0].enrich_status is None
+        assert stats["formula"]["cache_hits"] == 1
+        assert mock_p2t.recognize_formula.call_count == 1
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_pdf_closed_when_enrichment_raises(self, mock_get_p2t, simple_pdf_bytes, monkeypatch):
+        mock_get_p2t.return_value = MagicMock()
+        doc = pymupdf.open(stream=simple_pdf_bytes, filetype="pdf")
+        monkeypatch.setattr("metis.core.enrich.pymupdf.open", lambda **kw: doc)
+
+        def broken(*a, **kw):
+            raise RuntimeError("render failed")
+
+        monkeypatch.setattr("metis.core.enrich._PageCrops", broken)
+        with pytest.raises(RuntimeError):
+            enrich_visual_spans([_make_span(kind="formula")], simple_pdf_bytes)
+        assert doc.is_closed
+
+    @patch("metis.core.enrich._get_p2t")
+    def test_document_budget_skips_remaining_spans(self, mock_get_p2t, simple_pdf_bytes, data_dir):
+        mock_p2t = MagicMock()
+        mock_p2t.recognize_formula.return_value = "x"
+        mock_get_p2t.return_value = mock_p2t
+        spans = [_make_span(kind="formula", span_id=f"p000_L{i:04d}") for i in range(2)]
+
+        from metis.core.enrich import EnrichBudget, EnrichExecutor
+
+        budget = EnrichBudget(30)
+        with EnrichExecutor(workers=1) as ex:
+            stats: dict = {}
+            assert ex.enrich(spans, simple_pdf_bytes, stats=stats, budget=budget)[0].text == "$$x$$"
+            budget.spent_s = 30  # budget used up by earlier windows
+            stats = {}
+            result = ex.enrich(spans, simple_pdf_bytes, stats=stats, budget=budget)
+            assert ex.enrich(spans, simple_pdf_bytes)[0].text == "$$x$$"  # a new document's budget
+        assert [s.content_source for s in result] == [None, None]
+        assert [s.enrich_status for s in result] == ["doc_budget", "doc_budget"]
+        assert stats["formula"]["skipped"] == {"doc_budget": ["p000_L0000", "p000_L0001"]}
+
+
+
+class _FakeP2T:
+    """Picklable stand-in for Pix2Text: the 'LaTeX' encodes the crop, so results are checkable."""
+    table_ocr = None
+
+    def recognize_formula(self, imgs, **kw):
+        one = not isinstance(imgs, list)
+        out = [f"{img.width}x{img.height}:{sum(img.convert('L').tobytes())}" for img in ([imgs] if one else imgs)]
+        return out[0] if one else out
+
+
+def _fake_p2t():
+    return _FakeP2T()
+
+
+class TestEnrichExecutor:
+    def test_parallel_enrichment_matches_serial(self, data_dir, monkeypatch):
+        from metis.core.enrich import EnrichExecutor
+        from metis.core.store import store_pdf_bytes, paths
+        monkeypatch.setenv("METIS_DATA_DIR", str(data_dir))  # for the spawned workers
+        monkeypatch.setenv("METIS_ENRICH_CACHE", "false")
+        monkeypatch.setattr("metis.core.enrich.ENRICH_CACHE", False)
+
+        doc = pymupdf.open()
+        for i in range(6):
+            page = doc.new_page(width=612, height=792)
+            page.insert_text((60, 120), f"x_{i} = {i} + y^{i}", fontsize=12 + i)
+        doc_id = store_pdf_bytes(doc.tobytes())
+        spans = [
+            _make_span(
+                kind="formula" if j else "text", doc_id=doc_id, page=i, span_id=f"p{i:03d}_L{j:04d}",
+                bbox_pdf=(50.0, 90.0 + 5 * j, 320.0, 140.0), text=f"garbled {i} {j}",
+            )
+            for i in range(6) for j in range(3)
+        ]
+        pdf = paths(doc_id)["pdf"]
+
+        serial_stats: dict = {}
+        serial = EnrichExecutor(workers=1, p2t_builder=_fake_p2t).enrich(spans, pdf, serial_stats)
+        parallel_stats: dict = {}
+        with EnrichExecutor(workers=2, batch_size=3, p2t_builder=_fake_p2t) as ex:
+            parallel = ex.enrich(spans, pdf, parallel_stats)
+            assert ex._pool is not None
+
+        assert parallel == serial
+        assert all(s.content_source == "pix2text_mfr" for s in serial if s.kind == "formula")
+        assert serial_stats["formula"]["enriched"] == parallel_stats["formula"]["enriched"] == 12
+
+    def test_single_page_goes_to_the_pool(self, data_dir, monkeypatch):
+        from metis.core.enrich import EnrichExecutor
+        from metis.core.store import store_pdf_bytes, paths
+        monkeypatch.setenv("METIS_DATA_DIR", str(data_dir))
+        monkeypatch.setenv("METIS_ENRICH_CACHE", "false")
+        monkeypatch.setattr("metis.core.enrich.ENRICH_CACHE", False)
+
+        doc = pymupdf.open()
+        doc.new_page(width=612, height=792).insert_text((60, 120), "x = y^2", fontsize=14)
+        doc_id = store_pdf_bytes(doc.tobytes())
+        spans = [_make_span(kind="formula", doc_id=doc_id, page=0, span_id="p000_L0000", bbox_pdf=(50.0, 90.0, 320.0, 140.0))]
+        with EnrichExecutor(workers=2, p2t_builder=_fake_p2t) as ex:
+            out = ex.enrich(spans, paths(doc_id)["pdf"])
+            assert ex._pool is not None
+            assert ex._p2t is None
+        assert out[0].content_source == "pix2text_mfr"
+
+    def test_in_memory_pdf_runs_serially(self, simple_pdf_bytes, data_dir, monkeypatch):
+        from metis.core.enrich import EnrichExecutor
+        with EnrichExecutor(workers=4, p2t_builder=_fake_p2t) as ex:
+            out = ex.enrich([_make_span(kind="formula", page=0, span_id=f"p000_L{j:04d}") for j in range(3)], simple_pdf_bytes)
+            assert ex._pool is None
+        assert all(s.content_source == "pix2text_mfr" for s in out)
+
+
 @pytest.mark.skipif(not pix2text_installed, reason="pix2text not installed")
 class TestIntegrationEnrichment:
-    def test_formula_enrichment_end_to_end(self, tmp_path, monkeypatch):
+    def test_formula_enrichment_end_to_end(self, data_dir, monkeypatch):
         """Ingest a PDF with a formula region, verify LaTeX extraction."""
-        monkeypatch.setattr("metis.core.store.DATA_DIR", tmp_path)
         # Reset singleton so real pix2text is loaded
         import metis.core.enrich as enrich_mod
         monkeypatch.setattr(enrich_mod, "_p2t_instance", None)
@@ -192,5 +500,5 @@ class TestIntegrationEnrichment:
         assert "$$" in s.text  # wrapped in $$
         assert s.asset_path is not None
         # Verify asset image was saved
-        asset_full = tmp_path / s.asset_path
+        asset_full = data_dir / s.asset_path
         assert asset_full.exists()
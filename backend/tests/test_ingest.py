@@ -0,0 +1,200 @@
+import pymupdf
+import pytest
+from metis.core.ingest import ingest_pdf_bytes, ingest_pdf_bytes_layout
+from metis.core.pool import ordered_map, page_shards
+from metis.core.store import doc_id_from_bytes, paths
+
+
+@pytest.fixture(scope="module")
+def multipage_pdf() -> bytes:
+    doc = pymupdf.open()
+    for i in range(12):
+        page = doc.new_page(width=612, height=792)
+        for j in range(5):
+            page.insert_text((50, 100 + 60 * j), f"Page {i} paragraph {j} discusses sharded extraction.", fontsize=11)
+    return doc.tobytes()
+
+
+def test_page_shards_cover_pages_in_order():
+    shards = page_shards(10, workers=3)
+    assert [i for r in shards for i in r] == list(range(10))
+    assert page_shards(0, workers=3) == []
+    assert max(len(r) for r in page_shards(100, workers=2, max_size=5)) == 5
+
+
+def test_ordered_map_bounds_calls_in_flight():
+    from concurrent.futures import ThreadPoolExecutor
+
+    submitted = []
+    with ThreadPoolExecutor(2) as pool:
+        results = ordered_map(pool, lambda i: submitted.append(i) or i * i, range(10), in_flight=3)
+        assert next(results) == 0
+        assert len(submitted) <= 3
+        assert list(results) == [i * i for i in range(1, 10)]
+
+
+def test_parallel_blocks_ingest_matches_serial(data_dir, multipage_pdf, monkeypatch):
+    monkeypatch.setattr("metis.core.ingest.INGEST_PARALLEL_MIN_PAGES", 1)
+    serial = ingest_pdf_bytes(multipage_pdf, workers=1)
+    spans_path = paths(serial["doc_id"])["spans"]
+    serial_spans = spans_path.read_bytes()
+
+    parallel = ingest_pdf_bytes(multipage_pdf, workers=2)
+    assert parallel["n_spans"] == serial["n_spans"] == 60
+    assert parallel["ingest"]["workers"] == 2
+    assert spans_path.read_bytes() == serial_spans
+
+
+def test_ingest_records_workers_actually_used(data_dir, multipage_pdf, monkeypatch):
+    monkeypatch.setattr("metis.core.ingest.INGEST_PARALLEL_MIN_PAGES", 20)
+    assert ingest_pdf_bytes(multipage_pdf, workers=4)["ingest"]["workers"] == 1   # too short for a pool
+    monkeypatch.setattr("metis.core.ingest.INGEST_PARALLEL_MIN_PAGES", 1)
+    from metis.core.ingest import _extract_workers
+    assert _extract_workers(64, range(12)) == 12    # one shard per page
+    assert _extract_workers(2, range(12)) == 2
+
+
+def test_parallel_layout_ingest_matches_serial(data_dir, multipage_pdf, monkeypatch, enrichment):
+    monkeypatch.setattr("metis.core.ingest.INGEST_PARALLEL_MIN_PAGES", 1)
+    serial = ingest_pdf_bytes_layout(multipage_pdf, extract_words=True, write_images=False, workers=1)
+    p = paths(serial["doc_id"])
+    serial_files = {k: p[k].read_bytes() for k in ("spans", "page_md")}
+
+    parallel = ingest_pdf_bytes_layout(multipage_pdf, extract_words=True, write_images=False, workers=3)
+    assert parallel["n_spans"] == serial["n_spans"]
+    assert parallel["ingest"]["workers"] == 3
+    assert {k: p[k].read_bytes() for k in serial_files} == serial_files
+
+
+def test_layout_falls_back_to_serial_when_pool_breaks(data_dir, multipage_pdf, monkeypatch, enrichment):
+    from concurrent.futures.process import BrokenProcessPool
+
+    class BrokenPool:
+        def __init__(self, *a, **kw):
+            pass
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            return False
+        def submit(self, *a, **kw):
+            raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr("metis.core.ingest.INGEST_PARALLEL_MIN_PAGES", 1)
+    monkeypatch.setattr("metis.core.ingest.process_pool", BrokenPool)
+    meta = ingest_pdf_bytes_layout(multipage_pdf, write_images=False, workers=2)
+    assert meta["n_pages"] == 12
+    assert meta["n_spans"] > 0
+
+
+def test_pages_are_queryable_while_ingest_is_running(data_dir, multipage_pdf):
+    from metis.core.ingest import iter_ingest_pdf_bytes
+    from metis.core.retrieve import retrieve
+    from metis.core.store import read_spans_jsonl
+
+    events = iter_ingest_pdf_bytes(multipage_pdf, workers=1)
+    first = next(events)
+    assert first["event"] == "page" and first["pages_done"] == 1
+    doc_id = doc_id_from_bytes(multipage_pdf)
+    spans = read_spans_jsonl(paths(doc_id)["spans"])
+    assert {s.page for s in spans} == {0}
+    assert retrieve(doc_id, 0, "Page 0 paragraph 3")
+    rest = list(events)
+    assert rest[-1]["event"] == "done"
+    assert rest[-1]["meta"]["ingest"]["pages_done"] == 12
+
+
+def test_ingest_records_stage_timings(data_dir, multipage_pdf, enrichment):
+    import orjson
+    blocks = ingest_pdf_bytes(multipage_pdf)
+    assert {"fingerprint", "extract", "spans", "write_spans", "indexes", "total"} <= set(blocks["ingest"]["timings"])
+    assert blocks["ingest"]["timings"]["extract"]["calls"] == 12
+
+    layout = ingest_pdf_bytes_layout(multipage_pdf, write_images=False, workers=1)
+    timings = layout["ingest"]["timings"]
+    assert {"to_markdown", "spans", "write_page_md", "indexes", "total"} <= set(timings)
+    assert timings["to_markdown"]["wall_s"] <= timings["total"]["wall_s"]
+    stored = orjson.loads(paths(layout["doc_id"])["doc"].read_bytes())
+    assert stored["ingest"]["timings"] == timings
+
+
+def test_windowed_layout_ingest_matches_whole_document(data_dir, multipage_pdf, monkeypatch, enrichment):
+    from metis.core.ingest import iter_ingest_pdf_bytes_layout
+    from metis.core.neighbors import build_ro_links
+    from metis.core.ngram import NgramIndex
+    from metis.core.spatial import build_doc_index_from_pdf
+    from metis.core.store import open_pdf, read_spans_jsonl
+
+    batches: list[int] = []
+
+    def fake_enrich(spans, pdf_path, **kw):
+        batches.append(len({s.page for s in spans}))
+        return spans
+
+    enrichment(True)
+    monkeypatch.setattr("metis.core.enrich.enrich_visual_spans", fake_enrich)
+    kw = dict(extract_words=True, write_images=False, workers=1)
+    keys = ("spans", "page_md", "spatial", "ro_links", "ngrams")
+
+    whole = ingest_pdf_bytes_layout(multipage_pdf, window=100, **kw)
+    p = paths(whole["doc_id"])
+    expected = {k: p[k].read_bytes() for k in keys}
+    assert batches == [12]
+
+    batches.clear()
+    events = list(iter_ingest_pdf_bytes_layout(multipage_pdf, window=5, **kw))
+    assert batches == [5, 5, 2]
+    assert [e["page"] for e in events if e["event"] == "page"] == list(range(12))
+    assert events[-1]["meta"]["ingest"]["window"] == 5
+    assert {k: p[k].read_bytes() for k in keys} == expected
+
+    # the incrementally built indexes equal those built from the full span list
+    from metis.core.neighbors import links_digest, write_ro_links
+    from metis.core.ngram import write_ngram_index
+    from metis.core.spatial import write_doc_index
+    spans, doc = read_spans_jsonl(p["spans"]), open_pdf(p["pdf"])
+    write_doc_index(data_dir / "spatial", build_doc_index_from_pdf(doc, spans, {}))
+    write_ro_links(data_dir / "ro_links", build_ro_links(spans), links_digest(spans))
+    write_ngram_index(data_dir / "ngrams", NgramIndex.build(spans))
+    for k in ("spatial", "ro_links", "ngrams"):
+        assert (data_dir / k).read_bytes() == expected[k]
+
+
+def test_layout_ingests_share_one_enrich_executor(data_dir, multipage_pdf, pdf_bytes, monkeypatch, enrichment):
+    from metis.core.enrich import EnrichExecutor, shared_executor
+
+    calls: list = []
+
+    def enrich(self, spans, pdf, stats=None, budget=None):
+        calls.append((self, budget))
+        return spans
+
+    enrichment(True)
+    monkeypatch.setattr(EnrichExecutor, "enrich", enrich)
+    kw = dict(write_images=False, workers=1, window=5)
+    ingest_pdf_bytes_layout(multipage_pdf, **kw)
+    ingest_pdf_bytes_layout(pdf_bytes, **kw)
+
+    assert len(calls) == 4
+    assert {id(ex) for ex, _ in calls} == {id(shared_executor())}
+    budgets = [b for _, b in calls]
+    assert budgets[0] is budgets[1] is budgets[2] and budgets[3] is not budgets[0]
+
+
+def test_reingest_replaces_previous_output_at_the_end(data_dir, multipage_pdf):
+    from metis.core.ingest import iter_ingest_pdf_bytes
+
+    ingest_pdf_bytes(multipage_pdf, workers=1)
+    doc_id = doc_id_from_bytes(multipage_pdf)
+    p = paths(doc_id)
+    before = {k: p[k].read_bytes() for k in ("spans", "spatial", "ro_links", "ngrams")}
+
+    events = iter_ingest_pdf_bytes(multipage_pdf, workers=1)
+    next(events)
+    # readers keep the complete previous output while the re-ingest runs
+    assert {k: p[k].read_bytes() for k in before} == before
+    events.close()
+    assert not list(data_dir.glob(".*.partial"))
+
+    list(iter_ingest_pdf_bytes(multipage_pdf, workers=1))
+    assert {k: p[k].read_bytes() for k in before} == before
+    assert not list(data_dir.glob(".*.partial"))
@@ -0,0 +1,103 @@
+import orjson
+import pymupdf
+import pytest
+from metis.core.ingest import ingest_pdf_bytes, ingest_pdf_bytes_layout
+from metis.core.lineage import page_fingerprints, read_fingerprints
+from metis.core.store import paths
+
+
+pytestmark = pytest.mark.usefixtures("enrichment")
+
+
+def _pdf(texts: list[str]) -> bytes:
+    doc = pymupdf.open()
+    for t in texts:
+        page = doc.new_page(width=612, height=792)
+        for j in range(3):
+            page.insert_text((50, 100 + 60 * j), f"{t} paragraph {j}", fontsize=11)
+    return doc.tobytes()
+
+
+V1 = [f"Page {i} of the original report" for i in range(6)]
+# page 2 edited, a cover page inserted in front
+V2 = ["Cover page"] + V1[:2] + ["Page 2 was revised"] + V1[3:]
+
+
+def test_fingerprints_are_stable_and_content_sensitive():
+    a = page_fingerprints(pymupdf.open(stream=_pdf(V1)))
+    b = page_fingerprints(pymupdf.open(stream=_pdf(V2)))
+    assert a == page_fingerprints(pymupdf.open(stream=_pdf(V1)))
+    assert len(set(a)) == 6
+    assert b[1:3] == a[0:2] and b[4:] == a[3:]
+    assert b[0] not in a and b[3] not in a
+
+
+def test_blocks_reingest_reuses_unchanged_pages(data_dir):
+    v1 = ingest_pdf_bytes(_pdf(V1))
+    fresh = ingest_pdf_bytes(_pdf(V2))
+    fresh_spans = paths(fresh["doc_id"])["spans"].read_bytes()
+
+    v2 = ingest_pdf_bytes(_pdf(V2), parent=v1["doc_id"])
+    assert v2["ingest"]["pages_reused"] == 5
+    assert v2["ingest"]["pages_reprocessed"] == 2
+    assert v2["lineage"]["parent"] == v1["doc_id"]
+    assert v2["lineage"]["reused_pages"]["1"] == 0
+    assert v2["lineage"]["reused_pages"]["6"] == 5
+    # renumbered span ids and reading order: identical to a fresh ingest
+    spans = paths(v2["doc_id"])["spans"].read_bytes()
+    assert spans == fresh_spans.replace(fresh["doc_id"].encode(), v2["doc_id"].encode())
+
+
+def test_layout_reingest_matches_fresh_ingest(data_dir):
+    kw = dict(extract_words=True, write_images=False, workers=1)
+    v1 = ingest_pdf_bytes_layout(_pdf(V1), **kw)
+    fresh = ingest_pdf_bytes_layout(_pdf(V2), **kw)
+    v2 = ingest_pdf_bytes_layout(_pdf(V2), parent=v1["doc_id"], **kw)
+    assert v2["ingest"]["pages_reused"] == 5
+
+    def files(doc_id):
+        p = paths(doc_id)
+        return [p[k].read_bytes().replace(doc_id.encode(), b"DOC") for k in ("spans", "page_md")]
+
+    assert files(v2["doc_id"]) == files(fresh["doc_id"])
+
+
+def test_no_reuse_when_settings_differ(data_dir):
+    v1 = ingest_pdf_bytes_layout(_pdf(V1), extract_words=False, write_images=False, workers=1)
+    v2 = ingest_pdf_bytes_layout(_pdf(V2), extract_words=True, write_images=False, workers=1, parent=v1["doc_id"])
+    assert v2["ingest"]["pages_reused"] == 0
+    assert v2["ingest"]["pages_reprocessed"] == 7
+    assert v2["lineage"] == {"parent": v1["doc_id"], "reused_pages": {}}
+
+
+def test_fingerprints_computed_for_older_docs(data_dir):
+    meta = ingest_pdf_bytes(_pdf(V1))
+    fp_path = paths(meta["doc_id"])["fingerprints"]
+    stored = orjson.loads(fp_path.read_bytes())
+    fp_path.unlink()
+    assert read_fingerprints(meta["doc_id"]) == stored
+    assert fp_path.exists()
+
+
+def test_vectorize_copies_parent_embeddings(data_dir, monkeypatch):
+    import numpy as np
+    from metis.core import vectorize
+
+    encoded: list[str] = []
+
+    class FakeModel:
+        def encode(self, texts, **kw):
+            encoded.extend(texts)
+            return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(vectorize, "_load_model", lambda name: FakeModel())
+    monkeypatch.setattr(vectorize, "MIN_CHARS", 1)
+    v1 = ingest_pdf_bytes(_pdf(V1))
+    vectorize.vectorize_spans(v1["doc_id"], model_name="fake")
+    encoded.clear()
+
+    v2 = ingest_pdf_bytes(_pdf(V2), parent=v1["doc_id"])
+    res = vectorize.vectorize_spans(v2["doc_id"], model_name="fake")
+    assert res["n_reused"] == 15
+    assert len(encoded) == 6
+    assert all(t.startswith(("Cover", "Page 2 was")) for t in encoded)
@@ -157,3 +157,55 @@ def test_openai_model_converts_tool_results():
     assert converted[1]["role"] == "tool"
     assert converted[1]["tool_call_id"] == "call_1"
     assert converted[1]["content"] == '[{"text": "found it"}]'
+
+
+def test_openai_stream_and_astream_decode_the_same_events():
+    import asyncio
+    from types import SimpleNamespace as NS
+
+    def chunk(content=None, tool_calls=None):
+        return NS(choices=[NS(delta=NS(content=content, tool_calls=tool_calls))])
+
+    def tc_delta(index, id=None, name=None, arguments=None):
+        return NS(index=index, id=id, function=NS(name=name, arguments=arguments))
+
+    chunks = [
+        chunk(content="Let me "),
+        chunk(content="search."),
+        chunk(tool_calls=[tc_delta(0, id="call_1", name="rag_retrieve", arguments='{"query"')]),
+        chunk(tool_calls=[tc_delta(0, arguments=': "methods"}')]),
+        NS(choices=[]),
+    ]
+
+    class AsyncChunks:
+        def __init__(self):
+            self._it = iter(chunks)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self._it)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    async def acreate(**kw):
+        return AsyncChunks()
+
+    model = OpenAIModel(api_key="test-key", model="gpt-4o")
+    model._client = NS(chat=NS(completions=NS(create=lambda **kw: iter(chunks))))
+    model._aclient = NS(chat=NS(completions=NS(create=acreate)))
+
+    async def collect():
+        return [ev async for ev in model.astream([Message(role="user", content="Hi")], [], "sys")]
+
+    events = list(model.stream([Message(role="user", content="Hi")], [], "sys"))
+    assert asyncio.run(collect()) == events
+    assert [e.kind for e in events] == [
+        "text_delta", "text_delta", "tool_call_start", "tool_call_delta", "tool_call_delta",
+        "tool_call_done", "message_done",
+    ]
+    final = events[-1].message
+    assert final.content == "Let me search."
+    assert final.tool_calls == [ToolCall(id="call_1", name="rag_retrieve", arguments={"query": "methods"})]
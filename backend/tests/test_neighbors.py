@@ -0,0 +1,61 @@
+from metis.core.neighbors import NeighborIndex, build_ro_links, expand_neighbors, links_digest, write_ro_links, PREV_DOC, NEXT_DOC, PREV_PAGE, NEXT_PAGE
+from metis.core.schema import Span
+from metis.core.store import paths, write_spans_jsonl
+
+
+def _span(sid, page, ro, **kwargs):
+    return Span(span_id=sid, doc_id="d", page=page, bbox_pdf=(0, 0, 1, 1),
+                bbox_norm=(0, 0, 1, 1), text=f"text of {sid}", reading_order=ro, **kwargs)
+
+
+def _doc():
+    # stored out of reading order on purpose; "h" is a page header
+    return [
+        _span("a1", 0, 1),
+        _span("a0", 0, 0),
+        _span("h", 1, 2, is_header=True),
+        _span("b0", 1, 3),
+        _span("b1", 1, 4),
+    ]
+
+
+def test_build_ro_links_page_and_document():
+    links = build_ro_links(_doc())
+    # a0 -> a1 within page 0; a1 -> b0 only at document scope
+    assert links[1, NEXT_PAGE] == 0 and links[0, PREV_PAGE] == 1
+    assert links[0, NEXT_PAGE] == -1
+    assert links[0, NEXT_DOC] == 3 and links[3, PREV_DOC] == 0
+    # headers are skipped and unlinked
+    assert (links[2] == -1).all()
+    assert links[3, PREV_PAGE] == -1
+
+
+def test_expand_respects_scope_and_window():
+    index = NeighborIndex(_doc(), build_ro_links(_doc()))
+    page_groups = index.expand(["a1", "b0"], window=1)
+    assert [[s.span_id for s in g] for g in page_groups] == [["a0", "a1"], ["b0", "b1"]]
+    doc_groups = index.expand(["a1"], window=2, scope="document")
+    assert [s.span_id for s in doc_groups[0]] == ["a0", "a1", "b0", "b1"]
+    assert index.expand(["missing"], window=1) == [[]]
+
+
+def test_expand_neighbors_uses_persisted_links(data_dir):
+    p = paths("sha256:nb")
+    spans = _doc()
+    write_spans_jsonl(p["spans"], spans)
+    write_ro_links(p["ro_links"], build_ro_links(spans), links_digest(spans))
+    groups = expand_neighbors("sha256:nb", ["b1"], 1)
+    assert [s.span_id for s in groups[0]] == ["b0", "b1"]
+
+
+def test_stale_links_of_the_same_length_are_rebuilt(data_dir):
+    import dataclasses
+    p = paths("sha256:nb")
+    spans = _doc()
+    write_ro_links(p["ro_links"], build_ro_links(spans), links_digest(spans))
+    # a re-ingest that reverses the reading order keeps the span count
+    n = len(spans)
+    reordered = [dataclasses.replace(s, reading_order=n - 1 - s.reading_order) for s in spans]
+    write_spans_jsonl(p["spans"], reordered)
+    index = NeighborIndex.from_store(p, reordered)
+    assert index.links.tolist() == build_ro_links(reordered).tolist()
@@ -0,0 +1,63 @@
+import numpy as np
+from metis.core.ngram import NgramIndex, gram_codes, load_ngram_index, write_ngram_index
+from metis.core.schema import Span
+
+
+def _span(i, text, **kw):
+    return Span(span_id=f"s{i}", doc_id="d", page=i // 2, bbox_pdf=(0, 0, 1, 1),
+                bbox_norm=(0.0, 0.0, 0.1, 0.1), text=text, reading_order=i, **kw)
+
+
+def _spans():
+    return [
+        _span(0, "Attention is all you need."),
+        _span(1, "Recurrent networks process tokens sequentially."),
+        _span(2, "Self-attention relates positions of a sequence."),
+        _span(3, "Running header: attention", is_header=True),
+    ]
+
+
+def test_gram_codes_normalize_case_and_whitespace():
+    assert np.array_equal(gram_codes("Self  Attention"), gram_codes("self attention"))
+    assert len(gram_codes("ab")) == 0
+
+
+def test_candidates_rank_by_shared_grams():
+    index = NgramIndex.build(_spans())
+    rows, counts = index.candidates("self-attention relates", limit=10)
+    assert rows[0] == 2
+    assert list(counts) == sorted(counts, reverse=True)
+    assert 1 not in rows[:1]
+
+
+def test_headers_are_not_indexed():
+    index = NgramIndex.build(_spans())
+    rows, _ = index.candidates("running header", limit=10)
+    assert 3 not in rows
+
+
+def test_candidates_limit_and_unknown_text():
+    index = NgramIndex.build(_spans())
+    rows, _ = index.candidates("attention", limit=1)
+    assert len(rows) == 1
+    rows, _ = index.candidates("zzzqqq", limit=10)
+    assert len(rows) == 0
+
+
+def test_postings_match_brute_force():
+    spans = _spans()
+    index = NgramIndex.build(spans)
+    for g, lo, hi in zip(index.grams, index.offsets[:-1], index.offsets[1:]):
+        expected = [i for i, s in enumerate(spans) if not s.is_header and g in set(gram_codes(s.text).tolist())]
+        assert index.postings[lo:hi].tolist() == expected
+
+
+def test_write_and_load_roundtrip(tmp_path):
+    index = NgramIndex.build(_spans())
+    path = tmp_path / "d.ngrams.npz"
+    write_ngram_index(path, index)
+    loaded = load_ngram_index(path)
+    assert np.array_equal(loaded.grams, index.grams)
+    assert np.array_equal(loaded.postings, index.postings)
+    assert loaded.candidates("attention", 10)[0].tolist() == index.candidates("attention", 10)[0].tolist()
+    assert loaded.digest == index.digest != ""
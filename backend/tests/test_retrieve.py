@@ -1,5 +1,9 @@
-from metis.core.retrieve import bbox_iou, resolve_selections
+import dataclasses
+import pytest
+from metis.core.neighbors import build_ro_links
+from metis.core.retrieve import bbox_iou, locate_text, resolve_selections, retrieve, retrieve_many
 from metis.core.schema import Span
+from metis.core.store import paths, write_spans_jsonl
 from unittest.mock import patch
 
 
@@ -71,3 +75,100 @@ def test_resolve_selections_ranked_by_iou():
     assert results[0]["span_id"] == "s1"  # higher IoU (better fit)
     assert results[1]["span_id"] == "s2"
     assert results[0]["iou"] > results[1]["iou"]
+
+
+def _page_spans():
+    return [
+        Span(span_id="s1", doc_id="d", page=0,
+             bbox_pdf=(0, 0, 1, 1), bbox_norm=(0.0, 0.0, 0.1, 0.1),
+             text="The attention mechanism focuses on relevant tokens.", reading_order=0),
+        Span(span_id="s2", doc_id="d", page=0,
+             bbox_pdf=(0, 0, 1, 1), bbox_norm=(0.0, 0.2, 0.1, 0.3),
+             text="Gradient descent optimizes the training loss.", reading_order=1),
+        Span(span_id="s3", doc_id="d", page=0,
+             bbox_pdf=(0, 0, 1, 1), bbox_norm=(0.0, 0.4, 0.1, 0.5),
+             text="Residual connections stabilize very deep networks.", reading_order=2),
+        Span(span_id="s4", doc_id="d", page=1,
+             bbox_pdf=(0, 0, 1, 1), bbox_norm=(0.0, 0.0, 0.1, 0.1),
+             text="The attention mechanism on another page entirely.", reading_order=3),
+    ]
+
+
+@pytest.fixture()
+def page_doc(data_dir):
+    write_spans_jsonl(paths("d")["spans"], _page_spans())
+    return "d"
+
+
+def test_retrieve_many_returns_one_list_per_query(page_doc):
+    results = retrieve_many(page_doc, 0, ["attention mechanism", "residual connections"])
+    assert len(results) == 2
+    assert "s1" in [e.span_id for e in results[0]]
+    assert "s3" in [e.span_id for e in results[1]]
+    assert all(e.page == 0 for batch in results for e in batch)
+
+
+def test_retrieve_matches_retrieve_many_single_query(page_doc, monkeypatch):
+    monkeypatch.setattr("metis.core.retrieve.NEIGHBOR_WINDOW", 0)
+    single = retrieve(page_doc, 0, "gradient descent")
+    batched = retrieve_many(page_doc, 0, ["gradient descent"])[0]
+    assert single == batched
+    assert max(single, key=lambda e: e.score).span_id == "s2"
+
+
+def test_retrieve_score_cutoff_drops_weak_matches(page_doc, monkeypatch):
+    monkeypatch.setattr("metis.core.retrieve.FUZZY_SCORE_CUTOFF", 90.0)
+    monkeypatch.setattr("metis.core.retrieve.NEIGHBOR_WINDOW", 0)
+    results = retrieve(page_doc, 0, "residual connections")
+    assert [e.span_id for e in results] == ["s3"]
+
+
+def test_locate_text_finds_spans_across_pages(page_doc):
+    results = locate_text(page_doc, "the ATTENTION mechanism")
+    assert {e.span_id for e in results} == {"s1", "s4"}
+    assert {e.page for e in results} == {0, 1}
+
+
+def test_locate_text_returns_nothing_for_unrelated_text(page_doc):
+    assert locate_text(page_doc, "quantum chromodynamics lattice") == []
+
+
+def test_retrieve_without_page_locates_across_document(page_doc, monkeypatch):
+    monkeypatch.setattr("metis.core.retrieve.NEIGHBOR_WINDOW", 0)
+    results = retrieve(page_doc, None, "attention mechanism on another page")
+    assert max(results, key=lambda e: e.score).span_id == "s4"
+
+
+def test_retrieve_many_reuses_neighbor_index_until_spans_change(page_doc):
+    with patch("metis.core.neighbors.build_ro_links", wraps=build_ro_links) as build:
+        retrieve_many(page_doc, 0, ["attention mechanism"])
+        retrieve_many(page_doc, 0, ["gradient descent"])
+        assert build.call_count == 1
+        spans = _page_spans()
+        spans[2] = dataclasses.replace(spans[2], text="Skip connections stabilize very deep networks.")
+        write_spans_jsonl(paths(page_doc)["spans"], spans)
+        assert spans[2].text in [e.text for e in retrieve_many(page_doc, 0, ["skip connections"])[0]]
+        assert build.call_count == 2
+
+
+def test_locate_saves_ngram_index_only_once_ingest_is_complete(page_doc):
+    import orjson
+    p = paths(page_doc)
+    p["doc"].write_bytes(orjson.dumps({"ingest": {"pages_done": 1}}))
+    assert locate_text(page_doc, "attention mechanism")
+    assert not p["ngrams"].exists()
+    p["doc"].write_bytes(orjson.dumps({"ingest": {"pages_done": 2, "complete": True}}))
+    assert locate_text(page_doc, "attention mechanism")
+    assert p["ngrams"].exists()
+
+
+def test_locate_rebuilds_a_stale_ngram_index(page_doc):
+    from metis.core.ngram import NgramIndex, write_ngram_index
+    p = paths(page_doc)
+    spans = _page_spans()
+    write_ngram_index(p["ngrams"], NgramIndex.build(spans))
+    # a re-ingest with the same span count but different text
+    spans[3] = dataclasses.replace(spans[3], text="Layer normalization keeps activations in range.")
+    write_spans_jsonl(p["spans"], spans)
+    assert [e.span_id for e in locate_text(page_doc, "layer normalization")] == ["s4"]
+    assert "s4" not in [e.span_id for e in locate_text(page_doc, "attention mechanism on another page")]
@@ -0,0 +1,72 @@
+import numpy as np
+from metis.core.retrieve import bbox_iou
+from metis.core.spatial import SpatialIndex, build_doc_index, load_doc_index, write_doc_index
+from metis.core.schema import Span
+
+
+def _grid_boxes(n=10):
+    """n x n grid of non-overlapping boxes on page 0, plus one box on page 1."""
+    boxes, pages = [], []
+    step = 1.0 / n
+    for r in range(n):
+        for c in range(n):
+            boxes.append((c * step, r * step, (c + 0.8) * step, (r + 0.8) * step))
+            pages.append(0)
+    boxes.append((0.0, 0.0, 1.0, 1.0))
+    pages.append(1)
+    return boxes, pages
+
+
+def test_iou_matches_scalar_bbox_iou():
+    rng = np.random.default_rng(0)
+    xy = rng.random((200, 2)) * 0.9
+    wh = rng.random((200, 2)) * 0.2 + 0.01
+    boxes = [tuple(v) for v in np.hstack([xy, xy + wh])]
+    index = SpatialIndex.build(boxes, [0] * len(boxes), n_pages=1)
+    sel = (0.2, 0.2, 0.5, 0.6)
+    ids, ious = index.iou(0, sel)
+    expected = sorted(
+        ((bbox_iou(sel, b), i) for i, b in enumerate(boxes) if bbox_iou(sel, b) > 0),
+        key=lambda x: x[0], reverse=True,
+    )
+    assert ids.tolist() == [i for _, i in expected]
+    assert np.allclose(ious, [v for v, _ in expected])
+
+
+def test_queries_are_page_local():
+    boxes, pages = _grid_boxes()
+    index = SpatialIndex.build(boxes, pages, n_pages=2)
+    ids, _ = index.iou(1, (0.0, 0.0, 0.5, 0.5))
+    assert ids.tolist() == [100]
+    assert index.iou(5, (0.0, 0.0, 1.0, 1.0))[0].size == 0
+
+
+def test_hit_test_returns_containing_box():
+    boxes, pages = _grid_boxes()
+    index = SpatialIndex.build(boxes, pages, n_pages=2)
+    assert index.hit_test(0, 0.35, 0.55).tolist() == [53]
+    assert index.hit_test(0, 0.39, 0.55).size == 0  # in the gap between boxes
+
+
+def test_overlap_ordered_by_source_id():
+    boxes, pages = _grid_boxes()
+    index = SpatialIndex.build(boxes, pages, n_pages=2)
+    ids, inter, area = index.overlap(0, (0.0, 0.0, 0.25, 0.15))
+    assert ids.tolist() == [0, 1, 2, 10, 11, 12]
+    assert (inter <= area + 1e-12).all()
+
+
+def test_doc_index_round_trip(tmp_path):
+    spans = [
+        Span(span_id="p000_b000", doc_id="d", page=0, bbox_pdf=(0, 0, 50, 50),
+             bbox_norm=(0.0, 0.0, 0.5, 0.5), text="a span", reading_order=0),
+    ]
+    words = {"0": [[10.0, 10.0, 30.0, 20.0, "hello", 0, 0, 0]]}
+    index = build_doc_index(spans, words, page_sizes=[(100.0, 100.0)])
+    path = tmp_path / "d.spatial.npz"
+    write_doc_index(path, index)
+    loaded = load_doc_index(path)
+    assert loaded.span_ids.tolist() == ["p000_b000"]
+    hit = loaded.words.hit_test(0, 0.2, 0.15)
+    assert [loaded.word_text(i) for i in hit.tolist()] == ["hello"]
+    assert np.allclose(loaded.words.boxes[hit[0]], (0.1, 0.1, 0.3, 0.2))
@@ -1,4 +1,12 @@
-from metis.core.store import paths
+import io
+
+import pymupdf
+import pytest
+
+from metis.core.store import (
+    JsonMapWriter, doc_id_from_bytes, doc_id_from_file, open_pdf, paths, read_json_map, store_pdf, store_pdf_bytes,
+    write_json,
+)
 
 def test_paths_has_embeddings_keys():
     p = paths("sha256:abc123")
@@ -6,3 +14,57 @@ def test_paths_has_embeddings_keys():
     assert "embeddings_meta" in p
     assert str(p["embeddings"]).endswith(".embeddings.npy")
     assert str(p["embeddings_meta"]).endswith(".embeddings_meta.json")
+
+
+def _pdf_bytes() -> bytes:
+    doc = pymupdf.open()
+    doc.new_page().insert_text((50, 100), "stored document")
+    return doc.tobytes()
+
+
+def test_store_pdf_streams_into_place(data_dir, monkeypatch):
+    monkeypatch.setattr("metis.core.store.CHUNK_SIZE", 64)  # force many chunks
+    data = _pdf_bytes()
+    doc_id = store_pdf(io.BytesIO(data))
+    assert doc_id == doc_id_from_bytes(data)
+    assert paths(doc_id)["pdf"].read_bytes() == data
+    assert doc_id_from_file(paths(doc_id)["pdf"]) == doc_id
+    assert not list(data_dir.glob(".upload-*"))
+
+
+def test_store_pdf_removes_temp_file_on_failure(data_dir):
+    class FailingStream(io.BytesIO):
+        def read(self, *a):
+            raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        store_pdf(FailingStream())
+    assert list(data_dir.iterdir()) == []
+
+
+def test_open_pdf_is_memory_mapped_and_unnamed(data_dir):
+    doc_id = store_pdf_bytes(_pdf_bytes())
+    doc = open_pdf(paths(doc_id)["pdf"])
+    assert doc.page_count == 1
+    assert not doc.name
+    assert "stored document" in doc[0].get_text()
+
+
+def test_json_map_writer_matches_write_json(tmp_path):
+    obj = {"0": "# Title\n\nbody", "1": "", "2": [[1.5, 2, "wérd", 0]]}
+    write_json(tmp_path / "whole.json", obj)
+    w = JsonMapWriter(tmp_path / "streamed.json")
+    for k, v in obj.items():
+        w.add(k, v)
+    assert not (tmp_path / "streamed.json").exists()
+    w.close()
+    assert (tmp_path / "streamed.json").read_bytes() == (tmp_path / "whole.json").read_bytes()
+
+    assert read_json_map(tmp_path / "streamed.json", ["2", "0", "9"]) == {"0": obj["0"], "2": obj["2"]}
+    assert read_json_map(tmp_path / "streamed.json", ["1"]) == {"1": ""}
+
+    JsonMapWriter(tmp_path / "empty.json").close()
+    assert read_json_map(tmp_path / "empty.json", ["0"]) == {}
+    assert (tmp_path / "empty.json").read_bytes() == b"{}"
+    JsonMapWriter(tmp_path / "skipped.json", write_empty=False).close()
+    assert not (tmp_path / "skipped.json").exists()
@@ -0,0 +1,102 @@
+import numpy as np
+import orjson
+import pytest
+from metis.core import tiered
+from metis.core.ingest import drain_ingest, iter_ingest_blocks
+from metis.core.store import paths, read_spans_jsonl, store_pdf_bytes
+
+
+pytestmark = pytest.mark.usefixtures("enrichment")
+
+
+def test_tiered_ingest_serves_blocks_then_upgrades(data_dir, pdf_bytes):
+    doc_id = store_pdf_bytes(pdf_bytes)
+    meta = drain_ingest(tiered.iter_ingest_tiered(doc_id, source_filename="paper.pdf"))
+    assert meta["tier"] == "blocks"
+    assert meta["ingest"]["engine"] == "pymupdf"
+
+    final = tiered.wait_for_upgrade(doc_id, timeout=60)
+    assert final["tier"] == "layout"
+    assert final["upgrade"]["status"] == "done"
+    assert final["ingest"]["engine"] == "pymupdf4llm"
+    assert final["source_filename"] == "paper.pdf"
+    p = paths(doc_id)
+    assert orjson.loads(p["doc"].read_bytes()) == final
+    assert p["page_md"].exists() and p["ngrams"].exists()
+    assert all(s.source.startswith("pymupdf4llm") for s in read_spans_jsonl(p["spans"]))
+    assert not any((data_dir / "_staging").iterdir())
+
+
+def test_upgrade_reembeds_vectorized_document(data_dir, pdf_bytes, monkeypatch):
+    from metis.core import vectorize
+
+    class FakeModel:
+        def encode(self, texts, **kw):
+            return np.ones((len(texts), 3), dtype=np.float32)
+
+    monkeypatch.setattr(vectorize, "_load_model", lambda name: FakeModel())
+    doc_id = store_pdf_bytes(pdf_bytes)
+    drain_ingest(iter_ingest_blocks(doc_id))
+    vectorize.vectorize_spans(doc_id, model_name="fake")
+
+    tiered.upgrade_to_layout(doc_id)
+    p = paths(doc_id)
+    emb_meta = orjson.loads(p["embeddings_meta"].read_bytes())
+    span_ids = {s.span_id for s in read_spans_jsonl(p["spans"])}
+    assert emb_meta["model"] == "fake"
+    assert set(emb_meta["span_ids"]) <= span_ids
+    assert all("_L" in sid or "_b" not in sid for sid in emb_meta["span_ids"])
+
+
+def test_upgrade_keeps_embeddings_written_during_the_upgrade(data_dir, pdf_bytes, monkeypatch):
+    from metis.core import vectorize
+
+    class FakeModel:
+        def encode(self, texts, **kw):
+            return np.ones((len(texts), 3), dtype=np.float32)
+
+    monkeypatch.setattr(vectorize, "_load_model", lambda name: FakeModel())
+    doc_id = store_pdf_bytes(pdf_bytes)
+    drain_ingest(iter_ingest_blocks(doc_id))
+
+    embed_staged = tiered._embed_staged
+    calls = []
+
+    def vectorized_after_first_check(*args):
+        embed_staged(*args)
+        if not calls:
+            vectorize.vectorize_spans(doc_id, model_name="fake")   # a request lands mid-upgrade
+        calls.append(args)
+
+    monkeypatch.setattr(tiered, "_embed_staged", vectorized_after_first_check)
+    tiered.upgrade_to_layout(doc_id)
+    p = paths(doc_id)
+    emb_meta = orjson.loads(p["embeddings_meta"].read_bytes())
+    assert emb_meta["model"] == "fake"
+    assert emb_meta["span_ids"] and all("_L" in sid for sid in emb_meta["span_ids"])
+    assert len(vectorize._open_embeddings(p["embeddings"])) == len(emb_meta["span_ids"])
+
+
+def test_failed_upgrade_keeps_blocks_tier(data_dir, pdf_bytes, monkeypatch):
+    doc_id = store_pdf_bytes(pdf_bytes)
+    drain_ingest(iter_ingest_blocks(doc_id))
+    before = paths(doc_id)["spans"].read_bytes()
+
+    def boom(*a, **kw):
+        raise RuntimeError("layout crashed")
+
+    monkeypatch.setattr(tiered, "iter_ingest_layout", boom)
+    with pytest.raises(RuntimeError):
+        tiered.upgrade_to_layout(doc_id)
+    meta = orjson.loads(paths(doc_id)["doc"].read_bytes())
+    assert meta["upgrade"]["status"] == "failed"
+    assert "layout crashed" in meta["upgrade"]["error"]
+    assert paths(doc_id)["spans"].read_bytes() == before
+
+
+def test_stale_pending_upgrade_reported_interrupted(data_dir, pdf_bytes):
+    doc_id = store_pdf_bytes(pdf_bytes)
+    meta = drain_ingest(iter_ingest_blocks(doc_id))
+    meta.update(tier="blocks", upgrade={"engine": "pymupdf4llm", "status": "running"})
+    paths(doc_id)["doc"].write_bytes(orjson.dumps(meta))
+    assert tiered.wait_for_upgrade(doc_id)["upgrade"]["status"] == "interrupted"
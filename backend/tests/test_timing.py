@@ -0,0 +1,32 @@
+from metis.core.timing import StageTimer, aggregate_timings
+
+
+def test_stage_timer_accumulates_calls():
+    timer = StageTimer(trace_memory=True)
+    for _ in range(3):
+        with timer.stage("work"):
+            sum(range(10000))
+    with timer.stage("alloc"):
+        data = [bytes(1024) for _ in range(1000)]
+    report = timer.report()
+    assert report["work"]["calls"] == 3
+    assert report["work"]["cpu_s"] >= 0
+    assert report["alloc"]["py_peak_kb"] >= 900
+    assert report["total"]["wall_s"] >= report["work"]["wall_s"]
+    assert report["total"]["rss_peak_kb"] > 0
+    del data
+
+
+def test_aggregate_skips_docs_without_timings():
+    metas = [
+        {"n_pages": 4, "ingest": {"timings": {"extract": {"wall_s": 1.0, "cpu_s": 0.5, "rss_peak_kb": 10}, "total": {"wall_s": 2.0, "cpu_s": 1.0, "rss_peak_kb": 100}}}},
+        {"n_pages": 6, "ingest": {"timings": {"extract": {"wall_s": 3.0, "cpu_s": 2.5, "rss_peak_kb": 30}, "total": {"wall_s": 6.0, "cpu_s": 3.0, "rss_peak_kb": 90}}}},
+        {"n_pages": 100, "ingest": {}},
+    ]
+    stats = aggregate_timings(metas)
+    assert stats["n_docs"] == 2 and stats["n_pages"] == 10
+    extract = stats["stages"]["extract"]
+    assert extract["wall_s"] == 4.0
+    assert extract["ms_per_page"] == 400.0
+    assert extract["share"] == 0.5
+    assert extract["max_rss_peak_kb"] == 30
@@ -99,3 +99,94 @@ def test_rag_retrieve_uses_hybrid():
         _, fn = make_rag_retrieve_tool("sha256:abc123")
         fn(query="test", top_k=5)
         mock_hybrid.assert_called_once_with(doc_id="sha256:abc123", query="test", top_k=5)
+
+
+def test_rag_retrieve_attaches_neighbor_context():
+    mock_evidence = [
+        Evidence(span_id="s1", page=0, bbox_norm=(0.1, 0.2, 0.3, 0.4), text="hit", score=0.9),
+    ]
+    from metis.core.schema import Span
+    def _s(sid):
+        return Span(span_id=sid, doc_id="d", page=0, bbox_pdf=(0, 0, 1, 1), bbox_norm=(0, 0, 1, 1), text=sid, reading_order=0)
+    with patch("metis.core.tools.retrieve_hybrid", return_value=mock_evidence):
+        with patch("metis.core.tools.expand_neighbors", return_value=[[_s("s0"), _s("s1"), _s("s2")]]) as mock_expand:
+            _, fn = make_rag_retrieve_tool("sha256:abc123")
+            parsed = json.loads(fn(query="test", top_k=5, neighbors=1))
+    mock_expand.assert_called_once_with("sha256:abc123", ["s1"], 1, scope="document")
+    assert [c["span_id"] for c in parsed[0]["context"]] == ["s0", "s2"]
+
+
+def test_cached_tool_results_shared_across_registries(data_dir):
+    """Repeated calls in a later turn (a new registry) hit the cache until the index changes."""
+    from metis.core.store import paths
+    from metis.core.tools import cache_policy
+    from metis.core.toolcache import invalidate_tool_cache, tool_cache
+
+    tool_cache.clear()
+    doc_id = "sha256:abc123"
+    p = paths(doc_id)
+    for k in ("spans", "embeddings", "ro_links"):
+        p[k].write_bytes(b"v1")
+    calls = []
+    rag_def, _ = make_rag_retrieve_tool(doc_id)
+
+    def rag_retrieve(query, top_k=5, neighbors=0):
+        calls.append(query)
+        if query == "boom":
+            raise RuntimeError("index busy")
+        return json.dumps([{"span_id": "s1", "text": query, "top_k": top_k}])
+
+    def new_turn() -> ToolRegistry:
+        registry = ToolRegistry()
+        registry.register(rag_def.name, rag_def.description, rag_def.parameters, rag_retrieve, cache_policy(rag_def.name, doc_id))
+        return registry
+
+    first = new_turn()
+    result = first.call("rag_retrieve", {"query": "attention  heads"})
+    second = new_turn()
+    assert second.call("rag_retrieve", {"query": " attention heads", "top_k": 5}) == result
+    assert second.call("rag_retrieve", {"query": "attention heads", "top_k": 3}) != result
+    assert calls == ["attention  heads", "attention heads"]
+    assert second.cache_counts() == {"rag_retrieve": {"hits": 1, "misses": 1}}
+
+    # failures are not cached
+    assert "error" in json.loads(second.call("rag_retrieve", {"query": "boom"}))
+    assert "error" in json.loads(second.call("rag_retrieve", {"query": "boom"}))
+    assert calls.count("boom") == 2
+
+    # re-vectorizing replaces the embeddings: a new index version
+    p["embeddings"].unlink()
+    p["embeddings"].write_bytes(b"v2")
+    new_turn().call("rag_retrieve", {"query": "attention heads"})
+    assert calls[-1] == "attention heads" and len(calls) == 5
+
+    assert invalidate_tool_cache(doc_id) == 3
+    assert len(tool_cache) == 0
+
+
+def test_agent_done_reports_tool_cache_counts(data_dir):
+    from metis.core.agent import run_agent
+    from metis.core.llm import StreamEvent
+    from metis.core.schema import Message, ToolCall
+    from metis.core.tools import cache_policy
+    from metis.core.toolcache import CachePolicy, tool_cache
+
+    tool_cache.clear()
+
+    class ReadPageModel:
+        def stream(self, messages, tools, system):
+            if messages[-1].role == "tool":
+                yield StreamEvent(kind="message_done", message=Message(role="assistant", content="ok"))
+                return
+            call = ToolCall(id="tc_1", name="read_page", arguments={"page": 0})
+            yield StreamEvent(kind="message_done", message=Message(role="assistant", tool_calls=[call]))
+
+    registry = ToolRegistry()
+    registry.register("read_page", "", {}, lambda page: "# Title", CachePolicy("sha256:abc123", ("page_md",)))
+    events: list = []
+    for _ in range(2):
+        run_agent(model=ReadPageModel(), doc_id="sha256:abc123", user_query="q", tools=registry,
+                  system_prompt="s", on_stream=events.append)
+    done = [e.stats["tool_cache"] for e in events if e.kind == "agent_done"]
+    assert done == [{"read_page": {"hits": 0, "misses": 1}}, {"read_page": {"hits": 1, "misses": 0}}]
+    assert cache_policy("web_search", "sha256:abc123") is None
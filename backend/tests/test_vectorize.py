@@ -1,7 +1,7 @@
 import numpy as np
 import orjson
 from metis.core.schema import Span
-from metis.core.vectorize import _filter_embeddable, vectorize_spans, retrieve_semantic, _get_bm25_index, _bm25_retrieve, _rrf_fuse, _mmr_rerank, retrieve_hybrid
+from metis.core.vectorize import _filter_embeddable, vectorize_spans, retrieve_semantic, _get_bm25_index, _bm25_retrieve, _rrf_fuse, _mmr_rerank, retrieve_hybrid, _open_embeddings, _save_embeddings
 from metis.core.store import paths, write_spans_jsonl, write_json
 
 def _make_span(text="Hello world, this is a test span.", **kwargs):
@@ -111,6 +111,43 @@ def test_vectorize_filters_non_embeddable(tmp_path, monkeypatch):
     assert meta_data["span_ids"] == ["good"]
 
 
+def test_open_embeddings_is_readonly_memmap(tmp_path, monkeypatch):
+    spans = [_make_span(span_id=f"s{i}", text=f"This is test span number {i} with enough text.") for i in range(3)]
+    doc_id, p = _setup_doc(tmp_path, monkeypatch, spans)
+    vectorize_spans(doc_id)
+    emb = _open_embeddings(p["embeddings"])
+    assert isinstance(emb, np.memmap)
+    assert not emb.flags.writeable
+    assert emb.flags.c_contiguous
+    assert _open_embeddings(p["embeddings"]) is emb  # mapping is reused
+
+
+def test_open_embeddings_reopens_after_replace(tmp_path):
+    path = tmp_path / "x.embeddings.npy"
+    _save_embeddings(path, np.ones((2, 3), dtype=np.float64))
+    first = _open_embeddings(path)
+    assert first.dtype == np.float32
+    _save_embeddings(path, np.zeros((4, 3), dtype=np.float32))
+    second = _open_embeddings(path)
+    assert second.shape == (4, 3)
+    assert first.shape == (2, 3)  # old mapping stays valid after the swap
+
+
+def test_open_embeddings_cache_is_bounded(tmp_path, monkeypatch):
+    from metis.core import vectorize
+    monkeypatch.setattr(vectorize, "EMBED_CACHE_SIZE", 2)
+    monkeypatch.setattr(vectorize, "_emb_cache", type(vectorize._emb_cache)())
+    files = [tmp_path / f"d{i}.embeddings.npy" for i in range(3)]
+    for f in files:
+        _save_embeddings(f, np.ones((1, 2)))
+    first = _open_embeddings(files[0])
+    _open_embeddings(files[1])
+    assert _open_embeddings(files[0]) is first  # recently used: kept
+    _open_embeddings(files[2])
+    assert list(vectorize._emb_cache) == [str(files[0]), str(files[2])]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
 def test_retrieve_semantic_returns_evidence(tmp_path, monkeypatch):
     spans = [
         _make_span(span_id="s0", text="The transformer architecture uses self-attention mechanisms."),
@@ -276,3 +313,16 @@ def test_retrieve_hybrid_page_filter(tmp_path, monkeypatch):
     vectorize_spans(doc_id)
     results = retrieve_hybrid(doc_id, "attention", page=1)
     assert all(r.page == 1 for r in results)
+
+
+def test_retrieve_hybrid_neighbor_window_adds_context(tmp_path, monkeypatch):
+    spans = [
+        _make_span(span_id="s0", reading_order=0, text="Background on sequence models and their training."),
+        _make_span(span_id="s1", reading_order=1, text="The transformer architecture uses self-attention mechanisms."),
+        _make_span(span_id="s2", reading_order=2, text="Stochastic gradient descent optimizes the loss function."),
+    ]
+    doc_id, p = _setup_doc(tmp_path, monkeypatch, spans)
+    vectorize_spans(doc_id)
+    results = retrieve_hybrid(doc_id, "transformer self-attention", top_k=1, neighbor_window=1)
+    assert [r.span_id for r in results] == ["s0", "s1", "s2"]
+    assert len({r.score for r in results}) == 1  # neighbors inherit the hit score
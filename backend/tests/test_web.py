@@ -1,6 +1,8 @@
 """Integration tests for all FastAPI routes in metis.adapters.web."""
 from __future__ import annotations
 
+import json
+
 from fastapi.testclient import TestClient
 
 
@@ -16,7 +18,19 @@ class TestIngest:
     def test_ingest_response_schema(self, client: TestClient, pdf_bytes: bytes):
         resp = client.post("/ingest", files={"file": ("test.pdf", pdf_bytes, "application/pdf")})
         data = resp.json()
-        assert {"doc_id", "n_pages", "n_spans", "ingest"} == set(data.keys())
+        assert {"doc_id", "n_pages", "n_spans", "ingest", "tier", "lineage"} == set(data.keys())
+        assert data["tier"] is None and data["lineage"] is None
+
+    def test_ingest_with_parent_returns_lineage(self, client: TestClient, pdf_bytes: bytes):
+        import pymupdf
+        parent = client.post("/ingest?engine=blocks", files={"file": ("v1.pdf", pdf_bytes, "application/pdf")}).json()
+        doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+        doc.new_page().insert_text((50, 100), "An appended page with a sentence long enough to keep.", fontsize=11)
+        resp = client.post(
+            f"/ingest?engine=blocks&parent={parent['doc_id']}",
+            files={"file": ("v2.pdf", doc.tobytes(), "application/pdf")},
+        )
+        assert resp.json()["lineage"] == {"parent": parent["doc_id"], "reused_pages": {"0": 0}}
 
     def test_ingest_doc_id_is_sha256_prefixed(self, client: TestClient, pdf_bytes: bytes):
         resp = client.post("/ingest", files={"file": ("test.pdf", pdf_bytes, "application/pdf")})
@@ -34,6 +48,41 @@ class TestIngest:
         resp = client.post("/ingest", files={"file": ("test.pdf", pdf_bytes, "application/pdf")})
         assert resp.json()["ingest"]["engine"] == "pymupdf4llm"
 
+    def test_ingest_stream_reports_pages_then_done(self, client: TestClient, pdf_bytes: bytes):
+        resp = client.post(
+            "/ingest?engine=blocks&stream=true",
+            files={"file": ("test.pdf", pdf_bytes, "application/pdf")},
+        )
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = []
+        for block in resp.text.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.splitlines())
+            events.append((fields["event"], json.loads(fields["data"])))
+        assert [name for name, _ in events] == ["page", "done"]
+        page = events[0][1]
+        assert page["pages_done"] == 1 and page["n_pages"] == 1
+        assert page["kinds"] == {"text": page["n_spans"]}
+        assert events[1][1]["n_spans"] == page["n_spans"]
+
+    def test_ingest_tiered_returns_blocks_then_announces_upgrade(self, client: TestClient, pdf_bytes: bytes):
+        resp = client.post("/ingest?tiered=true", files={"file": ("test.pdf", pdf_bytes, "application/pdf")})
+        assert resp.status_code == 200
+        assert resp.json()["ingest"]["engine"] == "pymupdf"
+        assert resp.json()["tier"] == "blocks"
+        doc_id = resp.json()["doc_id"]
+
+        events = client.get(f"/documents/{doc_id}/events")
+        assert events.status_code == 200
+        fields = dict(line.split(": ", 1) for line in events.text.strip().split("\n\n")[0].splitlines())
+        assert fields["event"] == "tier"
+        data = json.loads(fields["data"])
+        assert data["tier"] == "layout" and data["upgrade"]["status"] == "done"
+        assert client.get(f"/documents/{doc_id}").json()["ingest"]["engine"] == "pymupdf4llm"
+
+    def test_document_events_404_for_missing_doc(self, client: TestClient):
+        assert client.get("/documents/sha256:doesnotexist/events").status_code == 404
+
     def test_ingest_layout_engine(self, client: TestClient, pdf_bytes: bytes):
         resp = client.post(
             "/ingest?engine=layout",
@@ -113,6 +162,48 @@ class TestRetrieve:
         assert resp.json() == []
 
 
+# ---------------------------------------------------------------------------
+# POST /retrieve-batch
+# ---------------------------------------------------------------------------
+
+class TestRetrieveBatch:
+    def test_retrieve_batch_returns_list_per_query(self, client: TestClient, ingested_doc: str):
+        resp = client.post(
+            "/retrieve-batch",
+            json={"doc_id": ingested_doc, "page": 0, "selected_texts": ["attention mechanism", "gradient descent"]},
+        )
+        assert resp.status_code == 200
+        batches = resp.json()
+        assert len(batches) == 2
+        assert any("attention" in e["text"].lower() for e in batches[0])
+        assert any("gradient" in e["text"].lower() for e in batches[1])
+
+    def test_retrieve_batch_404_for_missing_doc(self, client: TestClient):
+        resp = client.post(
+            "/retrieve-batch",
+            json={"doc_id": "sha256:doesnotexist", "page": 0, "selected_texts": ["hello"]},
+        )
+        assert resp.status_code == 404
+
+
+class TestLocate:
+    def test_locate_finds_text_without_page(self, client: TestClient, ingested_doc: str):
+        resp = client.post("/locate", json={"doc_id": ingested_doc, "text": "gradient descent optimizes the loss"})
+        assert resp.status_code == 200
+        items = resp.json()
+        assert items and "Gradient descent" in items[0]["text"]
+        assert items[0]["page"] == 0
+
+    def test_retrieve_without_page(self, client: TestClient, ingested_doc: str):
+        resp = client.post("/retrieve", json={"doc_id": ingested_doc, "selected_text": "self-attention for sequence"})
+        assert resp.status_code == 200
+        assert any("self-attention" in e["text"] for e in resp.json())
+
+    def test_locate_404_for_missing_doc(self, client: TestClient):
+        resp = client.post("/locate", json={"doc_id": "sha256:doesnotexist", "text": "hello"})
+        assert resp.status_code == 404
+
+
 # ---------------------------------------------------------------------------
 # POST /vectorize
 # ---------------------------------------------------------------------------
@@ -290,6 +381,99 @@ class TestGetDocumentPdf:
         assert resp.status_code == 404
 
 
+# ---------------------------------------------------------------------------
+# GET /documents/{doc_id}/hit-test, POST /documents/{doc_id}/region
+# ---------------------------------------------------------------------------
+
+class TestSpatialQueries:
+    def test_ingest_writes_spatial_index(self, client: TestClient, ingested_doc: str):
+        from metis.core.store import paths
+        assert paths(ingested_doc)["spatial"].exists()
+
+    def test_region_returns_overlapping_spans(self, client: TestClient, ingested_doc: str):
+        resp = client.post(
+            f"/documents/{ingested_doc}/region",
+            json={"page": 0, "bbox_norm": [0.0, 0.0, 1.0, 1.0]},
+        )
+        assert resp.status_code == 200
+        items = resp.json()
+        assert len(items) > 0
+        assert all(0 < i["overlap"] <= 1.0 for i in items)
+
+    def test_hit_test_on_span_center(self, client: TestClient, ingested_doc: str):
+        region = client.post(
+            f"/documents/{ingested_doc}/region",
+            json={"page": 0, "bbox_norm": [0.0, 0.0, 1.0, 1.0]},
+        ).json()
+        x0, y0, x1, y1 = region[0]["bbox_norm"]
+        resp = client.get(
+            f"/documents/{ingested_doc}/hit-test",
+            params={"page": 0, "x": (x0 + x1) / 2, "y": (y0 + y1) / 2},
+        )
+        assert resp.status_code == 200
+        assert region[0]["span_id"] in [h["span_id"] for h in resp.json()]
+
+    def test_hit_test_words(self, client: TestClient, ingested_doc: str):
+        words = client.post(
+            f"/documents/{ingested_doc}/region?level=word",
+            json={"page": 0, "bbox_norm": [0.0, 0.0, 1.0, 1.0]},
+        ).json()
+        assert any(w["text"] == "attention" for w in words)
+
+    def test_stale_spatial_index_is_rebuilt(self, client: TestClient, ingested_doc: str):
+        import orjson
+        import pymupdf
+        from metis.core.spatial import build_doc_index_from_pdf, write_doc_index
+        from metis.core.store import paths, read_spans_jsonl
+        p = paths(ingested_doc)
+        spans = read_spans_jsonl(p["spans"])
+        with pymupdf.open(p["pdf"]) as doc:
+            write_doc_index(p["spatial"], build_doc_index_from_pdf(doc, spans[:1], {}))   # left by an older ingest
+        region = {"page": 0, "bbox_norm": [0.0, 0.0, 1.0, 1.0]}
+        items = client.post(f"/documents/{ingested_doc}/region", json=region).json()
+        assert sorted(i["span_id"] for i in items) == sorted(s.span_id for s in spans)
+
+        # while an ingest is running, the rebuilt index is served but not saved
+        meta = orjson.loads(p["doc"].read_bytes())
+        del meta["ingest"]["complete"]
+        p["doc"].write_bytes(orjson.dumps(meta))
+        p["spatial"].unlink()
+        assert len(client.post(f"/documents/{ingested_doc}/region", json=region).json()) == len(spans)
+        assert not p["spatial"].exists()
+
+    def test_hit_test_404_for_missing_doc(self, client: TestClient):
+        resp = client.get("/documents/sha256:doesnotexist/hit-test", params={"page": 0, "x": 0.5, "y": 0.5})
+        assert resp.status_code == 404
+
+
+# ---------------------------------------------------------------------------
+# POST /chat
+# ---------------------------------------------------------------------------
+
+class TestChat:
+    def test_chat_streams_agent_events(self, client: TestClient, ingested_doc: str, monkeypatch):
+        from metis.core.llm import StreamEvent
+        from metis.core.schema import Message
+        from metis.core.tools import ToolRegistry
+
+        class AsyncModel:
+            async def astream(self, messages, tools, system):
+                yield StreamEvent(kind="text_delta", text="Hi")
+                yield StreamEvent(kind="message_done", message=Message(role="assistant", content="Hi"))
+
+        monkeypatch.setattr("metis.adapters.web._prepare_chat", lambda req: (AsyncModel(), ToolRegistry(), req.message))
+        resp = client.post("/chat", json={"doc_id": ingested_doc, "message": "Hello"})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = [dict(line.split(": ", 1) for line in block.splitlines()) for block in resp.text.strip().split("\n\n")]
+        assert [e["event"] for e in events] == ["text_delta", "message_done", "agent_done"]
+        assert json.loads(events[1]["data"])["content"] == "Hi"
+
+    def test_chat_unknown_document_is_404(self, client: TestClient):
+        resp = client.post("/chat", json={"doc_id": "sha256:missing", "message": "Hello"})
+        assert resp.status_code == 404
+
+
 # ---------------------------------------------------------------------------
 # BBoxSelection / ChatRequest unit tests
 # ---------------------------------------------------------------------------
@@ -8,6 +8,7 @@ fn main() {
 
     let types: Vec<(&str, schemars::schema::RootSchema)> = vec![
         ("IngestResponse", schema_for!(metis_types::IngestResponse)),
+        ("IngestLineage", schema_for!(metis_types::IngestLineage)),
         (
             "VectorizeResponse",
             schema_for!(metis_types::VectorizeResponse),
@@ -1,5 +1,6 @@
 use schemars::JsonSchema;
 use serde::{Deserialize, Serialize};
+use std::collections::BTreeMap;
 
 #[derive(Debug, Clone, Serialize, Deserialize, JsonSchema)]
 pub struct IngestResponse {
@@ -7,6 +8,14 @@ pub struct IngestResponse {
     pub n_pages: u32,
     pub n_spans: u32,
     pub ingest: serde_json::Value,
+    pub tier: Option<String>,
+    pub lineage: Option<IngestLineage>,
+}
+
+#[derive(Debug, Clone, Serialize, Deserialize, JsonSchema)]
+pub struct IngestLineage {
+    pub parent: String,
+    pub reused_pages: BTreeMap<String, u32>,
 }
 
 #[derive(Debug, Clone, Serialize, Deserialize, JsonSchema)]
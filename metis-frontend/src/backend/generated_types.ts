@@ -12,11 +12,21 @@ export interface BboxSelection {
 }
 
 
+export interface IngestLineage {
+  parent: string;
+  reused_pages: {
+    [k: string]: number;
+  };
+}
+
+
 export interface IngestResponse {
   doc_id: string;
   ingest: unknown;
+  lineage?: IngestLineage | null;
   n_pages: number;
   n_spans: number;
+  tier?: string | null;
 }
 
 
@@ -23,8 +23,8 @@ cd "$ROOT/metis-frontend"
  */
 
 HEADER
-  # Process schemas in dependency order (BboxSelection before ChatRequest)
-  for schema in BboxSelection IngestResponse VectorizeResponse EvidenceItem ConversationMeta ConversationMessage ConversationFull ChatRequest ChatStreamEvent; do
+  # Process schemas in dependency order (BboxSelection before ChatRequest, IngestLineage before IngestResponse)
+  for schema in BboxSelection IngestLineage IngestResponse VectorizeResponse EvidenceItem ConversationMeta ConversationMessage ConversationFull ChatRequest ChatStreamEvent; do
     bun run json2ts \
       -i "$SCHEMA_DIR/${schema}.json" \
       --no-additionalProperties \